@@ -0,0 +1,138 @@
+"""Compare l'extraction des pages produits PrestaShop : sélecteurs CSS
+évalués un par un et corps re-parsé par BeautifulSoup, contre le plan
+d'extraction compilé évalué sur l'arbre de la réponse.
+
+Usage:
+    python -m benchmarks.prestashop_parse [page.html ...]
+
+Les fichiers sont des pages produits PrestaShop 1.6 ou 1.7 enregistrées ;
+sans argument, une page synthétique de chaque version est utilisée.
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.shrink_html import beautifulsoup
+from scraper.lib.prestashop import PrestaShopScraper
+from scraper.lib.structured_data import breadcrumb_names, find_type, ld_json_objects
+from scraper.lib.utils import b64
+
+
+def description(size=60):
+    return "".join(
+        f'<p class="desc">Notes de fruits rouges {i}.</p>'
+        '<svg width="10"><path d="M0 0h10v10H0z"/></svg>'
+        for i in range(size)
+    )
+
+
+def synthetic_17():
+    data = {
+        "name": "Ethiopie Guji",
+        "link": "https://shop.fr/cafes/12-ethiopie-guji.html",
+        "category_name": "Cafés",
+        "attributes": {"1": {"name": "250g"}, "2": {"name": "Grains"}},
+    }
+    return f"""<html><head><style>body{{}}</style></head><body>
+    <nav>{"<a href='/3-cafes'>Cafés</a>" * 40}</nav>
+    <div id="product-details" data-product='{json.dumps(data)}'></div>
+    <input id="product_page_product_id" value="12">
+    <div class="product-cover"><img src="/guji.jpg"></div>
+    {description()}
+    </body></html>"""
+
+
+def synthetic_16():
+    ld_json = [
+        {"@type": "Product", "name": "Ethiopie Guji"},
+        {
+            "@type": "BreadcrumbList",
+            "itemListElement": [{"name": "Accueil"}, {"name": "Cafés"}],
+        },
+    ]
+    return f"""<html><head>
+    <script type="application/ld+json">{json.dumps(ld_json)}</script>
+    </head><body>
+    <nav>{"<a href='/3-cafes'>Cafés</a>" * 40}</nav>
+    <input id="product_page_product_id" value="12">
+    <h1 class="product_name">Ethiopie Guji</h1>
+    <div class="product-cover"><img src="/guji.jpg"></div>
+    <div class="product-variants"><span class="control-label">Mouture</span></div>
+    {description()}
+    </body></html>"""
+
+
+def css_per_field(response):
+    """Extraction d'origine, conservée comme référence"""
+    if response.css("#product-details::attr(data-product)").get():
+        data = json.loads(response.css("#product-details::attr(data-product)").get())
+        return {
+            "id": response.css("#product_page_product_id::attr(value)").get(),
+            "image_url": response.css(".product-cover img::attr(src)").get()
+            or response.css(".product-covers img::attr(src)").get(),
+            "title": data.get("name"),
+            "content": b64(beautifulsoup(response.css("body").get())),
+        }
+    objects = ld_json_objects(
+        response.css('script[type="application/ld+json"]::text').getall()
+    )
+    if find_type(objects, ("Product",)):
+        return {
+            "id": response.css("#product_page_product_id::attr(value)").get(),
+            "image_url": response.css(".product-cover img::attr(src)").get(),
+            "title": response.css(".product_name::text").get(),
+            "categories": breadcrumb_names(find_type(objects, ("BreadcrumbList",))),
+            "content": b64(beautifulsoup(response.css("body").get())),
+            "variants": response.css(".product-variants .control-label::text").getall(),
+        }
+
+
+def compiled_plan(response):
+    item = next(PrestaShopScraper(None).parse_product(response))
+    return {**item, "content": item["content"].resolve()}
+
+
+def measure(extract, pages, rounds):
+    """Pages/s, puis pic mémoire et blocs restés alloués par page (tracemalloc)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in pages:
+            extract(HtmlResponse(url="https://shop.fr/", body=body))
+    pages_per_sec = rounds * len(pages) / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for body in pages:
+        extract(HtmlResponse(url="https://shop.fr/", body=body))
+    _, peak = tracemalloc.get_traced_memory()
+    blocks = sum(
+        max(0, stat.count_diff)
+        for stat in tracemalloc.take_snapshot().compare_to(before, "filename")
+    )
+    tracemalloc.stop()
+    return pages_per_sec, peak / len(pages), blocks / len(pages)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_16().encode("utf-8"), synthetic_17().encode("utf-8")]
+    rounds = max(1, 400 // len(pages))
+
+    for label, extract in (
+        ("response.css + BeautifulSoup", css_per_field),
+        ("plan compilé + arbre lxml   ", compiled_plan),
+    ):
+        pages_per_sec, peak, blocks = measure(extract, pages, rounds)
+        print(
+            f"{label} : {pages_per_sec:,.0f} pages/s, "
+            f"pic {peak / 1024:,.0f} Kio/page, {blocks:,.0f} blocs retenus/page"
+        )
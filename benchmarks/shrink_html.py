@@ -0,0 +1,83 @@
+"""Compare shrink_html : arbre BeautifulSoup complet contre sérialisation
+au fil du parsing lxml (ShrinkTarget).
+
+Usage:
+    python -m benchmarks.shrink_html [page.html ...]
+
+Les fichiers sont des pages produits enregistrées ; sans argument, une
+page synthétique chargée en style et svg inline est utilisée. Le script
+vérifie aussi que les deux sorties sont identiques.
+"""
+
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from scraper.lib.utils import shrink_html
+
+
+def beautifulsoup(html):
+    if not html:
+        return ""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup.find_all(["style", "svg"]):
+        tag.extract()
+    return str(soup)
+
+
+def synthetic_page(size=200):
+    icon = '<svg viewBox="0 0 24 24"><path d="M12 2L2 7l10 5 10-5z"/></svg>'
+    rows = "".join(
+        f'<li class="product-item  col"><a href="/p/{i}?a=1&b=2">{icon}'
+        f"Café n°{i} &amp; notes</a><br><img src='/{i}.jpg' alt=\"x\"></li>"
+        for i in range(size)
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<style>{'.a{color:red}' * 200}</style></head>"
+        f"<body><!-- menu --><ul>{rows}</ul><script>var a = 1 < 2;</script>"
+        "</body></html>"
+    )
+
+
+def measure(shrink, pages, rounds):
+    """Pages/s, Mo/s en entrée et pic mémoire par page (tracemalloc)"""
+    size = sum(len(p) for p in pages)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            shrink(page)
+    elapsed = time.perf_counter() - start
+
+    peak = 0
+    for page in pages:
+        tracemalloc.start()
+        shrink(page)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return rounds * len(pages) / elapsed, rounds * size / elapsed / 1e6, peak
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page()]
+    rounds = max(1, 200 // len(pages))
+
+    identical = sum(beautifulsoup(p) == shrink_html(p) for p in pages)
+    print(f"sorties identiques : {identical}/{len(pages)}")
+    for label, shrink in (
+        ("BeautifulSoup     ", beautifulsoup),
+        ("lxml ShrinkTarget ", shrink_html),
+    ):
+        pages_per_sec, mb_per_sec, peak = measure(shrink, pages, rounds)
+        print(
+            f"{label} : {pages_per_sec:,.0f} pages/s, {mb_per_sec:,.1f} Mo/s, "
+            f"pic {peak / 1024:,.0f} Kio"
+        )
@@ -0,0 +1,84 @@
+"""Temps de démarrage : import de chaque module d'entrée (scraper et
+handlers Lambda) et création des ressources paresseuses.
+
+Usage:
+    python -m benchmarks.startup [module ...] [--warm]
+
+Chaque module est importé dans un interpréteur neuf avec
+`-X importtime` ; le script affiche le temps total et les modules les plus
+coûteux. Avec --warm, les ressources `Lazy` du module sont ensuite créées
+et chronométrées (STARTUP_PROFILE=1). Les modules dont une dépendance
+manque (boto3 hors Lambda, par exemple) sont signalés et ignorés.
+"""
+
+import os
+import subprocess
+import sys
+
+MODULES = [
+    "scraper.pipelines",
+    "scraper.spiders.products",
+    "lambda.functions.crawler",
+    "lambda.functions.exporter",
+    "lambda.functions.llm",
+]
+
+WARM = """
+import importlib
+from scraper.lib.lazy import Lazy, warm
+resources = []
+for value in vars(importlib.import_module({module!r})).values():
+    if isinstance(value, Lazy):
+        resources.append(value)
+    elif isinstance(value, type):
+        resources += [v for v in vars(value).values() if isinstance(v, Lazy)]
+warm(*resources)
+"""
+
+
+def import_times(module):
+    """(temps cumulé en ms par module importé, erreur éventuelle)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"__import__({module!r})"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return times, error
+
+
+def warm_times(module):
+    result = subprocess.run(
+        [sys.executable, "-c", WARM.format(module=module)],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "STARTUP_PROFILE": "1"},
+        check=False,
+    )
+    return [line for line in result.stderr.splitlines() if "startup:" in line]
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    for module in args or MODULES:
+        times, error = import_times(module)
+        if error:
+            print(f"{module} : ignoré ({error})")
+            continue
+        top = sorted(
+            ((ms, name) for name, ms in times.items() if "." not in name),
+            reverse=True,
+        )[:5]
+        print(f"{module} : {times.get(module, 0):,.0f} ms à l'import")
+        for ms, name in top:
+            print(f"    {name:<24} {ms:,.0f} ms")
+        if "--warm" in sys.argv:
+            for line in warm_times(module):
+                print(f"    {line.split('startup: ')[1]}")
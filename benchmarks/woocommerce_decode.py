@@ -0,0 +1,164 @@
+"""Compare le décodage des pages /wp/v2/product : json.loads puis
+`Product.from_json` enregistrement par enregistrement avec le modèle complet
+(dont tous les `_links`), contre validation de la page entière depuis les
+octets de la réponse avec les modèles réduits.
+
+Usage:
+    python -m benchmarks.woocommerce_decode [page.json ...]
+
+Les fichiers sont des réponses enregistrées de /wp-json/wp/v2/product ;
+sans argument, une page synthétique de 100 produits est utilisée.
+"""
+
+import json
+import sys
+import time
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from scraper.lib.woocommerce_model import Guid, Link, RenderedText, product_page
+
+
+# Copie des modèles complets décodés avant le passage aux pages entières,
+# conservée comme référence du benchmark
+class Links(BaseModel):
+    self_: List[Link] = Field(..., alias="self")
+    collection: List[Link]
+    about: List[Link]
+    curies: List[Link]
+    # champs optionnels selon le type
+    wp_post_type: Optional[List[Link]] = Field(None, alias="wp:post_type")
+    up: Optional[List[Link]] = None
+    replies: Optional[List[Link]] = None
+    wp_featuredmedia: Optional[List[Link]] = Field(None, alias="wp:featuredmedia")
+    wp_attachment: Optional[List[Link]] = Field(None, alias="wp:attachment")
+    wp_term: Optional[List[Link]] = Field(None, alias="wp:term")
+
+
+class Product(BaseModel):
+    id: int
+    date: str
+    date_gmt: str
+    guid: Guid
+    modified: str
+    modified_gmt: str
+    slug: str
+    status: str
+    type: str
+    link: str
+    title: RenderedText
+    content: RenderedText
+    excerpt: RenderedText
+    featured_media: Optional[int] = None
+    product_brand: List[Any] = []
+    product_cat: List[int] = []
+    product_tag: List[int] = []
+    links: Links = Field(..., alias="_links")
+
+    model_config = ConfigDict(validate_by_name=True, populate_by_name=True)
+
+    @staticmethod
+    def from_json(data: str | dict) -> "Product":
+        if isinstance(data, str):
+            data = json.loads(data)
+        return Product(**data)
+
+
+def link(href, **extra):
+    return {"href": href, **extra}
+
+
+def synthetic_page(size=100):
+    host = "https://example-roaster.fr"
+    records = []
+    for i in range(size):
+        records.append(
+            {
+                "id": i,
+                "date": "2025-08-01T10:00:00",
+                "date_gmt": "2025-08-01T08:00:00",
+                "guid": {"rendered": f"{host}/?post_type=product&#038;p={i}"},
+                "modified": "2025-08-01T10:00:00",
+                "modified_gmt": "2025-08-01T08:00:00",
+                "slug": f"cafe-{i}",
+                "status": "publish",
+                "type": "product",
+                "link": f"{host}/produit/cafe-{i}/",
+                "title": {"rendered": f"Café {i}"},
+                "content": {"rendered": "<p>" + "Notes de fruits rouges. " * 40},
+                "excerpt": {"rendered": "<p>Notes de fruits rouges.</p>"},
+                "featured_media": 1000 + i,
+                "product_brand": [],
+                "product_cat": [1, 2],
+                "product_tag": [3],
+                "_links": {
+                    "self": [
+                        link(
+                            f"{host}/wp-json/wp/v2/product/{i}",
+                            targetHints={"allow": ["GET"]},
+                        )
+                    ],
+                    "collection": [link(f"{host}/wp-json/wp/v2/product")],
+                    "about": [link(f"{host}/wp-json/wp/v2/types/product")],
+                    "wp:featuredmedia": [
+                        link(f"{host}/wp-json/wp/v2/media/{1000 + i}", embeddable=True)
+                    ],
+                    "wp:attachment": [link(f"{host}/wp-json/wp/v2/media?parent={i}")],
+                    "wp:term": [
+                        link(
+                            f"{host}/wp-json/wp/v2/product_cat?post={i}",
+                            taxonomy="product_cat",
+                            embeddable=True,
+                        ),
+                        link(
+                            f"{host}/wp-json/wp/v2/product_tag?post={i}",
+                            taxonomy="product_tag",
+                            embeddable=True,
+                        ),
+                    ],
+                    "curies": [
+                        link(
+                            "https://api.w.org/{rel}",
+                            name="wp",
+                            templated=True,
+                        )
+                    ],
+                },
+            }
+        )
+    return json.dumps(records).encode("utf-8")
+
+
+def per_record(body):
+    return [Product.from_json(x) for x in json.loads(body)]
+
+
+def whole_page(body):
+    return product_page.validate_json(body)
+
+
+def measure(decode, pages, rounds):
+    records = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in pages:
+            records += len(decode(body))
+    return records / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page()]
+    rounds = max(1, 2000 // sum(len(json.loads(p)) for p in pages))
+
+    baseline = measure(per_record, pages, rounds)
+    fast = measure(whole_page, pages, rounds)
+    print(f"Product.from_json             : {baseline:,.0f} records/s")
+    print(f"product_page.validate_json    : {fast:,.0f} records/s")
+    print(f"Gain : x{fast / baseline:.1f}")
@@ -0,0 +1,582 @@
+"""Inférence du classificateur de produits sans spaCy.
+
+Le modèle entraîné (textcat spacy.TextCatBOW.v3, unigrammes) n'est qu'un
+sac de mots haché : chaque token est réduit à son ORTH (MurmurHash64A du
+texte), haché deux fois dans une table de `length` lignes, et les lignes
+touchées sont sommées avant le softmax. Ce module exporte ces poids (seules
+les lignes non nulles) et reproduit la tokenisation et le hachage de spaCy
+avec NumPy et `re`, pour charger le modèle en quelques millisecondes.
+
+Usage:
+    python -m classifier.bow [model_dir]
+
+écrit <model_dir>/bow, que ProductClassifier utilise en priorité.
+"""
+
+import _sre
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+
+M64 = 0xC6A4A7935BD1E995
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# regex du tokenizer spaCy et méthode appelée sur chacune
+REGEXES = {
+    "prefix_search": "search",
+    "suffix_search": "search",
+    "infix_finditer": "finditer",
+    "token_match": "match",
+    "url_match": "match",
+}
+
+
+def murmurhash64a(data, seed=1):
+    """MurmurHash64A, le hash64 utilisé par le StringStore de spaCy"""
+    h = (seed ^ (len(data) * M64)) & MASK64
+    blocks = len(data) // 8
+    for i in range(blocks):
+        k = int.from_bytes(data[i * 8 : i * 8 + 8], "little")
+        k = (k * M64) & MASK64
+        k ^= k >> 47
+        k = (k * M64) & MASK64
+        h ^= k
+        h = (h * M64) & MASK64
+    tail = data[blocks * 8 :]
+    if tail:
+        h ^= int.from_bytes(tail, "little")
+        h = (h * M64) & MASK64
+    h ^= h >> 47
+    h = (h * M64) & MASK64
+    h ^= h >> 47
+    return h
+
+
+def murmurhash3_32(keys, seed):
+    """MurmurHash3_x86_32 d'un tableau de clés uint64, comme le calcule
+    SparseLinear de thinc pour choisir les lignes de poids"""
+    c1, c2 = np.uint32(0xCC9E2D51), np.uint32(0x1B873593)
+    h = np.full(keys.shape, seed, dtype=np.uint32)
+    for k in ((keys & 0xFFFFFFFF).astype(np.uint32), (keys >> 32).astype(np.uint32)):
+        k = k * c1
+        k = (k << 15) | (k >> 17)
+        k = k * c2
+        h ^= k
+        h = (h << 13) | (h >> 19)
+        h = h * np.uint32(5) + np.uint32(0xE6546B64)
+    h ^= np.uint32(8)
+    h ^= h >> 16
+    h = h * np.uint32(0x85EBCA6B)
+    h ^= h >> 13
+    h = h * np.uint32(0xC2B2AE35)
+    h ^= h >> 16
+    return h
+
+
+def program_checksum(code):
+    """Empreinte d'un programme sre exporté"""
+    return hashlib.sha256(np.asarray(code, dtype="<u4").tobytes()).hexdigest()
+
+
+def compile_regex(spec, programs):
+    """Recrée une regex exportée.
+
+    La regex token_match du français met plusieurs secondes à compiler :
+    l'export conserve le programme sre déjà compilé, rechargé directement
+    quand la version de Python, le MAGIC de _sre et l'empreinte du programme
+    correspondent, recompilé depuis le motif sinon.
+
+    Ce raccourci repose sur des API internes de CPython (re._parser,
+    re._compiler._code et _sre.compile), sans garantie de stabilité d'une
+    version à l'autre : tout échec de _sre.compile se replie aussi sur
+    re.compile.
+    """
+    if spec is None:
+        return None
+    program = spec.get("program")
+    code = programs.get(spec["name"])
+    pattern = None
+    if (
+        program is not None
+        and code is not None
+        and program["python"] == list(sys.version_info[:2])
+        and program["magic"] == _sre.MAGIC
+        and program.get("sha256") == program_checksum(code)
+    ):
+        try:
+            pattern = _sre.compile(
+                spec["pattern"],
+                program["flags"],
+                code.tolist(),
+                program["groups"] - 1,
+                program["groupindex"],
+                tuple(program["indexgroup"]),
+            )
+        except (RuntimeError, TypeError, ValueError):
+            pattern = None
+    if pattern is None:
+        pattern = re.compile(spec["pattern"], spec["flags"])
+    return getattr(pattern, REGEXES[spec["name"]])
+
+
+def export_regex(name, method):
+    """Description d'une regex du tokenizer et son programme compilé, None
+    si les API internes de `re` ne sont pas disponibles"""
+    pattern = getattr(method, "__self__", None)
+    if not isinstance(pattern, re.Pattern) or method.__name__ != REGEXES[name]:
+        raise ValueError(f"{name}: seules les regex compilées sont exportables")
+    spec = {"name": name, "pattern": pattern.pattern, "flags": pattern.flags}
+    try:
+        parsed = re._parser.parse(pattern.pattern, pattern.flags)
+        code = np.array(re._compiler._code(parsed, pattern.flags), dtype=np.uint32)
+    except AttributeError:
+        return spec, None
+    indexgroup = [None] * parsed.state.groups
+    for key, i in parsed.state.groupdict.items():
+        indexgroup[i] = key
+    spec["program"] = {
+        "python": list(sys.version_info[:2]),
+        "magic": _sre.MAGIC,
+        "sha256": program_checksum(code),
+        "flags": pattern.flags | parsed.state.flags,
+        "groups": parsed.state.groups,
+        "groupindex": dict(parsed.state.groupdict),
+        "indexgroup": indexgroup,
+    }
+    return spec, code
+
+
+class Tokenizer:
+    """Tokenizer spaCy (tokenizer.pyx) réduit au texte des tokens : découpe
+    sur les espaces, préfixes et suffixes, token_match et url_match, infixes,
+    exceptions, puis passe des exceptions qui couvrent plusieurs tokens."""
+
+    max_cache_size = 10000
+
+    def __init__(
+        self,
+        rules,
+        prefix_search=None,
+        suffix_search=None,
+        infix_finditer=None,
+        token_match=None,
+        url_match=None,
+        special_patterns=None,
+    ):
+        self.rules = rules
+        self.prefix_search = prefix_search
+        self.suffix_search = suffix_search
+        self.infix_finditer = infix_finditer
+        self.token_match = token_match
+        self.url_match = url_match
+        # motifs (textes des tokens) des exceptions qui ne correspondent pas
+        # à un bloc entier, indexés par leur premier token
+        self.special_patterns = {}
+        for pattern in special_patterns or []:
+            self.special_patterns.setdefault(pattern[0], []).append(tuple(pattern))
+        self.cache = {}
+
+    def find_prefix(self, string):
+        if self.prefix_search is None:
+            return 0
+        match = self.prefix_search(string)
+        return (match.end() - match.start()) if match is not None else 0
+
+    def find_suffix(self, string):
+        if self.suffix_search is None:
+            return 0
+        match = self.suffix_search(string)
+        return (match.end() - match.start()) if match is not None else 0
+
+    def find_infix(self, string):
+        if self.infix_finditer is None:
+            return []
+        return list(self.infix_finditer(string))
+
+    def needs_matcher(self, string):
+        """Exceptions vérifiées après coup sur la suite des tokens
+        (faster_heuristics)"""
+        return bool(
+            self.find_prefix(string)
+            or self.find_infix(string)
+            or self.find_suffix(string)
+            or " " in string
+        )
+
+    def __call__(self, string):
+        """Liste des (texte, suivi d'un espace) de chaque token"""
+        tokens = self.tokenize_affixes(string, True)
+        if self.special_patterns:
+            tokens = self.apply_special_cases(tokens)
+        return tokens
+
+    def tokenize_affixes(self, string, with_special_cases):
+        tokens = []
+        if not string:
+            return tokens
+        start = 0
+        in_ws = string[0].isspace()
+        for i, char in enumerate(string):
+            if char.isspace() != in_ws:
+                if start < i:
+                    tokens += self.tokenize_chunk(string[start:i], with_special_cases)
+                if char == " ":
+                    tokens[-1][1] = True
+                    start = i + 1
+                else:
+                    start = i
+                in_ws = not in_ws
+        if start < len(string):
+            tokens += self.tokenize_chunk(string[start:], with_special_cases)
+            tokens[-1][1] = string[-1] == " " and not in_ws
+        return tokens
+
+    def tokenize_chunk(self, chunk, with_special_cases):
+        if with_special_cases and chunk in self.rules:
+            texts = self.rules[chunk]
+        elif with_special_cases and chunk in self.cache:
+            texts = self.cache[chunk]
+        else:
+            texts = self.tokenize(chunk, with_special_cases)
+            if with_special_cases and len(self.cache) < self.max_cache_size:
+                self.cache[chunk] = texts
+        return [[text, False] for text in texts]
+
+    def tokenize(self, string, with_special_cases):
+        prefixes, suffixes = [], []
+        last_size = 0
+        while string and len(string) != last_size:
+            if self.token_match and self.token_match(string):
+                break
+            if with_special_cases and string in self.rules:
+                break
+            last_size = len(string)
+            pre_len = self.find_prefix(string)
+            if pre_len:
+                prefix = string[:pre_len]
+                minus_pre = string[pre_len:]
+                if minus_pre and with_special_cases and minus_pre in self.rules:
+                    string = minus_pre
+                    prefixes.append(prefix)
+                    break
+            suf_len = self.find_suffix(string[pre_len:])
+            if suf_len:
+                suffix = string[-suf_len:]
+                minus_suf = string[:-suf_len]
+                if minus_suf and with_special_cases and minus_suf in self.rules:
+                    string = minus_suf
+                    suffixes.append(suffix)
+                    break
+            if pre_len and suf_len and (pre_len + suf_len) <= len(string):
+                string = string[pre_len:-suf_len]
+                prefixes.append(prefix)
+                suffixes.append(suffix)
+            elif pre_len:
+                string = minus_pre
+                prefixes.append(prefix)
+            elif suf_len:
+                string = minus_suf
+                suffixes.append(suffix)
+        return prefixes + self.attach(string, with_special_cases) + suffixes[::-1]
+
+    def attach(self, string, with_special_cases):
+        if not string:
+            return []
+        if with_special_cases and string in self.rules:
+            return list(self.rules[string])
+        if (self.token_match and self.token_match(string)) or (
+            self.url_match and self.url_match(string)
+        ):
+            return [string]
+        texts = []
+        start = 0
+        for match in self.find_infix(string):
+            infix_start, infix_end = match.start(), match.end()
+            if infix_start == 0:
+                continue
+            if infix_start != start:
+                texts.append(string[start:infix_start])
+            if infix_start != infix_end:
+                texts.append(string[infix_start:infix_end])
+            start = infix_end
+        if string[start:]:
+            texts.append(string[start:])
+        return texts
+
+    def apply_special_cases(self, tokens):
+        texts = [text for text, _ in tokens]
+        matches = []
+        for i, text in enumerate(texts):
+            for pattern in self.special_patterns.get(text, ()):
+                if tuple(texts[i : i + len(pattern)]) == pattern:
+                    matches.append((i, i + len(pattern)))
+        if not matches:
+            return tokens
+        # les plus longues d'abord, puis les plus à gauche, sans chevauchement
+        matches.sort(key=lambda m: (m[1] - m[0], -m[0]))
+        seen = set()
+        spans = []
+        for start, end in reversed(matches):
+            if start not in seen and end - 1 not in seen:
+                spans.append((start, end))
+            seen.update(range(start, end))
+        out = []
+        i = 0
+        for start, end in sorted(spans):
+            out += tokens[i:start]
+            text = "".join(t + (" " if ws else "") for t, ws in tokens[start : end - 1])
+            text += tokens[end - 1][0]
+            if text in self.rules:
+                out += [[t, False] for t in self.rules[text]]
+                out[-1][1] = tokens[end - 1][1]
+            else:
+                out += tokens[start:end]
+            i = end
+        return out + tokens[i:]
+
+
+class Prediction:
+    """Équivalent du Doc spaCy pour ProductClassifier : seul `cats` est lu"""
+
+    __slots__ = ("cats", "text")
+
+    def __init__(self, text, cats):
+        self.text = text
+        self.cats = cats
+
+
+class BowModel:
+    """Modèle exporté, utilisable à la place de l'objet `nlp` de spaCy"""
+
+    pipe_names = ("textcat",)
+    # comme Tokenizer.cache : au-delà, les ORTH ne sont plus mémorisés
+    max_orths_size = 10000
+
+    def __init__(
+        self,
+        labels,
+        bias,
+        length,
+        activation,
+        rows,
+        weights,
+        tokenizer,
+        symbols,
+        scale=None,
+    ):
+        self.labels = labels
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.length = length
+        self.activation = activation
+        # indices triés des lignes non nulles de la table de poids
+        self.rows = rows
+        self.weights = weights
+        # poids quantifiés en int8 : échelle de chaque label
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.tokenizer = tokenizer
+        self.symbols = symbols
+        self.orths = {}
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(
+            os.path.join(path, "model.json.gz"), "rt", encoding="utf-8"
+        ) as f:
+            meta = json.load(f)
+        with np.load(os.path.join(path, "regex.npz")) as programs:
+            regexes = {
+                name: compile_regex(meta["tokenizer"].get(name), programs)
+                for name in REGEXES
+            }
+        tokenizer = Tokenizer(
+            meta["tokenizer"]["rules"],
+            special_patterns=meta["tokenizer"]["special_patterns"],
+            **regexes,
+        )
+        return cls(
+            meta["labels"],
+            meta["bias"],
+            meta["length"],
+            meta["activation"],
+            np.load(os.path.join(path, "rows.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "weights.npy"), mmap_mode="r"),
+            tokenizer,
+            meta["symbols"],
+            meta.get("scale"),
+        )
+
+    def orth(self, text):
+        """Identifiant ORTH spaCy d'un token"""
+        orth = self.orths.get(text)
+        if orth is None:
+            orth = self.symbols.get(text)
+            if orth is None:
+                orth = murmurhash64a(text.encode("utf-8"))
+            if len(self.orths) < self.max_orths_size:
+                self.orths[text] = orth
+        return orth
+
+    def pipe(self, texts, batch_size=256, n_process=1):
+        """Prédictions par lots, comme nlp.pipe ; n_process est ignoré"""
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                yield from self.predict(batch)
+                batch = []
+        if batch:
+            yield from self.predict(batch)
+
+    def predict(self, texts):
+        scores = self.scores(texts)
+        return [
+            Prediction(text, {label: float(s) for label, s in zip(self.labels, row)})
+            for text, row in zip(texts, scores)
+        ]
+
+    def scores(self, texts):
+        """Scores (len(texts), len(labels)) : la matrice creuse des
+        occurrences de tokens multipliée par la table de poids"""
+        keys, docs = [], []
+        for i, text in enumerate(texts):
+            orths = [self.orth(t) for t, _ in self.tokenizer(text)]
+            keys += orths
+            docs += [i] * len(orths)
+        n_labels = len(self.labels)
+        if not keys:
+            # comme textcat.predict quand aucun document n'a de token
+            return np.zeros((len(texts), n_labels), dtype=np.float32)
+        keys = np.array(keys, dtype=np.uint64)
+        docs = np.array(docs + docs, dtype=np.intp)
+        buckets = np.concatenate(
+            [murmurhash3_32(keys, 0), murmurhash3_32(keys, 1)]
+        ) % np.uint32(self.length)
+        positions = np.searchsorted(self.rows, buckets)
+        positions[positions == len(self.rows)] = 0
+        hits = self.rows[positions] == buckets
+        docs, positions = docs[hits], positions[hits]
+        gathered = self.weights[positions]
+        if self.scale is not None:
+            gathered = gathered * self.scale
+        scores = np.empty((len(texts), n_labels), dtype=np.float64)
+        for j in range(n_labels):
+            scores[:, j] = np.bincount(docs, gathered[:, j], minlength=len(texts))
+        scores += self.bias
+        if self.activation == "softmax":
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        elif self.activation == "logistic":
+            scores = 1 / (1 + np.exp(-scores))
+        return scores.astype(np.float32)
+
+
+def export(nlp, path, name="textcat"):
+    """Exporte le composant textcat et le tokenizer de `nlp` dans `path`"""
+    from spacy.attrs import ORTH
+    from spacy.symbols import IDS
+
+    config = nlp.config["components"][name]["model"]
+    if config["@architectures"] != "spacy.TextCatBOW.v3" or config["ngram_size"] != 1:
+        raise ValueError(
+            f"{name}: seul spacy.TextCatBOW.v3 avec ngram_size = 1 est exportable"
+        )
+    textcat = nlp.get_pipe(name)
+    linear = textcat.model.get_ref("output_layer")
+    length = linear.get_dim("length")
+    n_labels = linear.get_dim("nO")
+    table = np.asarray(linear.get_param("W")).reshape(n_labels, length).T
+    rows = np.flatnonzero(table.any(axis=1)).astype(np.uint32)
+
+    tokenizer = nlp.tokenizer
+    specs, programs = {}, {}
+    for regex in REGEXES:
+        method = getattr(tokenizer, regex)
+        if method is None:
+            specs[regex] = None
+            continue
+        specs[regex], code = export_regex(regex, method)
+        if code is not None:
+            programs[regex] = code
+    rules = {
+        string: [token[ORTH] for token in tokens]
+        for string, tokens in sorted(tokenizer.rules.items())
+    }
+    # motifs du PhraseMatcher des exceptions (Tokenizer.add_special_case)
+    plain = Tokenizer(rules, **{regex: getattr(tokenizer, regex) for regex in REGEXES})
+    special_patterns = [
+        [text for text, _ in plain.tokenize_affixes(string, False)]
+        for string in rules
+        if not tokenizer.faster_heuristics or plain.needs_matcher(string)
+    ]
+
+    if config["no_output_layer"]:
+        activation = None
+    else:
+        activation = "softmax" if config["exclusive_classes"] else "logistic"
+    os.makedirs(path, exist_ok=True)
+    with gzip.open(os.path.join(path, "model.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump(
+            {
+                "labels": list(textcat.labels),
+                "bias": np.asarray(linear.get_param("b")).tolist(),
+                "length": length,
+                "activation": activation,
+                "tokenizer": {
+                    **specs,
+                    "rules": rules,
+                    "special_patterns": special_patterns,
+                },
+                "symbols": {k: v for k, v in IDS.items() if k},
+            },
+            f,
+            ensure_ascii=False,
+        )
+    np.savez_compressed(os.path.join(path, "regex.npz"), **programs)
+    np.save(os.path.join(path, "rows.npy"), rows)
+    np.save(os.path.join(path, "weights.npy"), table[rows].astype(np.float32))
+
+
+def compress(source, path, prune=0.0, quantize=False):
+    """Copie l'export `source` dans `path` en écartant la fraction `prune`
+    des lignes de poids les plus faibles, et en quantifiant les poids en
+    int8 (une échelle par label) avec `quantize`"""
+    with gzip.open(os.path.join(source, "model.json.gz"), "rt", encoding="utf-8") as f:
+        meta = json.load(f)
+    rows = np.load(os.path.join(source, "rows.npy"))
+    weights = np.load(os.path.join(source, "weights.npy")).astype(np.float32)
+    if meta.pop("scale", None) is not None:
+        raise ValueError(f"{source}: export déjà quantifié")
+    if prune:
+        strength = np.abs(weights).max(axis=1)
+        dropped = int(len(rows) * prune)
+        keep = np.sort(np.argsort(strength, kind="stable")[dropped:])
+        rows, weights = rows[keep], weights[keep]
+    if quantize:
+        scale = np.abs(weights).max(axis=0, initial=0) / 127
+        scale[scale == 0] = 1
+        weights = np.round(weights / scale).astype(np.int8)
+        meta["scale"] = scale.tolist()
+    os.makedirs(path, exist_ok=True)
+    with gzip.open(os.path.join(path, "model.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.copyfile(os.path.join(source, "regex.npz"), os.path.join(path, "regex.npz"))
+    np.save(os.path.join(path, "rows.npy"), rows)
+    np.save(os.path.join(path, "weights.npy"), weights)
+
+
+if __name__ == "__main__":
+    import spacy
+
+    model_path = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else os.environ.get("PRODUCT_MODEL_PATH", "./models/model-best")
+    )
+    export(spacy.load(model_path), os.path.join(model_path, "bow"))
+    print(f"Modèle exporté: {os.path.join(model_path, 'bow')}")
@@ -0,0 +1,88 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+
+def model_version(model_path):
+    """Version du modèle tirée de meta.json : la version déclarée ne change
+    pas d'un entraînement à l'autre, l'empreinte du fichier (scores
+    d'évaluation compris) si"""
+    path = os.path.join(model_path, "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+
+class PredictionCache:
+    """Scores du modèle par texte de features (catégories + titre).
+
+    Deux niveaux : un LRU en mémoire, et un dictionnaire persisté avec
+    l'état de crawl (CrawlState) d'une session à l'autre. Les entrées sont
+    indexées par l'empreinte du texte ; l'état porte la version du modèle et
+    est vidé quand elle change, après un réentraînement.
+    """
+
+    def __init__(self, version, max_size=10000, max_stored=50000):
+        self.version = version
+        self.max_size = max_size
+        self.max_stored = max_stored
+        self.memory = OrderedDict()
+        self.state = self.empty_state()
+        self.hits = 0
+        self.misses = 0
+
+    def empty_state(self):
+        return {"version": self.version, "labels": None, "entries": {}}
+
+    def attach(self, state):
+        """Utilise `state` (un espace de noms de CrawlState) comme niveau
+        persistant"""
+        if state.get("version") != self.version:
+            state.clear()
+            state.update(self.empty_state())
+        self.state = state
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+    def get(self, text):
+        """Scores {label: score} en cache, ou None"""
+        key = self.key(text)
+        cats = self.memory.get(key)
+        if cats is not None:
+            self.memory.move_to_end(key)
+        else:
+            scores = self.state["entries"].pop(key, None)
+            if scores is None:
+                self.misses += 1
+                return None
+            # réinséré en fin : le dictionnaire persistant reste trié du
+            # moins au plus récemment utilisé
+            self.state["entries"][key] = scores
+            cats = dict(zip(self.state["labels"], scores))
+            self.remember(key, cats)
+        self.hits += 1
+        return cats
+
+    def put(self, text, cats):
+        key = self.key(text)
+        self.remember(key, cats)
+        if self.state["labels"] is None:
+            self.state["labels"] = list(cats)
+        if list(cats) == self.state["labels"]:
+            self.state["entries"][key] = [round(s, 6) for s in cats.values()]
+
+    def remember(self, key, cats):
+        self.memory[key] = cats
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def trim(self):
+        """Limite le niveau persistant à ses `max_stored` entrées les plus
+        récemment utilisées, avant la sauvegarde de l'état"""
+        entries = self.state["entries"]
+        for key in list(entries)[: max(0, len(entries) - self.max_stored)]:
+            del entries[key]
@@ -0,0 +1,63 @@
+import glob
+import json
+import os
+from urllib.parse import urlparse
+
+
+class HostRule:
+    """Règle d'un site compilée : chaque nom de catégorie du torréfacteur
+    pointe directement vers les labels qu'il désigne"""
+
+    __slots__ = ("ignore", "ignore_if_empty", "labels")
+
+    def __init__(self, rule):
+        self.ignore_if_empty = rule.get("ignore_if_empty_categories", False)
+        self.ignore = frozenset(rule.get("ignore", []))
+        labels = {}
+        for label, keywords in rule.get("categories", []):
+            for keyword in keywords:
+                labels.setdefault(keyword, set()).add(label)
+        self.labels = {k: frozenset(v) for k, v in labels.items()}
+
+    def classify(self, categories):
+        """Label désigné par les catégories, None si aucune règle ne
+        s'applique ou si elles désignent plusieurs labels"""
+        if self.ignore_if_empty and not categories:
+            return None
+        if not self.ignore.isdisjoint(categories):
+            return None
+        labels = set()
+        for category in categories:
+            labels |= self.labels.get(category, frozenset())
+        return next(iter(labels)) if len(labels) == 1 else None
+
+
+class HostRules:
+    """Règles de classification par site (classifier/rules/<host>.json),
+    appliquées avant le modèle : les mêmes que pour étiqueter les données
+    d'entraînement (DataPreparator)"""
+
+    def __init__(self, rules=None):
+        self.hosts = {host: HostRule(rule) for host, rule in (rules or {}).items()}
+
+    @classmethod
+    def load(cls, directory):
+        rules = {}
+        for filename in glob.glob(os.path.join(directory, "*.json")):
+            with open(filename, "r") as f:
+                rules[os.path.basename(filename).removesuffix(".json")] = json.load(f)
+        return cls(rules)
+
+    def rule(self, product):
+        host = (
+            product.get("host") or urlparse(product.get("product_url") or "").hostname
+        )
+        if not host:
+            return None
+        return self.hosts.get(host) or self.hosts.get(host.removeprefix("www."))
+
+    def classify(self, product):
+        rule = self.rule(product)
+        if rule is None:
+            return None
+        return rule.classify(product.get("categories") or [])
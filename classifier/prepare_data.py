@@ -145,3 +145,5 @@ if __name__ == "__main__":
     print(
         "python -m spacy train spacy.cfg --output ./models --paths.train ./data/train.spacy --paths.dev ./data/dev.spacy"
     )
+    print("Ou comparer des variantes compactes du modèle avec:")
+    print("python -m classifier.variants --max-drop 0.01")
@@ -1,28 +1,69 @@
 import json
 import os
-import spacy
+import time
 from urllib.parse import urlparse
 
+from classifier.cache import PredictionCache, model_version
+from classifier.host_rules import HostRules
+
 
 class ProductClassifier:
-    def __init__(self, model_path=None):
+    def __init__(
+        self, model_path=None, batch_size=None, n_process=None, rules_path=None
+    ):
         """
         Initialise le classificateur avec un modèle pré-entraîné
 
         Args:
             model_path: Chemin vers le modèle spaCy entraîné
+            batch_size: Nombre de textes par lot passé à nlp.pipe
+            n_process: Nombre de processus utilisés par nlp.pipe
+            rules_path: Répertoire des règles par site appliquées avant le
+                modèle
         """
         self.model_path = model_path or os.environ.get(
             "PRODUCT_MODEL_PATH", "./models/model-best"
         )
+        self.batch_size = batch_size or int(
+            os.environ.get("PRODUCT_MODEL_BATCH_SIZE", "256")
+        )
+        self.n_process = n_process or int(
+            os.environ.get("PRODUCT_MODEL_N_PROCESS", "1")
+        )
+
+        self.rules = HostRules.load(
+            rules_path or os.environ.get("PRODUCT_RULES_PATH", "./classifier/rules")
+        )
+        # sans meta.json, pas de version pour invalider le cache
+        version = model_version(self.model_path)
+        self.cache = (
+            PredictionCache(
+                version,
+                max_size=int(os.environ.get("PRODUCT_CACHE_SIZE", "10000")),
+                max_stored=int(os.environ.get("PRODUCT_CACHE_STORED", "50000")),
+            )
+            if version is not None
+            else None
+        )
+        self.reset_stats()
 
         self.nlp = None
 
         self._load_model()
 
     def _load_model(self):
-        """Charge le modèle spaCy"""
-        if os.path.exists(self.model_path):
+        """Charge le modèle spaCy, ou son export NumPy (python -m
+        classifier.bow) quand il est présent"""
+        bow_path = os.path.join(self.model_path, "bow")
+        if os.path.exists(bow_path):
+            from classifier.bow import BowModel
+
+            self.nlp = BowModel.load(bow_path)
+        elif os.path.exists(self.model_path):
+            # importer spaCy coûte à lui seul plus d'une seconde : seulement
+            # quand un modèle est effectivement chargé
+            import spacy
+
             try:
                 self.nlp = spacy.load(self.model_path)
             except Exception as e:
@@ -36,9 +77,38 @@ class ProductClassifier:
         """Crée le texte de features à partir d'un produit"""
         return " ".join(product.get("categories", []) + [product.get("title", "")])
 
+    def scores(self, products):
+        """
+        Scores textcat de chaque produit, calculés par lots avec nlp.pipe
+        pour les textes absents du cache
+
+        Args:
+            products: Liste de produits
+
+        Returns:
+            Liste de dictionnaires {catégorie: score}, vides si le modèle
+            n'a rien prédit
+        """
+        texts = [self.featurize(product) for product in products]
+        known = {}
+        for text in dict.fromkeys(texts):
+            cats = self.cache.get(text) if self.cache is not None else None
+            if cats is not None:
+                known[text] = cats
+        missing = [text for text in dict.fromkeys(texts) if text not in known]
+        docs = self.nlp.pipe(
+            missing, batch_size=self.batch_size, n_process=self.n_process
+        )
+        for text, doc in zip(missing, docs):
+            known[text] = dict(doc.cats)
+            if self.cache is not None:
+                self.cache.put(text, known[text])
+        return [dict(known[text]) for text in texts]
+
     def predict(self, products):
         """
-        Prédit les catégories pour une liste de produits
+        Prédit les catégories pour une liste de produits : les règles du
+        site d'abord, le modèle pour les produits qu'elles ne tranchent pas
 
         Args:
             products: Liste de dictionnaires représentant les produits
@@ -46,21 +116,62 @@ class ProductClassifier:
         Returns:
             Liste des catégories prédites
         """
+        labels = [self.rules.classify(product) for product in products]
+        pending = [p for p, label in zip(products, labels) if label is None]
+        self.rule_decisions += len(products) - len(pending)
+        if pending:
+            started = time.perf_counter()
+            predicted = iter(self.predict_model(pending))
+            self.model_seconds += time.perf_counter() - started
+            self.model_decisions += len(pending)
+        return [label if label is not None else next(predicted) for label in labels]
+
+    def reset_stats(self):
+        """Remet à zéro les compteurs de usage_stats : le classificateur est
+        partagé par les sessions successives d'un même processus (Lambda
+        réutilisée)"""
+        # produits classés par les règles, par le modèle, et temps passé
+        # dans le modèle
+        self.rule_decisions = 0
+        self.model_decisions = 0
+        self.model_seconds = 0.0
+        if self.cache is not None:
+            self.cache.hits = 0
+            self.cache.misses = 0
+
+    def usage_stats(self):
+        """Part des produits classés par les règles et temps de modèle
+        économisé, estimé au temps moyen d'une prédiction ; succès du cache
+        de prédictions"""
+        total = self.rule_decisions + self.model_decisions
+        per_item_ms = (
+            self.model_seconds * 1000 / self.model_decisions
+            if self.model_decisions
+            else 0.0
+        )
+        return {
+            "classifier/rules_decided": self.rule_decisions,
+            "classifier/model_predicted": self.model_decisions,
+            "classifier/rules_ratio": round(self.rule_decisions / total, 3)
+            if total
+            else 0.0,
+            "classifier/model_ms": round(self.model_seconds * 1000),
+            "classifier/saved_ms_estimate": round(self.rule_decisions * per_item_ms),
+            "classifier/cache_hits": self.cache.hits if self.cache is not None else 0,
+            "classifier/cache_misses": self.cache.misses
+            if self.cache is not None
+            else 0,
+        }
+
+    def predict_model(self, products):
+        """Catégories prédites par le modèle seul"""
         if not self.nlp or "textcat" not in self.nlp.pipe_names:
             return ["_unknown" for _ in products]
 
-        predictions = []
-        for product in products:
-            text = self.featurize(product)
-            doc = self.nlp(text)
-
-            if doc.cats:
-                predicted_category = max(doc.cats, key=doc.cats.get)
-                predictions.append(predicted_category)
-            else:
-                predictions.append("_unknown")
-
-        return predictions
+        return [
+            max(cats, key=cats.get) if cats else "_unknown"
+            for cats in self.scores(products)
+        ]
 
     def predict_with_confidence(self, products, threshold=0.5):
         """
@@ -77,13 +188,10 @@ class ProductClassifier:
             return [("_unknown", 0.0) for _ in products]
 
         results = []
-        for product in products:
-            text = self.featurize(product)
-            doc = self.nlp(text)
-
-            if doc.cats:
-                best_category = max(doc.cats, key=doc.cats.get)
-                confidence = doc.cats[best_category]
+        for cats in self.scores(products):
+            if cats:
+                best_category = max(cats, key=cats.get)
+                confidence = cats[best_category]
 
                 if confidence >= threshold:
                     results.append((best_category, confidence))
@@ -107,13 +215,7 @@ class ProductClassifier:
         if not self.nlp or "textcat" not in self.nlp.pipe_names:
             return [{"_unknown": 1.0} for _ in products]
 
-        results = []
-        for product in products:
-            text = self.featurize(product)
-            doc = self.nlp(text)
-            results.append(dict(doc.cats) if doc.cats else {"_unknown": 1.0})
-
-        return results
+        return [cats or {"_unknown": 1.0} for cats in self.scores(products)]
 
 
 if __name__ == "__main__":
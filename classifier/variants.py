@@ -0,0 +1,229 @@
+"""Variantes compactes du classificateur de produits.
+
+Entraîne spacy.cfg avec des tables de hachage plus petites, exporte chaque
+modèle (classifier.bow) avec et sans élagage des poids faibles et
+quantification int8, puis mesure pour chaque variante :
+
+- la taille sur disque ;
+- le temps de chargement dans un interpréteur neuf, imports compris ;
+- la latence médiane d'un lot de prédictions ;
+- la précision sur dev.spacy.
+
+La plus petite variante dont la précision reste à moins de --max-drop du
+modèle de référence (la plus grande table, sans compression) est copiée
+dans --output, utilisable avec PRODUCT_MODEL_PATH.
+
+Usage:
+    python -m classifier.variants [--lengths 262144,65536,16384,4096]
+        [--prune 0,0.5,0.8] [--max-drop 0.01] [--output models/model-compact]
+
+Les données sont celles de classifier/prepare_data.py (data/train.spacy et
+data/dev.spacy).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from classifier.bow import BowModel, compress, export
+
+LOAD = """
+import time
+started = time.perf_counter()
+{load}
+print((time.perf_counter() - started) * 1000)
+"""
+LOADERS = {
+    "spacy": "import spacy; spacy.load({path!r})",
+    "bow": "from classifier.bow import BowModel; BowModel.load({path!r})",
+}
+
+
+def dir_size(path, exclude=()):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in exclude]
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return size
+
+
+def load_ms(kind, path, repeat=3):
+    """Temps de chargement médian, mesuré dans un interpréteur neuf"""
+    code = LOAD.format(load=LOADERS[kind].format(path=str(path)))
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def read_dev(path):
+    """(texte, catégorie attendue) des exemples de validation"""
+    import spacy
+    from spacy.tokens import DocBin
+
+    nlp = spacy.blank("fr")
+    return [
+        (doc.text, max(doc.cats, key=doc.cats.get))
+        for doc in DocBin().from_disk(path).get_docs(nlp.vocab)
+    ]
+
+
+def evaluate(nlp, dev, batch_size):
+    """(précision, latence médiane d'un lot en ms)"""
+    texts = [text for text, _ in dev]
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    # premier passage pour les caches du tokenizer
+    list(nlp.pipe(texts, batch_size=batch_size))
+    predictions, times = [], []
+    for batch in batches:
+        started = time.perf_counter()
+        docs = list(nlp.pipe(batch, batch_size=batch_size))
+        times.append((time.perf_counter() - started) * 1000)
+        predictions += [max(doc.cats, key=doc.cats.get) for doc in docs]
+    correct = sum(p == expected for p, (_, expected) in zip(predictions, dev))
+    return correct / len(dev), statistics.median(times)
+
+
+def train(length, args):
+    """Entraîne spacy.cfg avec une table de `length` lignes"""
+    from spacy.cli.train import train as spacy_train
+
+    output = os.path.join(args.workdir, f"length-{length}")
+    if not os.path.exists(os.path.join(output, "model-best")):
+        spacy_train(
+            args.config,
+            output,
+            overrides={
+                "paths.train": args.train,
+                "paths.dev": args.dev,
+                "components.textcat.model.length": length,
+            },
+        )
+    return os.path.join(output, "model-best")
+
+
+def measure(variant, nlp, dev, batch_size):
+    accuracy, batch_ms = evaluate(nlp, dev, batch_size)
+    exclude = ("bow",) if variant["kind"] == "spacy" else ()
+    return {
+        **variant,
+        "size_kb": round(dir_size(variant["path"], exclude) / 1024),
+        "load_ms": round(load_ms(variant["kind"], variant["path"])),
+        "batch_ms": round(batch_ms, 2),
+        "accuracy": round(accuracy, 4),
+    }
+
+
+def sweep(args):
+    import spacy
+
+    dev = read_dev(args.dev)
+    results = []
+    for length in args.lengths:
+        model = train(length, args)
+        variant = {"kind": "spacy", "length": length, "prune": 0.0, "quantize": False}
+        nlp = spacy.load(model)
+        results.append(
+            measure({**variant, "path": model, "model": model}, nlp, dev, args.batch)
+        )
+        source = os.path.join(args.workdir, f"length-{length}", "bow")
+        export(nlp, source)
+        for prune in args.prune:
+            for quantize in (False, True):
+                path = f"{source}-prune{prune}" + ("-int8" if quantize else "")
+                compress(source, path, prune=prune, quantize=quantize)
+                variant = {
+                    "kind": "bow",
+                    "length": length,
+                    "prune": prune,
+                    "quantize": quantize,
+                    "path": path,
+                    "model": model,
+                }
+                results.append(measure(variant, BowModel.load(path), dev, args.batch))
+        print_results(results[-1 - 2 * len(args.prune) :])
+    return results
+
+
+def best_variant(results, max_drop):
+    """Plus petite variante dont la précision reste à moins de `max_drop`
+    de la référence (première variante spaCy, la plus grande table)"""
+    reference = results[0]
+    candidates = [
+        r for r in results if r["accuracy"] >= reference["accuracy"] - max_drop
+    ]
+    return min(candidates, key=lambda r: (r["size_kb"], r["batch_ms"], r["load_ms"]))
+
+
+def emit(variant, output):
+    """Copie la variante dans `output` ; meta.json décrit la compression,
+    ce qui change aussi la version vue par le cache de prédictions"""
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    if variant["kind"] == "spacy":
+        shutil.copytree(variant["path"], output, ignore=shutil.ignore_patterns("bow"))
+        return
+    os.makedirs(output)
+    shutil.copytree(variant["path"], os.path.join(output, "bow"))
+    with open(os.path.join(variant["model"], "meta.json")) as f:
+        meta = json.load(f)
+    meta["compression"] = {
+        k: variant[k] for k in ("kind", "length", "prune", "quantize")
+    }
+    with open(os.path.join(output, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def print_results(results):
+    for r in results:
+        name = f"{r['kind']} length={r['length']} prune={r['prune']}" + (
+            " int8" if r["quantize"] else ""
+        )
+        print(
+            f"{name:<40} {r['size_kb']:>8,} Ko {r['load_ms']:>7,} ms "
+            f"{r['batch_ms']:>8.2f} ms/lot  précision {r['accuracy']:.4f}"
+        )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--config", default="spacy.cfg")
+    parser.add_argument("--train", default="./data/train.spacy")
+    parser.add_argument("--dev", default="./data/dev.spacy")
+    parser.add_argument("--workdir", default="./models/variants")
+    parser.add_argument("--output", default="./models/model-compact")
+    parser.add_argument(
+        "--lengths",
+        type=lambda v: sorted((int(x) for x in v.split(",")), reverse=True),
+        default=[262144, 65536, 16384, 4096],
+    )
+    parser.add_argument(
+        "--prune",
+        type=lambda v: [float(x) for x in v.split(",")],
+        default=[0.0, 0.5, 0.8],
+    )
+    parser.add_argument("--max-drop", type=float, default=0.01)
+    parser.add_argument("--batch", type=int, default=256)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    results = sweep(args)
+    best = best_variant(results, args.max_drop)
+    print("\n== Variantes ==")
+    print_results(results)
+    print("\n== Retenue ==")
+    print_results([best])
+    emit(best, args.output)
+    with open(os.path.join(args.workdir, "results.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Modèle écrit dans {args.output} (PRODUCT_MODEL_PATH={args.output})")
@@ -2,8 +2,11 @@ import logging
 import os
 import json
 import sys
+import tarfile
 
 import boto3
+from boto3.exceptions import Boto3Error
+from botocore.exceptions import ClientError
 
 from scrapy.crawler import CrawlerRunner
 from scrapy.utils.project import get_project_settings
@@ -12,11 +15,13 @@ from crochet import setup, wait_for
 from ulid import ULID
 import shutil
 
+from scraper.lib.lazy import Lazy, warm
+
 setup()
 
-dynamodb_client = boto3.client("dynamodb")
-s3_client = boto3.client("s3")
-sqs_client = boto3.client("sqs")
+dynamodb_client = Lazy("dynamodb", lambda: boto3.client("dynamodb"))
+s3_client = Lazy("s3", lambda: boto3.client("s3"))
+sqs_client = Lazy("sqs", lambda: boto3.client("sqs"))
 
 
 data_root_dir = os.environ.get("DATA_ROOT_DIR", "./data/synced")
@@ -29,6 +34,16 @@ parsed_dir = f"{data_root_dir}/parsed/v1"
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
+# échecs attendus lors de la sauvegarde/restauration des archives sur S3
+# (objet absent, transfert interrompu, archive ou état corrompu)
+ARCHIVE_ERRORS = (
+    ClientError,
+    Boto3Error,
+    tarfile.TarError,
+    OSError,
+    json.JSONDecodeError,
+)
+
 
 class RestoreScrapyJobdir:
     def __init__(self, session_id):
@@ -41,7 +56,7 @@ class RestoreScrapyJobdir:
         try:
             shutil.rmtree(f"{crawled_dir}/{self.session_id}", ignore_errors=True)
             os.makedirs(f"{crawled_dir}/{self.session_id}")
-        except Exception as err:
+        except ARCHIVE_ERRORS as err:
             logging.error(f"failed to setup directory layout: {err}")
             pass
         try:
@@ -58,7 +73,7 @@ class RestoreScrapyJobdir:
             os.unlink(f"{crawled_dir}/{self.session_id}.tar.gz")
             size_mb = size_bytes / (1024 * 1024)
             logging.info(f"Session restored - tar size: {size_mb:.2f} MB")
-        except Exception as err:
+        except ARCHIVE_ERRORS as err:
             logging.error(f"failed to restore session {self.session_id}: {err}")
             pass
         try:
@@ -72,9 +87,20 @@ class RestoreScrapyJobdir:
             os.unlink("/tmp/cache.tar.gz")
             size_mb = size_bytes / (1024 * 1024)
             logging.info(f"Cache restored - tar size: {size_mb:.2f} MB")
-        except Exception as err:
+        except ARCHIVE_ERRORS as err:
             logging.error(f"failed to restore cache: {err}")
             pass
+        try:
+            s3_client.download_file(
+                os.environ["PAGE_S3_BUCKET"],
+                "crawled/v4/state.tar.gz",
+                "/tmp/state.tar.gz",
+            )
+            shutil.unpack_archive("/tmp/state.tar.gz", "/tmp/state")
+            os.unlink("/tmp/state.tar.gz")
+            logging.info("crawl state restored")
+        except ARCHIVE_ERRORS as err:
+            logging.error(f"failed to restore crawl state: {err}")
         return self
 
     def __exit__(self, exception_type, exception_value, exception_traceback):
@@ -95,7 +121,7 @@ class RestoreScrapyJobdir:
             logging.info(
                 f"session {self.session_id} saved - tar size: {size_mb:.2f} MB"
             )
-        except Exception as err:
+        except ARCHIVE_ERRORS as err:
             logging.error(f"failed to save session: {err}")
             pass
         try:
@@ -109,21 +135,34 @@ class RestoreScrapyJobdir:
             os.unlink("/tmp/cache.tar.gz")
             size_mb = size_bytes / (1024 * 1024)
             logging.info(f"cache saved - tar size: {size_mb:.2f} MB")
-        except Exception as err:
+        except ARCHIVE_ERRORS as err:
             logging.error(f"failed to save cache: {err}")
             pass
+        try:
+            shutil.make_archive("/tmp/state", "gztar", "/tmp/state")
+            s3_client.upload_file(
+                "/tmp/state.tar.gz",
+                os.environ["PAGE_S3_BUCKET"],
+                "crawled/v4/state.tar.gz",
+            )
+            os.unlink("/tmp/state.tar.gz")
+            logging.info("crawl state saved")
+        except ARCHIVE_ERRORS as err:
+            logging.error(f"failed to save crawl state: {err}")
 
 
 @wait_for(timeout=300)
 async def payload_handler(session_id, itercount, domains):
     settings = get_project_settings()
     settings.set(name="HTTPCACHE_DIR", value="/tmp/cache", priority="cmdline")
+    settings.set(name="FUGUE_STATE_DIR", value="/tmp/state", priority="cmdline")
 
     settings.set(
         name="EXTENSIONS",
         value={
             "scrapy.extensions.closespider.CloseSpider": 500,
             "lambda.functions.sync_session.FugueSync": 0,
+            "scraper.extensions.ReactorLag": 0,
         },
         priority="cmdline",
     )
@@ -168,6 +207,7 @@ async def payload_handler(session_id, itercount, domains):
 
 
 def lambda_handler(event, context):
+    warm(s3_client)
     for record in event["Records"]:
         config = json.loads(record["body"])
         if "session_id" in config:
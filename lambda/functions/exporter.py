@@ -11,20 +11,27 @@ from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.appsync_auth import AppSyncIAMAuthentication
 
 from extractors.mistral import MistralExtractor
+from scraper.lib.lazy import Lazy, warm
 from validators import validate
 
-llm = MistralExtractor()
+# créés au premier usage : une invocation sans nouveau café n'instancie ni
+# l'extracteur Mistral ni le client AppSync
+llm = Lazy("mistral", MistralExtractor)
 
-s3_client = boto3.client("s3")
+s3_client = Lazy("s3", lambda: boto3.client("s3"))
+
+
+def appsync_client():
+    auth = AppSyncIAMAuthentication(
+        host="jizfjk7ncnb6rbq7lvu3k2izoe.appsync-api.eu-west-1.amazonaws.com",
+    )
+    transport = AIOHTTPTransport(
+        url="https://jizfjk7ncnb6rbq7lvu3k2izoe.appsync-api.eu-west-1.amazonaws.com/graphql",
+        auth=auth,
+    )
+    return Client(transport=transport, fetch_schema_from_transport=False)
 
-auth = AppSyncIAMAuthentication(
-    host="jizfjk7ncnb6rbq7lvu3k2izoe.appsync-api.eu-west-1.amazonaws.com",
-)
 
-transport = AIOHTTPTransport(
-    url="https://jizfjk7ncnb6rbq7lvu3k2izoe.appsync-api.eu-west-1.amazonaws.com/graphql",
-    auth=auth,
-)
 get_bean = gql("""
 query getBean($id: String!) {
     getRoastedBean(id: $id) {
@@ -87,8 +94,8 @@ import_bean = gql("""
     }
 """)
 
-client = Client(transport=transport, fetch_schema_from_transport=False)
-dynamodb = boto3.client("dynamodb")
+client = Lazy("appsync", appsync_client)
+dynamodb = Lazy("dynamodb", lambda: boto3.client("dynamodb"))
 logging.basicConfig(level=os.getenv("LOG_LEVEL", logging.WARNING))
 
 class DownloadedPageNotFound(Exception):
@@ -221,6 +228,7 @@ def s3_file_handler(s3_url):
 
 
 def lambda_handler(event, context):
+    warm(s3_client, dynamodb)
     for record in event["Records"]:
         message = json.loads(record["body"])
         for record in message["Records"]:
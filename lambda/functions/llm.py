@@ -9,6 +9,7 @@ from urllib.parse import urlparse
 import boto3
 
 from extractors.mistral import MistralExtractor
+from scraper.lib.lazy import Lazy, warm
 from validators import validate
 
 
@@ -24,9 +25,9 @@ class InvalidBucketException(Exception):
     pass
 
 
-s3_client = boto3.client("s3")
+s3_client = Lazy("s3", lambda: boto3.client("s3"))
 
-extractor = MistralExtractor()
+extractor = Lazy("mistral", MistralExtractor)
 
 
 def download_gz_content(url_str):
@@ -51,6 +52,7 @@ def b64_decode(encoded_value):
 
 
 def lambda_handler(event, context):
+    warm(s3_client, extractor)
     required_params = ["product_url", "crawled_page_url"]
     missing_params = [param for param in required_params if param not in event]
 
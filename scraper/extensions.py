@@ -0,0 +1,56 @@
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+
+class ReactorLag:
+    """Mesure le retard pris par le reactor Twisted.
+
+    Un appel est programmé toutes les REACTOR_LAG_INTERVAL secondes ; l'écart
+    entre l'heure prévue et l'heure effective est le temps pendant lequel le
+    reactor était bloqué par du calcul (parsing, nettoyage, classification).
+    """
+
+    def __init__(self, stats, interval):
+        self.stats = stats
+        self.interval = interval
+        self.call = None
+        self.expected = None
+        self.ticks = 0
+        self.total_lag = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat("REACTOR_LAG_INTERVAL")
+        if not interval:
+            raise NotConfigured
+        ext = cls(crawler.stats, interval)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.schedule()
+
+    def spider_closed(self, spider):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+
+    def schedule(self):
+        # importé ici : importer le module ne doit pas installer le reactor
+        # par défaut avant celui configuré par Scrapy (TWISTED_REACTOR)
+        from twisted.internet import reactor
+
+        self.expected = time.monotonic() + self.interval
+        self.call = reactor.callLater(self.interval, self.tick)
+
+    def tick(self):
+        lag_ms = max(0.0, time.monotonic() - self.expected) * 1000
+        self.ticks += 1
+        self.total_lag += lag_ms
+        self.stats.max_value("reactor/lag_max_ms", round(lag_ms))
+        self.stats.set_value("reactor/lag_mean_ms", round(self.total_lag / self.ticks))
+        if lag_ms > 100:
+            self.stats.inc_value("reactor/lag_over_100ms")
+        self.schedule()
@@ -0,0 +1,122 @@
+import re
+from datetime import UTC, datetime, timedelta
+
+# mots-clés par backend, par ordre de priorité : le premier backend de la
+# liste trouvé dans la page l'emporte
+BACKEND_KEYWORDS = [
+    ("shopify", (b"shopify", b"web-pixels-manager-setup")),
+    ("woocommerce", (b"woocommerce",)),
+    ("prestashop", (b"prestashop",)),
+    ("wix", (b"wix",)),
+    ("bigcartel", (b"bigcartel",)),
+    ("magento", (b"magento",)),
+]
+
+# tous les mots-clés dans une seule alternative, la page n'est lue qu'une fois
+keywords_pattern = re.compile(
+    b"|".join(re.escape(k) for _, keywords in BACKEND_KEYWORDS for k in keywords)
+)
+keyword_backends = {
+    keyword: rank
+    for rank, (_, keywords) in enumerate(BACKEND_KEYWORDS)
+    for keyword in keywords
+}
+
+# <meta name="generator" content="WooCommerce 8.2.1">
+generator_pattern = re.compile(
+    rb"<meta[^>]+name=[\"']generator[\"'][^>]+content=[\"']([^\"']+)",
+    re.IGNORECASE,
+)
+version_pattern = re.compile(rb"\d+(?:\.\d+)+")
+
+
+def sniff_backend(body, limit=64 * 1024):
+    """Détecte le backend d'une boutique sur les `limit` premiers octets.
+
+    Retourne un dictionnaire `backend`, `version` (lue dans la balise meta
+    generator quand elle existe) et `confidence` : 1.0 si le generator
+    confirme le backend, 0.5 sur simple mot-clé, 0.0 pour `Custom`.
+    """
+    head = body[:limit]
+    best = None
+    for match in keywords_pattern.finditer(head):
+        rank = keyword_backends[match[0]]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
+    if best is None:
+        return {"backend": "Custom", "version": None, "confidence": 0.0}
+    backend = BACKEND_KEYWORDS[best][0]
+    detection = {"backend": backend, "version": None, "confidence": 0.5}
+    for generator in generator_pattern.findall(head):
+        if backend.encode() in generator.lower():
+            version = version_pattern.search(generator)
+            detection["version"] = version[0].decode() if version else None
+            detection["confidence"] = 1.0
+            break
+    return detection
+
+
+class BackendRegistry:
+    """Backend détecté pour chaque hôte, conservé d'une session à l'autre.
+
+    Une détection est réutilisée pendant `ttl_days` jours, ce qui évite de
+    télécharger la page d'accueil. Un hôte dispatché depuis le registre dont
+    des requêtes ont échoué (erreur réseau ou réponse hors 2xx) et qui ne
+    produit aucun produit est oublié pour être redétecté à la session
+    suivante ; un hôte sans nouveauté lors d'une session incrémentale est
+    conservé.
+    """
+
+    def __init__(self, state, ttl_days=30):
+        self.state = state
+        self.ttl_days = ttl_days
+        # hôte final (après redirection) -> clé du registre, pour les hôtes
+        # dispatchés depuis le registre pendant la session
+        self.dispatched = {}
+        self.scraped_hosts = set()
+        self.failed_hosts = set()
+
+    def key(self, host):
+        return host.removeprefix("www.")
+
+    def get(self, host):
+        entry = self.state.get(self.key(host))
+        if entry is None:
+            return None
+        detected_at = datetime.fromisoformat(entry["detected_at"])
+        if datetime.now(UTC) - detected_at >= timedelta(days=self.ttl_days):
+            return None
+        return entry
+
+    def dispatching(self, host, entry):
+        """Suit un hôte dispatché depuis le registre jusqu'à la fin de session"""
+        self.dispatched[self.key(entry["host"])] = self.key(host)
+
+    def record(self, host, detection, final_host=None):
+        self.state[self.key(host)] = {
+            **detection,
+            "host": final_host or host,
+            "detected_at": datetime.now(UTC).isoformat(),
+        }
+
+    def scraped(self, host):
+        if host:
+            self.scraped_hosts.add(self.key(host))
+
+    def failed(self, host):
+        if host:
+            self.failed_hosts.add(self.key(host))
+
+    def forget_failed(self):
+        """Oublie les hôtes dispatchés en échec et sans produit, retourne
+        leur nombre"""
+        failed = [
+            key
+            for host, key in self.dispatched.items()
+            if host in self.failed_hosts and host not in self.scraped_hosts
+        ]
+        for key in failed:
+            self.state.pop(key, None)
+        return len(failed)
@@ -0,0 +1,68 @@
+import json
+import logging
+
+import scrapy
+
+from scraper.lib.utils import LazyContent
+
+
+class BigcartelScraper:
+    """Catalogue BigCartel via l'endpoint public /products.json"""
+
+    products_limit = 100
+
+    def __init__(self, stats=None, fanout=4) -> None:
+        """
+        Args:
+            stats: collecteur de stats Scrapy
+            fanout: nombre de pages de /products.json chargées en parallèle
+        """
+        self.stats = stats
+        self.fanout = fanout
+        # ids déjà émis : une boutique qui ignore `page` renvoie toujours la
+        # même liste, la pagination s'arrête dès qu'une page n'apporte rien
+        self.seen = set()
+
+    def start(self, host):
+        for page in range(1, self.fanout + 1):
+            yield self.products_request(host, page)
+
+    def products_request(self, host, page):
+        return scrapy.Request(
+            f"https://{host}/products.json?limit={self.products_limit}&page={page}",
+            callback=self.parse_products,
+            cb_kwargs={"host": host, "page": page},
+        )
+
+    def parse_products(self, response, host, page):
+        try:
+            products = json.loads(response.text)
+        except json.JSONDecodeError as err:
+            logging.error(f"failed to decode response: {response.url}: {err}")
+            return
+        new_products = [p for p in products if p.get("id") not in self.seen]
+        self.seen.update(p.get("id") for p in new_products)
+        for product in new_products:
+            yield self.parse_product(product, host)
+        if self.stats is not None:
+            self.stats.inc_value("bigcartel/products", len(new_products))
+        # chaque page pleine programme la page située une fenêtre plus loin,
+        # de sorte que `fanout` pages restent en vol
+        if len(products) >= self.products_limit and new_products:
+            yield self.products_request(host, page + self.fanout)
+
+    def parse_product(self, product, host):
+        return {
+            "id": f"bigcartel:{host}:{product.get('id')}",
+            "backend": "bigcartel",
+            "content": LazyContent(product.get("description")),
+            "title": product.get("name"),
+            "image_url": product["images"][0].get("url")
+            if product.get("images")
+            else None,
+            "product_url": f"https://{host}{product.get('url')}",
+            "variants": [o["name"] for o in product.get("options") or []],
+            "options": [g["name"] for g in product.get("option_groups") or []],
+            "tags": [],
+            "categories": [c["name"] for c in product.get("categories") or []],
+        }
@@ -0,0 +1,33 @@
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+
+class ExtractionPlan:
+    """Jeu de sélecteurs CSS d'un backend, compilés une seule fois.
+
+    Les sélecteurs (avec les pseudo-éléments `::attr()` et `::text` de
+    Scrapy) sont traduits en XPath compilés à la création du plan, puis
+    évalués sur l'arbre lxml déjà construit par la réponse. `first` donne
+    la première valeur ou None, `all` la liste des valeurs.
+    """
+
+    translator = HTMLTranslator()
+
+    def __init__(self, first=None, all=None):
+        self.first = {k: self.compile(css) for k, css in (first or {}).items()}
+        self.all = {k: self.compile(css) for k, css in (all or {}).items()}
+
+    def compile(self, css):
+        return etree.XPath(self.translator.css_to_xpath(css), smart_strings=False)
+
+    def evaluate(self, root):
+        values = {}
+        for name, xpath in self.first.items():
+            matches = xpath(root)
+            values[name] = matches[0] if matches else None
+        for name, xpath in self.all.items():
+            values[name] = xpath(root)
+        return values
+
+    def __call__(self, response):
+        return self.evaluate(response.selector.root)
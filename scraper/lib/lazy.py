@@ -0,0 +1,52 @@
+import logging
+import os
+import threading
+import time
+
+# STARTUP_PROFILE=1 journalise le temps de création de chaque ressource ;
+# PYTHONPROFILEIMPORTTIME=1 donne en complément le temps d'import par module
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE") is not None
+
+
+class Lazy:
+    """Ressource coûteuse (modèle, client AWS, transport GraphQL) créée au
+    premier accès, une seule fois par processus même entre threads.
+
+    Les attributs sont relayés vers la ressource, de sorte qu'un `Lazy`
+    s'utilise comme l'objet qu'il enveloppe : `s3_client.get_object(...)`.
+    """
+
+    __slots__ = ("factory", "loaded", "lock", "name", "value")
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def get(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    started = time.perf_counter()
+                    self.value = self.factory()
+                    self.loaded = True
+                    if STARTUP_PROFILE:
+                        elapsed = (time.perf_counter() - started) * 1000
+                        logging.warning(
+                            f"startup: {self.name} ready in {elapsed:.0f}ms"
+                        )
+        return self.value
+
+    def __getattr__(self, name):
+        if name in Lazy.__slots__ or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def warm(*resources):
+    """Crée les ressources dès le début de l'invocation plutôt qu'au milieu
+    du traitement ; sans effet pour celles déjà créées dans le conteneur"""
+    for resource in resources:
+        resource.get()
@@ -0,0 +1,175 @@
+import json
+import logging
+from urllib.parse import urlencode
+
+import scrapy
+
+from scraper.lib.utils import LazyContent
+
+
+class MagentoScraper:
+    """Catalogue Magento 2 via l'API GraphQL publique (2.3+), avec repli
+    sur l'API REST quand /graphql n'est pas exposé"""
+
+    graphql_query = """
+    query getProducts($page: Int, $pageSize: Int) {
+      products(filter: { price: { from: "0" } }, pageSize: $pageSize, currentPage: $page) {
+        page_info {
+          total_pages
+        }
+        items {
+          uid
+          sku
+          name
+          url_key
+          url_suffix
+          description {
+            html
+          }
+          small_image {
+            url
+          }
+          categories {
+            name
+          }
+          ... on ConfigurableProduct {
+            configurable_options {
+              label
+            }
+            variants {
+              product {
+                name
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    page_size = 100
+    graphql_unavailable_status = (401, 403, 404)
+
+    def __init__(self, stats=None) -> None:
+        self.stats = stats
+
+    def start(self, host):
+        yield self.graphql_request(host, 1)
+
+    def graphql_request(self, host, page):
+        return scrapy.Request(
+            f"https://{host}/graphql",
+            method="POST",
+            body=json.dumps(
+                {
+                    "query": self.graphql_query,
+                    "variables": {"page": page, "pageSize": self.page_size},
+                }
+            ),
+            headers={"Content-Type": "application/json"},
+            callback=self.parse_graphql,
+            cb_kwargs={"host": host, "page": page},
+            meta={"handle_httpstatus_list": self.graphql_unavailable_status}
+            if page == 1
+            else {},
+        )
+
+    def parse_graphql(self, response, host, page):
+        if response.status in self.graphql_unavailable_status:
+            yield self.rest_request(host, 1)
+            return
+        try:
+            data = json.loads(response.text)
+        except json.JSONDecodeError as err:
+            logging.error(f"failed to decode response: {response.url}: {err}")
+            # une page HTML à la place de /graphql : l'API REST peut rester
+            # disponible
+            if page == 1:
+                yield self.rest_request(host, 1)
+            return
+        products = (data.get("data") or {}).get("products") or {}
+        if not products and page == 1:
+            logging.warning(f"magento: graphql catalogue unavailable: {host}")
+            yield self.rest_request(host, 1)
+            return
+        for item in products.get("items") or []:
+            yield self.parse_product(item, host)
+        # le nombre de pages est connu dès la première : les suivantes
+        # sont demandées en parallèle
+        if page == 1:
+            total_pages = (products.get("page_info") or {}).get("total_pages") or 1
+            for next_page in range(2, total_pages + 1):
+                yield self.graphql_request(host, next_page)
+
+    def parse_product(self, item, host):
+        return {
+            # même clé que l'API REST, qui n'expose pas `uid`
+            "id": f"magento:{host}:{item.get('sku') or item.get('uid')}",
+            "backend": "magento",
+            "content": LazyContent((item.get("description") or {}).get("html")),
+            "title": item.get("name"),
+            "image_url": (item.get("small_image") or {}).get("url"),
+            "product_url": f"https://{host}/{item.get('url_key')}{item.get('url_suffix') or '.html'}",
+            "variants": [
+                v["product"]["name"]
+                for v in item.get("variants") or []
+                if v.get("product")
+            ],
+            "options": [o["label"] for o in item.get("configurable_options") or []],
+            "tags": [],
+            "categories": [c["name"] for c in item.get("categories") or [] if c],
+        }
+
+    def rest_request(self, host, page):
+        query = urlencode(
+            {
+                "searchCriteria[pageSize]": self.page_size,
+                "searchCriteria[currentPage]": page,
+            }
+        )
+        return scrapy.Request(
+            f"https://{host}/rest/V1/products?{query}",
+            callback=self.parse_rest,
+            cb_kwargs={"host": host, "page": page},
+        )
+
+    def parse_rest(self, response, host, page):
+        if self.stats is not None and page == 1:
+            self.stats.inc_value("magento/rest_fallback")
+        try:
+            data = json.loads(response.text)
+        except json.JSONDecodeError as err:
+            logging.error(f"failed to decode response: {response.url}: {err}")
+            return
+        for item in data.get("items") or []:
+            yield self.parse_rest_product(item, host)
+        if page == 1:
+            total_pages = -(-(data.get("total_count") or 0) // self.page_size)
+            for next_page in range(2, total_pages + 1):
+                yield self.rest_request(host, next_page)
+
+    def parse_rest_product(self, item, host):
+        attributes = {
+            a["attribute_code"]: a.get("value")
+            for a in item.get("custom_attributes") or []
+        }
+        image = attributes.get("small_image") or attributes.get("image")
+        return {
+            "id": f"magento:{host}:{item.get('sku')}",
+            "backend": "magento",
+            "content": LazyContent(attributes.get("description")),
+            "title": item.get("name"),
+            "image_url": f"https://{host}/media/catalog/product{image}"
+            if image
+            else None,
+            "product_url": f"https://{host}/{attributes.get('url_key')}.html",
+            "variants": [],
+            "options": [
+                o.get("label")
+                for o in (item.get("extension_attributes") or {}).get(
+                    "configurable_product_options"
+                )
+                or []
+            ],
+            "tags": [],
+            "categories": [],
+        }
@@ -1,52 +1,159 @@
 import json
+import re
 from urllib.parse import urlparse
 import scrapy
 
-from scraper.lib.utils import b64, shrink_html
+from scraper.lib.extraction import ExtractionPlan
+from scraper.lib.structured_data import (
+    breadcrumb_names,
+    find_type,
+    ld_json_objects,
+    structured_item,
+)
+from scraper.lib.utils import LazyContent
+
+
+class PrestaShopFrontier:
+    """Ordonne le crawl par contenu d'une boutique PrestaShop.
+
+    Chaque lien reçoit un score, utilisé comme priorité Scrapy, pour que les
+    pages produits soient visitées avant le reste ; les pages panier/compte
+    ne sont jamais suivies. La profondeur et le nombre de pages sont bornés.
+    """
+
+    # /12-slug.html ou /categorie/12-34-slug.html
+    product_url = re.compile(r"/\d+(-\d+)?-[^/]+\.html$")
+    skipped_url = re.compile(
+        r"/(cart|panier|commande|order|my-account|mon-compte|connexion|login|"
+        r"authentification|authentication|identite|adresse|password|"
+        r"mot-de-passe|historique|guest-tracking|module|index\.php)([/.-]|$)",
+        re.IGNORECASE,
+    )
+    secondary_url = re.compile(
+        r"/(content|blog|actualites|news|contact|nous-contacter|plan-du-site|"
+        r"sitemap|magasins|stores|mentions-legales|cgv|conditions)([/.-]|$)",
+        re.IGNORECASE,
+    )
+    coffee_anchor = re.compile(
+        r"(caf[ée]|coffee|grain|espresso|filtre|origine)", re.IGNORECASE
+    )
+
+    def __init__(self, max_depth=5, max_pages=400):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.seen = set()
+
+    def score(self, url, anchor_text="", from_product=False):
+        """Score d'un lien, None s'il ne doit pas être suivi"""
+        path = urlparse(url).path
+        if self.skipped_url.search(path):
+            return None
+        if self.product_url.search(path):
+            score = 100
+        elif self.secondary_url.search(path):
+            score = -50
+        else:
+            # les catégories peu profondes mènent aux listes de produits
+            score = max(0, 30 - 10 * len([p for p in path.split("/") if p]))
+        if self.coffee_anchor.search(anchor_text or ""):
+            score += 20
+        if from_product:
+            score += 10
+        return score
+
+    def admit(self, url, depth):
+        if depth > self.max_depth or len(self.seen) >= self.max_pages:
+            return False
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        return True
+
+
+class CustomFrontier(PrestaShopFrontier):
+    """Frontière des sites sur mesure : motifs d'URL produit usuels"""
+
+    product_url = re.compile(
+        r"/(produits?|products?|boutique|shop|cafes?|coffees?)/[^/]+/?$",
+        re.IGNORECASE,
+    )
 
 
 class PrestaShopScraper:
-    def __init__(self, _parse_sitemap):
+    # sélecteurs des pages produits 1.6 et 1.7, compilés une seule fois
+    product_plan = ExtractionPlan(
+        first={
+            "data_product": "#product-details::attr(data-product)",
+            "product_id": "#product_page_product_id::attr(value)",
+            "cover": ".product-cover img::attr(src)",
+            "covers": ".product-covers img::attr(src)",
+            "name": ".product_name::text",
+            "body": "body",
+        },
+        all={
+            "ld_json": 'script[type="application/ld+json"]::text',
+            "breadcrumb": ".breadcrumb a::text",
+            "variants": ".product-variants .control-label::text",
+        },
+    )
+
+    def __init__(self, _parse_sitemap, frontier=None):
         self._parse_sitemap = _parse_sitemap
+        self.frontier = frontier or PrestaShopFrontier()
 
     def start(self, host, rules=None, response=None):
         if rules and rules.get("ignore_sitemap"):
-            yield from self.start_content(response)
+            if response is None:
+                # page d'accueil pas encore téléchargée (backend connu) ou
+                # tronquée par la détection
+                yield scrapy.Request(
+                    f"https://{host}/", callback=self.start_content, dont_filter=True
+                )
+            else:
+                yield from self.start_content(response)
         else:
             yield scrapy.Request(
                 f"https://{host}/robots.txt", callback=self._parse_sitemap
             )
 
-    def start_content(self, response):
+    def start_content(self, response, depth=0):
         """Démarre le scraping via le contenu des pages PrestaShop"""
         link_extractor = scrapy.linkextractors.lxmlhtml.LxmlLinkExtractor(
             allow_domains=urlparse(response.url).hostname,
         )
-        yield from self.parse_product(response)
+        items = list(self.parse_product(response))
+        yield from items
         for link in link_extractor.extract_links(response):
+            url = link.url.split("?")[0].split("#")[0]
+            score = self.frontier.score(url, link.text, len(items) > 0)
+            if score is None or not self.frontier.admit(url, depth + 1):
+                continue
             yield scrapy.Request(
-                link.url.split("?")[0].split("#")[0], callback=self.start_content
+                url,
+                callback=self.start_content,
+                cb_kwargs={"depth": depth + 1},
+                priority=score,
             )
 
     def parse_product(self, response):
         """Parse une page produit PrestaShop"""
+        page = self.product_plan(response)
+        product_id = page["product_id"]
         # PS 1.7+ : pas de changement
-        if response.css("#product-details::attr(data-product)").get():
-            raw_json = response.css("#product-details::attr(data-product)").get()
-            data = json.loads(raw_json) if raw_json else {}
+        if page["data_product"]:
+            data = json.loads(page["data_product"])
             yield {
                 "id": "prestashop1.7:"
                 + urlparse(response.url).hostname
                 + ":"
-                + response.css("#product_page_product_id::attr(value)").get(),
+                + product_id,
                 "product_url": data.get("link"),
-                "image_url": response.css(".product-cover img::attr(src)").get()
-                or response.css(".product-covers img::attr(src)").get(),
+                "image_url": page["cover"] or page["covers"],
                 "backend": "prestashop1.7",
                 "title": data.get("name"),
                 "options": [],
                 "categories": [data.get("category_name")],
-                "content": b64(shrink_html(response.css("body").get())),
+                "content": LazyContent(element=page["body"]),
                 "variants": list(
                     [
                         a.get("name")
@@ -60,54 +167,36 @@ class PrestaShopScraper:
             return
 
         # PS 1.6 : vérifie application/ld+json
-        ld_json_raw_all = response.css(
-            'script[type="application/ld+json"]::text'
-        ).getall()
-        ld_json_objs = []
-        for raw in ld_json_raw_all:
-            try:
-                parsed = json.loads(raw)
-                if isinstance(parsed, list):
-                    ld_json_objs.extend(parsed)
-                else:
-                    ld_json_objs.append(parsed)
-            except json.JSONDecodeError:
-                continue
+        ld_json_objs = ld_json_objects(page["ld_json"])
+        product_data = find_type(ld_json_objs, ("Product",))
+        breadcrumb_data = find_type(ld_json_objs, ("BreadcrumbList",))
 
-        product_data = next(
-            (o for o in ld_json_objs if o.get("@type") == "Product"), None
-        )
-        breadcrumb_data = next(
-            (o for o in ld_json_objs if o.get("@type") == "BreadcrumbList"), None
-        )
-
-        if product_data:
-            name = response.css(".product_name::text").get()
+        # l'id PrestaShop distingue une page 1.6 d'un site sur mesure
+        if product_data and product_id:
             if breadcrumb_data and isinstance(
                 breadcrumb_data.get("itemListElement"), list
             ):
-                categories = [
-                    i.get("name")
-                    for i in breadcrumb_data["itemListElement"]
-                    if isinstance(i, dict) and i.get("name")
-                ]
+                categories = breadcrumb_names(breadcrumb_data)
             else:
-                categories = response.css(".breadcrumb a::text").getall()
-                categories = [c.strip() for c in categories if c.strip()]
+                categories = [c.strip() for c in page["breadcrumb"] if c.strip()]
 
             yield {
                 "id": "prestashop1.6:"
                 + urlparse(response.url).hostname
                 + ":"
-                + response.css("#product_page_product_id::attr(value)").get(),
+                + product_id,
                 "product_url": response.url,
-                "image_url": response.css(".product-cover img::attr(src)").get(),
+                "image_url": page["cover"],
                 "backend": "prestashop1.6",
                 "options": [],
-                "title": name,
-                "content": b64(shrink_html(response.css("body").get())),
+                "title": page["name"],
+                "content": LazyContent(element=page["body"]),
                 "categories": categories,
-                "variants": response.css(
-                    ".product-variants .control-label::text"
-                ).getall(),
+                "variants": page["variants"],
             }
+            return
+
+        # autres sites : données structurées schema.org ou OpenGraph
+        item = structured_item(response)
+        if item:
+            yield item
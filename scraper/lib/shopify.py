@@ -1,18 +1,22 @@
+from datetime import UTC, datetime, timedelta
 import json
+import logging
 import scrapy
+from scrapy.utils.defer import maybe_deferred_to_future
 
-from scraper.lib.utils import b64, shrink_html
+from scraper.lib.utils import LazyContent
 
 
 class ShopifyScraper:
     graphql_query = """
-    query getProducts($cursor: String) {
-      products(first: 100, after: $cursor) {
+    query getProducts($cursor: String, $query: String) {
+      products(first: 100, after: $cursor, query: $query) {
         edges {
           node {
             id
             title
             handle
+            updatedAt
             productType
             descriptionHtml
             tags
@@ -49,18 +53,234 @@ class ShopifyScraper:
     }
 """
 
+    # première passe du mode en deux temps : juste de quoi classifier
+    listing_query = """
+    query listProducts($cursor: String, $query: String) {
+      products(first: 250, after: $cursor, query: $query) {
+        edges {
+          node {
+            id
+            title
+            handle
+            updatedAt
+            productType
+            tags
+            category {
+              name
+            }
+            collections(first: 10) {
+              edges {
+                node {
+                  title
+                }
+              }
+            }
+          }
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
+    }
+"""
+
+    details_query = """
+    query getProductDetails($ids: [ID!]!) {
+      nodes(ids: $ids) {
+        ... on Product {
+          id
+          title
+          handle
+          productType
+          descriptionHtml
+          tags
+          images(first: 1) {
+            nodes {
+              url
+            }
+          }
+          category {
+            name
+          }
+          options(first: 10) {
+            name
+          }
+          variants(first: 10) {
+            nodes {
+              title
+            }
+          }
+          collections(first: 10) {
+            edges {
+              node {
+                title
+              }
+            }
+          }
+        }
+      }
+    }
+"""
+
+    # délai initial entre deux pages d'une même boutique, ajusté ensuite
+    # d'après le throttleStatus renvoyé par l'API Storefront
+    start_delay = 1.0
+    details_batch_size = 50
+    products_json_limit = 250
+    # statuts indiquant que l'API Storefront n'est pas accessible
+    storefront_unavailable_status = (401, 403, 404)
+
+    def __init__(
+        self,
+        state=None,
+        stats=None,
+        full_sync_days=7,
+        classifier=None,
+        products_json_fanout=4,
+    ):
+        """
+        Args:
+            state: état persistant par hôte (high-water mark `updatedAt`),
+                None pour toujours parcourir tout le catalogue
+            stats: collecteur de stats Scrapy
+            full_sync_days: intervalle entre deux synchronisations complètes
+            classifier: classifieur exposant `predict_deferred` (EnrichItem)
+                utilisé pour ne récupérer le détail que des produits prédits
+                `roasted-beans`, None pour tout récupérer en une seule passe
+            products_json_fanout: nombre de pages de /products.json chargées
+                en parallèle quand l'API Storefront n'est pas disponible
+        """
+        self.state = state
+        self.stats = stats
+        self.full_sync_days = full_sync_days
+        self.classifier = classifier
+        self.products_json_fanout = products_json_fanout
+        # mode en deux temps : lots de détail en cours par hôte, le
+        # high-water mark n'est enregistré qu'une fois tous traités
+        self.details_pending = {}
+
     def start(self, host):
-        url = f"https://{host}/api/2025-07/graphql.json"
-        payload = {"query": self.graphql_query, "variables": {"cursor": None}}
-        yield scrapy.Request(
-            url,
+        yield self.graphql_request(host, None, self.start_delay, self.start_sync(host))
+
+    def start_sync(self, host):
+        """Décide entre synchronisation complète et incrémentale pour un hôte"""
+        sync = {"since": None, "updated_at": None, "count": 0}
+        host_state = (self.state or {}).get(host, {})
+        if not host_state.get("full_sync_at"):
+            return sync
+        full_sync_at = datetime.fromisoformat(host_state["full_sync_at"])
+        if datetime.now(UTC) - full_sync_at < timedelta(days=self.full_sync_days):
+            sync["since"] = host_state.get("updated_at")
+        return sync
+
+    def finish_sync(self, host, sync):
+        """Enregistre le high-water mark une fois la pagination terminée"""
+        if self.state is None:
+            return
+        host_state = self.state.get(host, {})
+        if sync["since"] is None:
+            host_state["full_sync_at"] = datetime.now(UTC).isoformat()
+            host_state["product_count"] = sync["count"]
+        elif self.stats is not None:
+            # approximatif : les produits supprimés depuis la dernière
+            # synchronisation complète sont comptés comme ignorés
+            self.stats.inc_value(
+                "shopify/products_skipped",
+                max(host_state.get("product_count", 0) - sync["count"], 0),
+            )
+        host_state["updated_at"] = max(
+            filter(None, [sync["updated_at"], host_state.get("updated_at")]),
+            default=None,
+        )
+        self.state[host] = host_state
+
+    def graphql_request(self, host, cursor, delay, sync):
+        payload = {
+            "query": self.listing_query if self.classifier else self.graphql_query,
+            "variables": {
+                "cursor": cursor,
+                "query": f"updated_at:>'{sync['since']}'" if sync["since"] else None,
+            },
+        }
+        return scrapy.Request(
+            f"https://{host}/api/2025-07/graphql.json",
             method="POST",
             body=json.dumps(payload),
             headers={"Content-Type": "application/json"},
-            callback=self.parse_shopify_products,
-            cb_kwargs={"host": host},
-            meta={"download_slot": "shopify"},
+            callback=self.parse_shopify_listing
+            if self.classifier
+            else self.parse_shopify_products,
+            cb_kwargs={"host": host, "delay": delay, "sync": sync},
+            meta={
+                "download_slot": f"shopify:{host}",
+                "shopify_delay": delay,
+                # seule la première page peut déclencher le repli
+                "handle_httpstatus_list": self.storefront_unavailable_status
+                if cursor is None
+                else [],
+            },
+        )
+
+    def products_json_request(self, host, page):
+        return scrapy.Request(
+            f"https://{host}/products.json?limit={self.products_json_limit}&page={page}",
+            callback=self.parse_products_json,
+            cb_kwargs={"host": host, "page": page},
+            meta={"download_slot": f"shopify:{host}", "shopify_delay": 0},
+        )
+
+    def start_products_json(self, host):
+        """Repli sur /products.json quand l'API Storefront est indisponible"""
+        logging.warning(
+            f"shopify: storefront API unavailable, using products.json: {host}"
         )
+        if self.stats is not None:
+            self.stats.inc_value("shopify/products_json_fallback")
+        for page in range(1, self.products_json_fanout + 1):
+            yield self.products_json_request(host, page)
+
+    def parse_products_json(self, response, host, page):
+        products = json.loads(response.text).get("products", [])
+        for product in products:
+            tags = product.get("tags") or []
+            if isinstance(tags, str):
+                tags = [t.strip() for t in tags.split(",") if t.strip()]
+            yield {
+                "id": f"gid://shopify/Product/{product.get('id')}",
+                "backend": "shopify",
+                "content": LazyContent(product.get("body_html")),
+                "title": product.get("title"),
+                "image_url": product["images"][0].get("src")
+                if product.get("images")
+                else None,
+                "product_url": f"https://{host}/products/{product.get('handle')}",
+                "variants": [v["title"] for v in product.get("variants") or []],
+                "options": [o["name"] for o in product.get("options") or []],
+                "tags": tags,
+                "categories": [product.get("product_type")]
+                if product.get("product_type")
+                else [],
+            }
+        # chaque page pleine programme la page située une fenêtre plus loin,
+        # de sorte que `products_json_fanout` pages restent en vol
+        if len(products) >= self.products_json_limit:
+            yield self.products_json_request(host, page + self.products_json_fanout)
+
+    def throttle_delay(self, data, delay):
+        """Calcule le délai avant la page suivante à partir du coût de la requête"""
+        cost = data.get("extensions", {}).get("cost", {})
+        status = cost.get("throttleStatus")
+        if not status:
+            return delay / 2
+        requested = cost.get("requestedQueryCost", 0)
+        available = status.get("currentlyAvailable", 0)
+        restore_rate = status.get("restoreRate") or 1
+        # on garde de quoi payer la page suivante sans attendre
+        missing = 2 * requested - available
+        if missing <= 0:
+            return delay / 2
+        return missing / restore_rate
 
     def parse_product(self, response, host):
         for edge in response.get("edges", []):
@@ -68,7 +288,7 @@ class ShopifyScraper:
             yield {
                 "id": node.get("id"),
                 "backend": "shopify",
-                "content": b64(shrink_html(node.get("descriptionHtml"))),
+                "content": LazyContent(node.get("descriptionHtml")),
                 "title": node.get("title"),
                 "image_url": list(
                     [c["url"] for c in node.get("images", {}).get("nodes", [])]
@@ -105,22 +325,136 @@ class ShopifyScraper:
                 ],
             }
 
-    def parse_shopify_products(self, response, host):
-        data = json.loads(response.text)
-        products_data = data.get("data", {}).get("products", {})
-        yield from self.parse_product(products_data, host)
-        if products_data.get("pageInfo", {}).get("hasNextPage"):
-            payload = {
-                "query": self.graphql_query,
-                "variables": {
-                    "cursor": products_data.get("pageInfo", {}).get("endCursor")
-                },
-            }
+    def details_requests(self, products, predictions, host, delay):
+        """Demande le détail des seuls produits prédits comme du café en grains"""
+        ids = [
+            product["id"]
+            for product, prediction in zip(products, predictions)
+            if prediction == "roasted-beans"
+        ]
+        if self.stats is not None:
+            self.stats.inc_value("shopify/products_filtered", len(products) - len(ids))
+        pending = self.details_pending.setdefault(
+            host, {"batches": 0, "failed": False, "sync": None}
+        )
+        for i in range(0, len(ids), self.details_batch_size):
+            pending["batches"] += 1
             yield scrapy.Request(
                 f"https://{host}/api/2025-07/graphql.json",
                 method="POST",
-                body=json.dumps(payload),
+                body=json.dumps(
+                    {
+                        "query": self.details_query,
+                        "variables": {"ids": ids[i : i + self.details_batch_size]},
+                    }
+                ),
                 headers={"Content-Type": "application/json"},
-                callback=self.parse_shopify_products,
+                callback=self.parse_shopify_product_details,
+                errback=self.details_failed,
                 cb_kwargs={"host": host},
+                meta={"download_slot": f"shopify:{host}", "shopify_delay": delay},
+            )
+
+    def parse_shopify_product_details(self, response, host):
+        data = json.loads(response.text)
+        nodes = data.get("data", {}).get("nodes", [])
+        yield from self.parse_product(
+            {"edges": [{"node": node} for node in nodes if node]}, host
+        )
+        self.details_done(host, failed=bool(data.get("errors")))
+
+    def details_failed(self, failure):
+        host = failure.request.cb_kwargs["host"]
+        logging.warning(f"shopify: product details failed: {host}: {failure.value!r}")
+        self.details_done(host, failed=True)
+
+    def details_done(self, host, failed=False):
+        pending = self.details_pending.get(host)
+        if pending is None:
+            return
+        pending["batches"] -= 1
+        pending["failed"] = pending["failed"] or failed
+        self.finish_details(host)
+
+    def finish_details(self, host):
+        """Enregistre le high-water mark du mode en deux temps une fois le
+        listing terminé et le dernier lot de détail traité"""
+        pending = self.details_pending.get(host)
+        if pending is None or pending["sync"] is None or pending["batches"] > 0:
+            return
+        del self.details_pending[host]
+        if pending["failed"]:
+            logging.warning(
+                f"shopify: incomplete product details, sync not recorded: {host}"
+            )
+        else:
+            self.finish_sync(host, pending["sync"])
+
+    def parse_shopify_products(self, response, host, delay=None, sync=None):
+        if response.status in self.storefront_unavailable_status:
+            yield from self.start_products_json(host)
+            return
+        data = json.loads(response.text)
+        products_data = data.get("data", {}).get("products", {})
+        delay = self.start_delay if delay is None else delay
+        yield from self.parse_product(products_data, host)
+        yield from self.next_page(data, products_data, host, delay, sync)
+
+    async def parse_shopify_listing(self, response, host, delay=None, sync=None):
+        """Première passe du mode en deux temps : la classification passe par
+        le classifieur (pool de CPU_OFFLOAD), pas par le thread du reactor"""
+        if response.status in self.storefront_unavailable_status:
+            for request in self.start_products_json(host):
+                yield request
+            return
+        data = json.loads(response.text)
+        products_data = data.get("data", {}).get("products", {})
+        delay = self.start_delay if delay is None else delay
+        products = list(self.parse_product(products_data, host))
+        predictions = await maybe_deferred_to_future(
+            self.classifier.predict_deferred(products)
+        )
+        for request in self.details_requests(products, predictions, host, delay):
+            yield request
+        for request in self.next_page(data, products_data, host, delay, sync):
+            yield request
+
+    def next_page(self, data, products_data, host, delay, sync):
+        """Compte la page reçue puis demande la suivante ou termine la
+        synchronisation"""
+        edges = products_data.get("edges", [])
+        sync = sync or {"since": None, "updated_at": None, "count": 0}
+        sync = {
+            **sync,
+            "count": sync["count"] + len(edges),
+            "updated_at": max(
+                filter(
+                    None,
+                    [sync["updated_at"]]
+                    + [e.get("node", {}).get("updatedAt") for e in edges],
+                ),
+                default=None,
+            ),
+        }
+        page_info = products_data.get("pageInfo")
+        if data.get("errors") or not page_info:
+            # page en erreur (quota épuisé…) : le catalogue n'a pas été
+            # parcouru jusqu'au bout, l'état de synchronisation est conservé
+            logging.warning(f"shopify: listing interrupted, sync not recorded: {host}")
+            if self.stats is not None:
+                self.stats.inc_value("shopify/listing_errors")
+            return
+        if page_info.get("hasNextPage"):
+            yield self.graphql_request(
+                host,
+                page_info.get("endCursor"),
+                self.throttle_delay(data, delay),
+                sync,
             )
+        elif self.classifier:
+            self.details_pending.setdefault(
+                host, {"batches": 0, "failed": False, "sync": None}
+            )["sync"] = sync
+            self.finish_details(host)
+        else:
+            self.finish_sync(host, sync)
@@ -0,0 +1,211 @@
+import gzip
+import hashlib
+import io
+import logging
+import re
+from datetime import UTC, datetime, timedelta
+from urllib.parse import urlparse
+
+from lxml import etree
+
+
+class SitemapTooLarge(ValueError):
+    pass
+
+
+class SizeLimitedReader:
+    """Flux décompressé interrompu au-delà de `max_size` octets (0 pour ne
+    pas limiter), comme le fait SitemapSpider avec DOWNLOAD_MAXSIZE"""
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size=-1):
+        if self.max_size:
+            remaining = self.max_size - self.size + 1
+            size = remaining if size < 0 else min(size, remaining)
+        data = self.stream.read(size)
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            raise SitemapTooLarge(self.max_size)
+        return data
+
+
+def iter_sitemap(body, max_size=0):
+    """Parcourt un sitemap (éventuellement gzippé) sans le charger en entier.
+
+    Produit un dictionnaire par entrée, `kind` valant `sitemap` pour les
+    entrées d'un index et `url` pour celles d'un urlset. Les éléments sont
+    libérés au fur et à mesure, seul le corps compressé reste en mémoire.
+    La décompression s'arrête au-delà de `max_size` octets (0 pour ne pas
+    limiter).
+    """
+    stream = io.BytesIO(body)
+    if body[:2] == b"\x1f\x8b":
+        stream = SizeLimitedReader(gzip.GzipFile(fileobj=stream), max_size)
+    try:
+        for _, element in etree.iterparse(
+            stream,
+            events=("end",),
+            tag=("{*}sitemap", "{*}url"),
+            resolve_entities=False,
+            no_network=True,
+            recover=True,
+        ):
+            loc = element.findtext("{*}loc")
+            if loc:
+                yield {
+                    "kind": etree.QName(element).localname,
+                    "loc": loc.strip(),
+                    "lastmod": (element.findtext("{*}lastmod") or "").strip() or None,
+                }
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except SitemapTooLarge:
+        logging.warning(f"sitemap larger than {max_size} bytes once decompressed")
+    except (etree.XMLSyntaxError, OSError, EOFError):
+        # sitemap tronqué ou invalide : on garde les entrées déjà lues
+        return
+
+
+class SitemapFilter:
+    """Ne garde que les pages produits et une seule langue par boutique.
+
+    Chaque hôte est associé à la frontière de son backend (motifs
+    `product_url`, `secondary_url`, `skipped_url`, cf. PrestaShopFrontier).
+    Si aucune URL d'un sitemap ne correspond au motif produit (URLs réécrites
+    autrement), on garde tout sauf les pages secondaires plutôt que de perdre
+    la boutique, dans la limite de pages de la frontière (`admit`).
+    """
+
+    # PrestaShop (gsitemap) : 1_fr_0_sitemap.xml
+    language = re.compile(r"_([a-z]{2})_\d+_sitemap", re.IGNORECASE)
+    preferred_language = "fr"
+
+    def __init__(self):
+        self.matchers = {}
+        self.languages = {}
+
+    def register(self, host, matcher):
+        self.matchers[host] = matcher
+
+    def keep_sitemaps(self, localized):
+        """Sous-sitemaps d'une seule langue par hôte : le français s'il est
+        proposé, sinon la langue déjà retenue ou la première rencontrée"""
+        by_host = {}
+        for host, language, entry in localized:
+            by_host.setdefault(host, []).append((language, entry))
+        for host, sitemaps in by_host.items():
+            languages = [language for language, _ in sitemaps]
+            if self.preferred_language in languages:
+                kept = self.preferred_language
+            elif self.languages.get(host) in languages:
+                kept = self.languages[host]
+            else:
+                kept = languages[0]
+            self.languages[host] = kept
+            yield from (entry for language, entry in sitemaps if language == kept)
+
+    def __call__(self, entries):
+        rejected = []
+        localized = []
+        matched = False
+        for entry in entries:
+            url = urlparse(entry["loc"])
+            if entry["kind"] == "sitemap":
+                language = self.language.search(url.path)
+                if language is None:
+                    yield entry
+                else:
+                    localized.append((url.hostname, language[1].lower(), entry))
+                continue
+            matcher = self.matchers.get(url.hostname)
+            if matcher is None or matcher.product_url.search(url.path):
+                matched = True
+                yield entry
+            elif not matched:
+                rejected.append((entry, matcher))
+        # la langue n'est choisie qu'une fois l'index entièrement lu
+        yield from self.keep_sitemaps(localized)
+        if not matched:
+            for entry, matcher in rejected:
+                path = urlparse(entry["loc"]).path
+                secondary = matcher.secondary_url.search(path)
+                if (
+                    not secondary
+                    and not matcher.skipped_url.search(path)
+                    and matcher.admit(entry["loc"], 0)
+                ):
+                    yield entry
+
+
+class LastmodStore:
+    """Dernier `lastmod` récupéré avec succès pour chaque URL de sitemap.
+
+    Les URLs sont stockées sous forme d'empreinte courte dans l'état de
+    crawl. Une entrée dont le lastmod n'a pas changé est ignorée, sauf lors
+    du rafraîchissement complet imposé tous les `full_refresh_days` jours,
+    à l'issue duquel les URLs qui ne figurent plus dans les sitemaps sont
+    oubliées (`prune`).
+    """
+
+    def __init__(self, state, full_refresh_days=7):
+        self.state = state
+        self.full_refresh_days = full_refresh_days
+        # hôte -> rafraîchissement complet en cours pour cette session
+        self.refreshing = {}
+        # hôte -> empreintes des URLs listées pendant son rafraîchissement
+        self.seen = {}
+
+    def key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+    def host_state(self, host):
+        return self.state.setdefault(host, {"urls": {}})
+
+    def is_refreshing(self, host):
+        if host not in self.refreshing:
+            host_state = self.host_state(host)
+            now = datetime.now(UTC)
+            refreshed_at = host_state.get("full_refresh_at")
+            self.refreshing[host] = (
+                refreshed_at is None
+                or now - datetime.fromisoformat(refreshed_at)
+                >= timedelta(days=self.full_refresh_days)
+            )
+            if self.refreshing[host]:
+                host_state["full_refresh_at"] = now.isoformat()
+        return self.refreshing[host]
+
+    def unchanged(self, entry):
+        if not entry.get("lastmod"):
+            return False
+        host = urlparse(entry["loc"]).hostname
+        if self.is_refreshing(host):
+            self.seen.setdefault(host, set()).add(self.key(entry["loc"]))
+            return False
+        urls = self.host_state(host)["urls"]
+        return urls.get(self.key(entry["loc"])) == entry["lastmod"]
+
+    def fetched(self, url, lastmod):
+        if lastmod:
+            host = urlparse(url).hostname
+            self.host_state(host)["urls"][self.key(url)] = lastmod
+
+    def prune(self):
+        """Oublie les URLs des hôtes rafraîchis qui n'ont pas été revues
+        dans leurs sitemaps ; à n'appeler qu'après une session complète.
+        Renvoie le nombre d'entrées supprimées"""
+        pruned = 0
+        for host, refreshing in self.refreshing.items():
+            if not refreshing:
+                continue
+            seen = self.seen.get(host, set())
+            urls = self.host_state(host)["urls"]
+            for key in [key for key in urls if key not in seen]:
+                del urls[key]
+                pruned += 1
+        return pruned
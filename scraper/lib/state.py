@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+
+
+class CrawlState:
+    """État conservé d'une session de crawl à l'autre.
+
+    Chaque espace de noms est un dictionnaire JSON stocké dans
+    `<directory>/<namespace>.json`. Sans répertoire, l'état reste en mémoire.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.namespaces = {}
+
+    def path(self, namespace):
+        return os.path.join(self.directory, f"{namespace}.json")
+
+    def get(self, namespace):
+        if namespace not in self.namespaces:
+            self.namespaces[namespace] = self.load(namespace)
+        return self.namespaces[namespace]
+
+    def load(self, namespace):
+        if not self.directory or not os.path.exists(self.path(namespace)):
+            return {}
+        try:
+            with open(self.path(namespace), "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as err:
+            logging.error(f"failed to load crawl state {namespace}: {err}")
+            return {}
+
+    def save(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for namespace, data in self.namespaces.items():
+            tmp_path = self.path(namespace) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path(namespace))
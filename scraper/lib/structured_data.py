@@ -0,0 +1,198 @@
+import json
+from urllib.parse import urlparse
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from scraper.lib.utils import LazyContent
+
+PRODUCT_TYPES = ("Product", "ProductGroup")
+
+
+def ld_json_objects(scripts):
+    """Objets des balises application/ld+json, listes et @graph aplatis"""
+    objects = []
+    for raw in scripts:
+        try:
+            parsed = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        pending = parsed if isinstance(parsed, list) else [parsed]
+        while pending:
+            obj = pending.pop(0)
+            if not isinstance(obj, dict):
+                continue
+            objects.append(obj)
+            if isinstance(obj.get("@graph"), list):
+                pending.extend(obj["@graph"])
+    return objects
+
+
+def has_type(obj, types):
+    obj_type = obj.get("@type")
+    if isinstance(obj_type, list):
+        return any(t in types for t in obj_type)
+    return obj_type in types
+
+
+def find_type(objects, types):
+    return next((o for o in objects if has_type(o, types)), None)
+
+
+def breadcrumb_names(breadcrumb):
+    """Noms des éléments d'un BreadcrumbList JSON-LD"""
+    if not breadcrumb or not isinstance(breadcrumb.get("itemListElement"), list):
+        return []
+    names = []
+    for element in breadcrumb["itemListElement"]:
+        if not isinstance(element, dict):
+            continue
+        item = element.get("item")
+        name = element.get("name") or (
+            item.get("name") if isinstance(item, dict) else None
+        )
+        if name:
+            names.append(name)
+    return names
+
+
+def first_text(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value if isinstance(value, str) else None
+
+
+def first_url(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get("url") or value.get("contentUrl")
+    return value if isinstance(value, str) else None
+
+
+def microdata_value(element):
+    if element.get("content") is not None:
+        return element.get("content")
+    if element.tag in ("img", "source"):
+        return element.get("src")
+    if element.tag in ("a", "link"):
+        return element.get("href")
+    return element.text_content().strip()
+
+
+def microdata_scope(scope):
+    """Propriétés d'un itemscope, les itemscopes imbriqués sous forme de dict"""
+    properties = {}
+    for element in scope.iterdescendants():
+        prop = element.get("itemprop")
+        if prop is None:
+            continue
+        # propriété d'un itemscope imbriqué : traitée avec celui-ci
+        parent = element.getparent()
+        while parent is not scope and parent.get("itemscope") is None:
+            parent = parent.getparent()
+        if parent is not scope:
+            continue
+        if element.get("itemscope") is not None:
+            value = microdata_scope(element)
+        else:
+            value = microdata_value(element)
+        properties.setdefault(prop, []).append(value)
+    return {k: v[0] if len(v) == 1 else v for k, v in properties.items()}
+
+
+def microdata_objects(tree, type_name):
+    return [
+        microdata_scope(scope)
+        for scope in tree.xpath(
+            f'//*[@itemscope][contains(@itemtype, "schema.org/{type_name}")]'
+        )
+    ]
+
+
+def opengraph(tree):
+    return {
+        meta.get("property"): meta.get("content")
+        for meta in tree.xpath('//meta[starts-with(@property, "og:")]')
+    }
+
+
+def product_variants(product):
+    """Noms des variantes (ProductGroup.hasVariant ou offres nommées)"""
+    candidates = product.get("hasVariant") or product.get("offers") or []
+    if isinstance(candidates, dict):
+        candidates = candidates.get("offers") or [candidates]
+    if not isinstance(candidates, list):
+        return []
+    names = [c.get("name") for c in candidates if isinstance(c, dict)]
+    return [n for n in dict.fromkeys(names) if n and n != product.get("name")]
+
+
+def extract_structured_data(body, encoding="utf-8"):
+    """Produit et fil d'Ariane schema.org d'une page HTML brute"""
+    try:
+        tree = lxml_html.document_fromstring(
+            body, parser=lxml_html.HTMLParser(encoding=encoding)
+        )
+    except (etree.ParserError, ValueError):
+        return None
+    return structured_data(tree)
+
+
+def structured_data(tree):
+    """Produit et fil d'Ariane schema.org d'un arbre lxml déjà construit.
+
+    Les sources sont essayées dans l'ordre JSON-LD, microdata puis
+    OpenGraph ; OpenGraph complète aussi le nom et l'image manquants.
+    Retourne None si la page ne décrit pas de produit.
+    """
+    objects = ld_json_objects(
+        tree.xpath('//script[@type="application/ld+json"]/text()')
+    )
+    product = find_type(objects, PRODUCT_TYPES)
+    breadcrumbs = breadcrumb_names(find_type(objects, ("BreadcrumbList",)))
+    if product is None:
+        product = next(iter(microdata_objects(tree, "Product")), None)
+    if not breadcrumbs:
+        for breadcrumb in microdata_objects(tree, "BreadcrumbList"):
+            elements = breadcrumb.get("itemListElement") or []
+            if isinstance(elements, dict):
+                elements = [elements]
+            breadcrumbs = breadcrumb_names({"itemListElement": elements})
+    og = opengraph(tree)
+    if product is None:
+        if og.get("og:type") not in ("product", "og:product", "product.item"):
+            return None
+        product = {}
+    product = {
+        **product,
+        "name": first_text(product.get("name")) or og.get("og:title"),
+        "image": first_url(product.get("image")) or og.get("og:image"),
+    }
+    return {
+        "product": product,
+        "breadcrumbs": breadcrumbs,
+        "body": tree.find("body"),
+    }
+
+
+def structured_item(response):
+    """Item générique construit depuis les données structurées de la page"""
+    data = structured_data(response.selector.root)
+    if data is None or not data["product"].get("name"):
+        return None
+    product = data["product"]
+    url = urlparse(response.url)
+    sku = first_text(product.get("sku")) or first_text(product.get("productID"))
+    return {
+        "id": f"custom:{url.hostname}:{sku or url.path}",
+        "product_url": response.url,
+        "image_url": response.urljoin(product["image"]) if product["image"] else None,
+        "backend": "custom",
+        "title": product["name"],
+        "options": [],
+        "categories": data["breadcrumbs"],
+        "content": LazyContent(element=data["body"]),
+        "variants": product_variants(product),
+        "tags": [],
+    }
@@ -1,6 +1,7 @@
 import base64
+import re
 
-from bs4 import BeautifulSoup
+from lxml import etree
 
 
 def b64(value):
@@ -9,15 +10,248 @@ def b64(value):
     return result
 
 
+# rendu de str(BeautifulSoup(html, "lxml")), formatter "minimal"
+SHRINK_DROPPED_TAGS = {"style", "svg"}
+VOID_TAGS = {
+    "area",
+    "base",
+    "basefont",
+    "bgsound",
+    "br",
+    "col",
+    "command",
+    "embed",
+    "frame",
+    "hr",
+    "image",
+    "img",
+    "input",
+    "isindex",
+    "keygen",
+    "link",
+    "menuitem",
+    "meta",
+    "nextid",
+    "param",
+    "source",
+    "spacer",
+    "track",
+    "wbr",
+}
+CDATA_TAGS = {"script", "style"}
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+# attributs multi-valués, dont les espaces sont normalisés
+LIST_ATTRIBUTES = {"*": {"class", "accesskey", "dropzone"}}
+LIST_ATTRIBUTES.update(
+    (tag, LIST_ATTRIBUTES["*"] | attributes)
+    for tag, attributes in {
+        "a": {"rel", "rev"},
+        "link": {"rel", "rev"},
+        "td": {"headers"},
+        "th": {"headers"},
+        "form": {"accept-charset"},
+        "object": {"archive"},
+        "area": {"rel"},
+        "icon": {"sizes"},
+        "iframe": {"sandbox"},
+        "output": {"for"},
+    }.items()
+)
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+CHARSET_RE = re.compile(r"((^|;)\s*charset=)([^;]*)", re.MULTILINE)
+XML_ENTITIES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+XML_ENTITIES_RE = re.compile("[&<>]")
+
+
+def escape_xml(value):
+    return XML_ENTITIES_RE.sub(lambda m: XML_ENTITIES[m[0]], value)
+
+
+def quote_attribute(value):
+    if '"' not in value:
+        return '"' + value + '"'
+    if "'" not in value:
+        return "'" + value + "'"
+    return '"' + value.replace('"', "&quot;") + '"'
+
+
+class ShrinkTarget:
+    """Cible de parseur lxml qui sérialise au fil des événements.
+
+    Les sous-arbres style/svg sont ignorés dès leur ouverture et aucun
+    arbre n'est construit. La sortie reproduit celle de BeautifulSoup :
+    attributs triés, `<br/>` pour les éléments vides, chaînes d'espaces
+    réduites à un espace ou un saut de ligne hors pre/textarea, charset des
+    balises meta réécrit en utf-8.
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self.pending = []
+        # (tag, index du morceau d'ouverture)
+        self.stack = []
+        self.skipping = 0
+        self.preserving = 0
+
+    def flush(self, prefix="", suffix="", raw=True):
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if not self.preserving and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if not raw and not (self.stack and self.stack[-1][0] in CDATA_TAGS):
+            data = escape_xml(data)
+        self.pieces.append(prefix + data + suffix)
+
+    def attributes(self, tag, attrib):
+        if not attrib:
+            return ""
+        attrib = dict(attrib)
+        if tag == "meta":
+            if "charset" in attrib:
+                attrib["charset"] = "utf-8"
+            elif "content" in attrib and (
+                attrib.get("http-equiv", "").lower() == "content-type"
+            ):
+                attrib["content"] = CHARSET_RE.sub(
+                    lambda m: m[1] + "utf-8", attrib["content"]
+                )
+        list_attributes = LIST_ATTRIBUTES.get(tag, LIST_ATTRIBUTES["*"])
+        rendered = []
+        for key, value in sorted(attrib.items()):
+            if key in list_attributes:
+                value = " ".join(value.split())
+            rendered.append(" " + key + "=" + quote_attribute(escape_xml(value)))
+        return "".join(rendered)
+
+    def start(self, tag, attrib, nsmap=None):
+        if self.skipping:
+            self.skipping += 1
+            return
+        self.flush(raw=False)
+        if tag in SHRINK_DROPPED_TAGS:
+            self.skipping = 1
+            return
+        self.stack.append((tag, len(self.pieces)))
+        self.pieces.append("<" + tag + self.attributes(tag, attrib) + ">")
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserving += 1
+
+    def end(self, tag):
+        if self.skipping:
+            self.skipping -= 1
+            return
+        self.flush(raw=False)
+        tag, index = self.stack.pop()
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserving -= 1
+        if tag in VOID_TAGS and index == len(self.pieces) - 1:
+            self.pieces[index] = self.pieces[index][:-1] + "/>"
+        else:
+            self.pieces.append("</" + tag + ">")
+
+    def data(self, data):
+        if not self.skipping:
+            self.pending.append(data)
+
+    def comment(self, text):
+        if not self.skipping:
+            self.flush(raw=False)
+            self.pending.append(text)
+            self.flush("<!--", "-->")
+
+    def doctype(self, name, pubid, system):
+        self.flush(raw=False)
+        value = name or ""
+        if pubid is not None:
+            value += f' PUBLIC "{pubid}"'
+            if system is not None:
+                value += f' "{system}"'
+        elif system is not None:
+            value += f' SYSTEM "{system}"'
+        self.pending.append(value)
+        self.flush("<!DOCTYPE ", ">\n")
+
+    def pi(self, target, data):
+        if not self.skipping:
+            self.flush(raw=False)
+            self.pending.append(target + " " + data)
+            self.flush("<?", ">")
+
+    def close(self):
+        self.flush(raw=False)
+        return "".join(self.pieces)
+
+
 def shrink_html(html):
+    """Retire les balises style et svg d'un fragment HTML.
+
+    Le HTML est sérialisé pendant le parsing (cf. ShrinkTarget), avec une
+    sortie identique à celle de BeautifulSoup sans en construire l'arbre.
+    """
     if not html or len(html) == 0:
-        return ''
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup.find_all(
-        [
-            "style",
-            "svg",
-        ]
-    ):
-        tag.extract()
-    return str(soup)
+        return ""
+    parser = etree.HTMLParser(target=ShrinkTarget(), recover=True)
+    try:
+        parser.feed(html)
+        return parser.close()
+    except etree.XMLSyntaxError:
+        # document vide (espaces seulement)
+        return ""
+
+
+def shrink_element(element):
+    """shrink_html pour un élément lxml déjà parsé, laissé intact.
+
+    Les événements de l'arbre sont rejoués dans ShrinkTarget : la sortie
+    est celle de shrink_html sur le HTML de l'élément, sans le sérialiser
+    ni le re-parser. Seule différence, équivalente en HTML : lxml donne aux
+    attributs booléens leur nom pour valeur (`disabled="disabled"` plutôt
+    que `disabled=""`).
+    """
+    if element is None:
+        return ""
+    target = ShrinkTarget()
+    # un fragment est replacé dans html/body, comme au parsing
+    wrappers = {"html": [], "body": ["html"]}.get(element.tag, ["html", "body"])
+    for tag in wrappers:
+        target.start(tag, {})
+    events = ("start", "end", "comment", "pi")
+    for event, node in etree.iterwalk(element, events=events):
+        if event == "start":
+            target.start(node.tag, node.attrib)
+            if node.text:
+                target.data(node.text)
+            continue
+        if event == "end":
+            target.end(node.tag)
+        elif event == "comment":
+            target.comment(node.text or "")
+        else:
+            target.pi(node.target, node.text or "")
+        if node.tail and node is not element:
+            target.data(node.tail)
+    for tag in reversed(wrappers):
+        target.end(tag)
+    return target.close()
+
+
+class LazyContent:
+    """Contenu HTML d'un item, nettoyé et encodé en base64 à la demande.
+
+    Les scrapers le placent dans `content` sans rien calculer ; EnrichItem
+    le résout, dans le pool de calcul quand CPU_OFFLOAD est activé.
+    `element` est un élément lxml déjà parsé (cf. shrink_element).
+    """
+
+    __slots__ = ("element", "html")
+
+    def __init__(self, html=None, element=None):
+        self.html = html
+        self.element = element
+
+    def resolve(self):
+        if self.element is not None:
+            return b64(shrink_element(self.element))
+        return b64(shrink_html(self.html))
@@ -1,122 +1,468 @@
+from datetime import UTC, datetime, timedelta
 import json
 import logging
+import sys
 import scrapy
+from pydantic import ValidationError
 
-from scraper.lib.utils import b64, shrink_html
+from scraper.lib.utils import LazyContent
 from scraper.lib.woocommerce_model import (
-    Product,
-    ProductCategory,
-    ProductMedia,
-    ProductTag,
+    media_page,
+    product_page,
+    store_product_page,
+    term_page,
 )
 
 
 class WoocommerceScraper:
-    categories_map = {}
-    medias_map = {}
-    tags_map = {}
+    # champs de l'API Store utilisés pour construire un item
+    store_fields = (
+        "id,name,permalink,short_description,description,images,categories,"
+        "tags,attributes,variations"
+    )
 
-    def __init__(self, host) -> None:
+    def __init__(self, host, stats=None, state=None, full_sync_days=7) -> None:
+        """
+        Args:
+            host: boutique à parcourir
+            stats: collecteur de stats Scrapy
+            state: état persistant par hôte (dernier `modified_gmt` vu et
+                tables de termes), None pour toujours tout parcourir
+            full_sync_days: intervalle entre deux synchronisations complètes
+        """
         self.host = host
+        self.stats = stats
+        self.state = state
+        self.full_sync_days = full_sync_days
+        self.modified_after = None
+        # tables id -> nom propres à l'hôte, libérées une fois les produits
+        # construits ; les noms sont internés car très répétés
+        self.categories_map = {}
+        self.medias_map = {}
+        self.tags_map = {}
+        # requêtes en vol par endpoint, finished_cb est appelé à zéro
+        self.pending_pages = {}
+        self.pending_lookups = 0
+        self.pending_includes = 0
+        self.products = []
+        # pages produit en vol : le high-water mark n'avance qu'une fois
+        # toutes chargées
+        self.pending_products = 0
+        self.products_failed = False
+        self.products_modified = []
 
-    def paginate_type(
-        self, response, base_url, item_cb, finished_cb, page=1, per_page=100
+    def page_request(
+        self, base_url, item_cb, finished_cb, offset, per_page, follow, decoder=None
     ):
-        # logging.error("{}: page={}".format(base_url, page))
-        if response is not None:
-            try:
-                data = json.loads(response.text)
-                if data:
-                    yield from [item_cb(x) for x in data]
-                if not data or len(data) == 0 or len(data) < per_page:
-                    if finished_cb:
-                        yield from finished_cb()
-                    return
-
-            except json.JSONDecodeError as err:
-                if len(response.text) == 0 and per_page >= 5:
-                    logging.warning(
-                        f"server returned an empty page: reducing per_page size to {per_page / 2}"
-                    )
-                    yield scrapy.Request(
-                        url=f"{base_url}?page={page - 1}&per_page={per_page / 2}",
-                        callback=self.paginate_type,
-                        cb_kwargs={
-                            "base_url": base_url,
-                            "item_cb": item_cb,
-                            "finished_cb": finished_cb,
-                            "page": page,
-                            "per_page": per_page / 2,
-                        },
-                    )
-                else:
-                    logging.error(
-                        f"failed to decode response: {base_url} status={response.status}: {err}"
-                    )
-                return
-        yield scrapy.Request(
-            url=f"{base_url}?page={page}&per_page={per_page}",
+        separator = "&" if "?" in base_url else "?"
+        return scrapy.Request(
+            url=f"{base_url}{separator}offset={offset}&per_page={per_page}",
             callback=self.paginate_type,
+            errback=self.page_failed,
             cb_kwargs={
                 "base_url": base_url,
                 "item_cb": item_cb,
                 "finished_cb": finished_cb,
-                "page": page + 1,
+                "offset": offset,
                 "per_page": per_page,
+                "follow": follow,
+                "decoder": decoder,
             },
         )
 
-    def add_category(self, item):
-        category = ProductCategory.from_json(item)
-        self.categories_map[category.id] = category.name
+    def page_done(self, base_url, finished_cb, requests):
+        self.pending_pages[base_url] += len(requests) - 1
+        yield from requests
+        if self.pending_pages[base_url] == 0 and finished_cb:
+            yield from finished_cb()
+
+    def page_failed(self, failure):
+        kwargs = failure.request.cb_kwargs
+        logging.error(f"failed to load page: {failure.request.url}: {failure.value}")
+        yield from self.page_done(kwargs["base_url"], kwargs["finished_cb"], [])
+
+    def paginate_type(
+        self,
+        response,
+        base_url,
+        item_cb,
+        finished_cb,
+        offset=0,
+        per_page=100,
+        follow=True,
+        decoder=None,
+    ):
+        """Pagine un endpoint WP REST.
+
+        La première réponse donne le nombre total d'enregistrements
+        (`X-WP-Total`) : toutes les pages restantes sont alors demandées d'un
+        coup. Sans cet en-tête, les pages sont chargées l'une après l'autre.
+        Seule une requête `follow` peut programmer des pages supplémentaires.
+        `decoder` (TypeAdapter) valide la page entière en un appel, item_cb
+        reçoit alors des modèles au lieu de dictionnaires.
+        """
+        if response is None:
+            self.pending_pages[base_url] = 1
+            yield self.page_request(
+                base_url, item_cb, finished_cb, offset, per_page, follow, decoder
+            )
+            return
+        try:
+            if decoder is not None:
+                data = decoder.validate_json(response.body)
+            else:
+                data = json.loads(response.text)
+        except (json.JSONDecodeError, ValidationError) as err:
+            if len(response.text) == 0 and per_page >= 5:
+                logging.warning(
+                    f"server returned an empty page: reducing per_page size to {per_page // 2}"
+                )
+                # per_page impair : la seconde moitié prend l'enregistrement
+                # restant
+                half = per_page // 2
+                yield from self.page_done(
+                    base_url,
+                    finished_cb,
+                    [
+                        self.page_request(
+                            base_url, item_cb, finished_cb, offset, half, False, decoder
+                        ),
+                        self.page_request(
+                            base_url,
+                            item_cb,
+                            finished_cb,
+                            offset + half,
+                            per_page - half,
+                            follow,
+                            decoder,
+                        ),
+                    ],
+                )
+            else:
+                logging.error(
+                    f"failed to decode response: {base_url} status={response.status}: {err}"
+                )
+                yield from self.page_done(base_url, finished_cb, [])
+            return
+
+        if data:
+            yield from [item_cb(x) for x in data]
+        total = response.headers.get("X-WP-Total")
+        next_offsets = []
+        if follow and total is not None:
+            next_offsets = range(offset + per_page, int(total), per_page)
+        elif follow and data and len(data) >= per_page:
+            next_offsets = [offset + per_page]
+        yield from self.page_done(
+            base_url,
+            finished_cb,
+            [
+                self.page_request(
+                    base_url,
+                    item_cb,
+                    finished_cb,
+                    next_offset,
+                    per_page,
+                    # en séquentiel, la page suivante poursuit la pagination
+                    total is None,
+                    decoder,
+                )
+                for next_offset in next_offsets
+            ],
+        )
+
+    def add_category(self, category):
+        self.categories_map[category.id] = sys.intern(category.name)
+
+    def add_tag(self, tag):
+        self.tags_map[tag.id] = sys.intern(tag.name)
+
+    def add_media(self, media):
+        self.medias_map[media.id] = media.guid.rendered
 
-    def add_tag(self, item):
-        tag = ProductTag.from_json(item)
-        self.tags_map[tag.id] = tag.name
+    def lookup_size(self):
+        """Taille approximative en octets des tables de l'hôte"""
+        maps = (self.categories_map, self.tags_map, self.medias_map)
+        strings = {id(v): v for m in maps for v in m.values()}
+        return sum(sys.getsizeof(m) for m in maps) + sum(
+            sys.getsizeof(v) for v in strings.values()
+        )
 
-    def add_media(self, item):
-        tag = ProductMedia.from_json(item)
-        self.medias_map[tag.id] = tag.guid.rendered
+    def release_lookups(self):
+        if self.stats is not None:
+            self.stats.max_value(
+                f"woocommerce/lookup_peak_bytes/{self.host}", self.lookup_size()
+            )
+        self.categories_map = {}
+        self.medias_map = {}
+        self.tags_map = {}
 
     def start(self):
+        """Démarre par l'API Store, qui renvoie des produits complets"""
+        base_url = f"https://{self.host}/wp-json/wc/store/v1/products?_fields={self.store_fields}"
+        request = self.page_request(
+            base_url, self.parse_store_product, None, 0, 100, True, store_product_page
+        )
+        # toute réponse hors 2xx ou erreur réseau mène au repli sur l'API REST
+        yield request.replace(
+            callback=self.parse_store_products,
+            errback=self.store_failed,
+            meta={"handle_httpstatus_all": True},
+        )
+
+    def parse_store_products(self, response, **kwargs):
+        """Première page de l'API Store, repli sur l'API REST si indisponible"""
+        try:
+            available = 200 <= response.status < 300 and isinstance(
+                json.loads(response.text), list
+            )
+        except json.JSONDecodeError:
+            available = False
+        if not available:
+            logging.warning(
+                f"woocommerce: store API unavailable (status={response.status}), using REST API: {self.host}"
+            )
+            yield from self.start_rest()
+            return
+        self.pending_pages[kwargs["base_url"]] = 1
+        yield from self.paginate_type(response, **kwargs)
+
+    def store_failed(self, failure):
+        logging.warning(
+            f"woocommerce: store API failed ({failure.value}), using REST API: {self.host}"
+        )
+        yield from self.start_rest()
+
+    def legacy_id(self, product_id):
+        """Identifiant des items de l'API Store.
+
+        Les items WooCommerce ont toujours eu pour id le guid WordPress lu
+        par l'API REST (`guid.rendered`, où `&` est échappé en `&#038;`), et
+        EnrichItem en dérive l'id stocké : l'API Store, qui n'expose pas le
+        guid, le reconstruit à l'identique pour que les produits déjà
+        exportés ne soient pas dupliqués. Seuls les guid créés sous un autre
+        domaine (site migré) diffèrent.
+        """
+        return f"https://{self.host}/?post_type=product&#038;p={product_id}"
+
+    def parse_store_product(self, product):
+        return {
+            "backend": "woocommerce",
+            "id": self.legacy_id(product.id),
+            "title": product.name,
+            "product_url": product.permalink,
+            "image_url": product.images[0].src if product.images else None,
+            "categories": [c.name for c in product.categories],
+            "tags": [t.name for t in product.tags],
+            "options": [
+                a.taxonomy.removeprefix("pa_") for a in product.attributes if a.taxonomy
+            ],
+            "variants": [
+                " / ".join(a.value for a in v.attributes)
+                for v in product.variations
+                if v.attributes
+            ],
+            # résumé et description complète, comme sur la page produit
+            "content": LazyContent(product.short_description + product.description),
+        }
+
+    def incremental_since(self, host_state):
+        """Date passée à `modified_after`, None pour une synchronisation complète"""
+        if not host_state.get("full_sync_at") or not host_state.get("modified_gmt"):
+            return None
+        full_sync_at = datetime.fromisoformat(host_state["full_sync_at"])
+        if datetime.now(UTC) - full_sync_at >= timedelta(days=self.full_sync_days):
+            return None
+        # modified_after est interprété dans le fuseau du site : une marge
+        # d'un jour couvre tous les décalages
+        since = datetime.fromisoformat(host_state["modified_gmt"]) - timedelta(days=1)
+        return since.isoformat()
+
+    def start_rest(self):
+        """Charge catégories, tags et liste des produits en parallèle"""
+        host_state = (self.state or {}).get(self.host, {})
+        self.modified_after = self.incremental_since(host_state)
+        if self.modified_after:
+            # seuls les produits modifiés sont listés, les termes connus sont
+            # repris de l'état et les inconnus chargés à la demande
+            self.categories_map = {
+                int(k): sys.intern(v) for k, v in host_state["categories"].items()
+            }
+            self.tags_map = {
+                int(k): sys.intern(v) for k, v in host_state["tags"].items()
+            }
+            self.pending_lookups = 1
+            yield from self.paginate_type(
+                None,
+                f"https://{self.host}/wp-json/wp/v2/product?modified_after={self.modified_after}&orderby=modified",
+                self.add_product,
+                self.lookup_loaded,
+                decoder=product_page,
+            )
+            return
+        self.pending_lookups = 3
         yield from self.paginate_type(
             None,
             f"https://{self.host}/wp-json/wp/v2/product_cat",
             self.add_category,
-            self.start_tags,
+            self.lookup_loaded,
+            decoder=term_page,
         )
-
-    def start_tags(self):
         yield from self.paginate_type(
             None,
             f"https://{self.host}/wp-json/wp/v2/product_tag",
             self.add_tag,
-            self.start_medias,
+            self.lookup_loaded,
+            decoder=term_page,
         )
-
-    def start_medias(self):
         yield from self.paginate_type(
             None,
-            f"https://{self.host}/wp-json/wp/v2/media",
-            self.add_media,
-            self.start_products,
+            f"https://{self.host}/wp-json/wp/v2/product",
+            self.add_product,
+            self.lookup_loaded,
+            decoder=product_page,
         )
 
-    def start_products(self):
-        yield from self.paginate_type(
-            None, f"https://{self.host}/wp-json/wp/v2/product", self.parse_product, None
+    def add_product(self, product):
+        self.products.append(product)
+
+    def lookup_loaded(self):
+        self.pending_lookups -= 1
+        if self.pending_lookups == 0:
+            yield from self.start_includes()
+
+    def featured_media_id(self, product):
+        if product.featured_media:
+            return product.featured_media
+        # https://<host>/wp-json/wp/v2/media/<id>
+        for link in product.links.wp_featuredmedia or []:
+            media_id = link.href.rstrip("/").rsplit("/", 1)[-1]
+            if media_id.isdigit():
+                return int(media_id)
+        return None
+
+    def include_requests(self, endpoint, ids, fields, decoder, item_cb):
+        ids = sorted(ids)
+        for i in range(0, len(ids), 100):
+            yield scrapy.Request(
+                url=f"https://{self.host}/wp-json/wp/v2/{endpoint}?include={','.join(map(str, ids[i : i + 100]))}&_fields={fields}&per_page=100",
+                callback=self.add_included,
+                errback=self.include_failed,
+                cb_kwargs={"decoder": decoder, "item_cb": item_cb},
+            )
+
+    def start_includes(self):
+        """Résout uniquement les médias et termes référencés par les produits"""
+        medias = {self.featured_media_id(p) for p in self.products}
+        categories = {c for p in self.products for c in p.product_cat}
+        tags = {t for p in self.products for t in p.product_tag}
+        requests = [
+            *self.include_requests(
+                "media",
+                {m for m in medias if m and m not in self.medias_map},
+                "id,guid",
+                media_page,
+                self.add_media,
+            ),
+            *self.include_requests(
+                "product_cat",
+                categories - self.categories_map.keys(),
+                "id,name",
+                term_page,
+                self.add_category,
+            ),
+            *self.include_requests(
+                "product_tag",
+                tags - self.tags_map.keys(),
+                "id,name",
+                term_page,
+                self.add_tag,
+            ),
+        ]
+        self.pending_includes = len(requests)
+        yield from requests
+        if not requests:
+            yield from self.start_products()
+
+    def add_included(self, response, decoder, item_cb):
+        try:
+            for item in decoder.validate_json(response.body):
+                item_cb(item)
+        except ValidationError as err:
+            logging.error(f"failed to decode response: {response.url}: {err}")
+        yield from self.includes_loaded()
+
+    def include_failed(self, failure):
+        logging.error(f"failed to load page: {failure.request.url}: {failure.value}")
+        yield from self.includes_loaded()
+
+    def includes_loaded(self):
+        self.pending_includes -= 1
+        if self.pending_includes == 0:
+            yield from self.start_products()
+
+    def save_terms(self):
+        """Enregistre les tables de termes, reprises en synchronisation
+        incrémentale"""
+        if self.state is None:
+            return
+        host_state = self.state.get(self.host, {})
+        host_state["categories"] = {str(k): v for k, v in self.categories_map.items()}
+        host_state["tags"] = {str(k): v for k, v in self.tags_map.items()}
+        self.state[self.host] = host_state
+
+    def finish_sync(self):
+        """Enregistre le dernier `modified_gmt` vu, une fois toutes les pages
+        produit chargées"""
+        if self.stats is not None and self.modified_after:
+            self.stats.inc_value(
+                "woocommerce/products_modified", len(self.products_modified)
+            )
+        if self.state is None:
+            return
+        if self.products_failed:
+            logging.warning(
+                f"woocommerce: product pages failed, sync not recorded: {self.host}"
+            )
+            return
+        host_state = self.state.get(self.host, {})
+        host_state["modified_gmt"] = max(
+            filter(None, self.products_modified + [host_state.get("modified_gmt")]),
+            default=None,
         )
+        if not self.modified_after:
+            host_state["full_sync_at"] = datetime.now(UTC).isoformat()
+        self.state[self.host] = host_state
+
+    def start_products(self):
+        products, self.products = self.products, []
+        self.save_terms()
+        self.products_modified = [p.modified_gmt for p in products]
+        self.pending_products = len(products)
+        for product in products:
+            yield self.parse_product(product)
+        self.release_lookups()
+        if not products:
+            self.finish_sync()
+
+    def product_done(self):
+        self.pending_products -= 1
+        if self.pending_products == 0:
+            self.finish_sync()
+
+    def product_failed(self, failure):
+        logging.error(f"failed to load page: {failure.request.url}: {failure.value}")
+        self.products_failed = True
+        self.product_done()
 
-    def parse_product(self, data):
-        product = Product.from_json(data)
+    def parse_product(self, product):
         item = {
             "backend": "woocommerce",
         }
         item["id"] = product.guid.rendered
         item["title"] = product.title.rendered
         item["product_url"] = product.link
-        image = product.featured_media or product.links.wp_featuredmedia
-        item["image_url"] = self.medias_map.get(image)
+        item["image_url"] = self.medias_map.get(self.featured_media_id(product))
 
         if product.product_cat:
             item["categories"] = [
@@ -139,6 +485,7 @@ class WoocommerceScraper:
         return scrapy.Request(
             url=item["product_url"],
             callback=self.load_product_options,
+            errback=self.product_failed,
             cb_kwargs={
                 "product": item,
             },
@@ -147,7 +494,8 @@ class WoocommerceScraper:
     def load_product_options(self, response, product):
         options = response.css('[id^="pa_"]::attr(id)').getall()
         yield {
-            "content": b64(shrink_html(response.css("body").get())),
+            "content": LazyContent(response.css("body").get()),
             "options": list([e.removeprefix("pa_") for e in options]),
             **product,
         }
+        self.product_done()
@@ -1,5 +1,5 @@
-from typing import List, Dict, Optional, Any
-from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class Link(BaseModel):
@@ -11,48 +11,7 @@ class Link(BaseModel):
     taxonomy: Optional[str] = None
 
 
-class Links(BaseModel):
-    self_: List[Link] = Field(..., alias="self")
-    collection: List[Link]
-    about: List[Link]
-    curies: List[Link]
-    # champs optionnels selon le type
-    wp_post_type: Optional[List[Link]] = Field(None, alias="wp:post_type")
-    up: Optional[List[Link]] = None
-    replies: Optional[List[Link]] = None
-    wp_featuredmedia: Optional[List[Link]] = Field(None, alias="wp:featuredmedia")
-    wp_attachment: Optional[List[Link]] = Field(None, alias="wp:attachment")
-    wp_term: Optional[List[Link]] = Field(None, alias="wp:term")
-
-
-# --------- ProductTag ---------
-class ProductTag(BaseModel):
-    id: int
-    count: int
-    description: str
-    link: str
-    name: str
-    slug: str
-    taxonomy: str
-    links: Links = Field(..., alias="_links")
-
-    class Config:
-        validate_by_name = True
-        populate_by_name = True
-
-    @staticmethod
-    def from_json(data: str | dict) -> "ProductTag":
-        import json
-
-        if isinstance(data, str):
-            data = json.loads(data)
-        return ProductTag(**data)
-
-    def to_json(self, **kwargs) -> str:
-        return self.model_dump_json(by_alias=True, **kwargs)
-
-
-# --------- Product ---------
+# --------- WP REST (/wp-json/wp/v2) ---------
 class RenderedText(BaseModel):
     rendered: str
     protected: Optional[bool] = None
@@ -62,85 +21,79 @@ class Guid(BaseModel):
     rendered: str
 
 
-class Product(BaseModel):
+class ProductMedia(BaseModel):
     id: int
-    date: str
-    date_gmt: str
     guid: Guid
-    modified: str
-    modified_gmt: str
-    slug: str
-    status: str
-    type: str
-    link: str
-    title: RenderedText
-    content: RenderedText
-    excerpt: RenderedText
-    featured_media: Optional[int] = None
-    product_brand: List[Any] = []
-    product_cat: List[int] = []
-    product_tag: List[int] = []
-    links: Links = Field(..., alias="_links")
 
-    class Config:
-        validate_by_name = True
-        populate_by_name = True
 
-    @staticmethod
-    def from_json(data: str | dict) -> "Product":
-        import json
+# --------- Store API (/wp-json/wc/store/v1/products) ---------
+class StoreImage(BaseModel):
+    id: int
+    src: str
 
-        if isinstance(data, str):
-            data = json.loads(data)
-        return Product(**data)
 
-    def to_json(self, **kwargs) -> str:
-        return self.model_dump_json(by_alias=True, **kwargs)
+class StoreTerm(BaseModel):
+    id: int
+    name: str
 
 
-# --------- ProductCategory ---------
-class ProductCategory(BaseModel):
+class StoreAttribute(BaseModel):
     id: int
-    count: int
-    description: str
-    link: str
     name: str
-    slug: str
-    taxonomy: str
-    parent: int
-    links: Links = Field(..., alias="_links")
+    taxonomy: Optional[str] = None
 
-    class Config:
-        validate_by_name = True
-        populate_by_name = True
 
-    @staticmethod
-    def from_json(data: str | dict) -> "ProductCategory":
-        import json
+class StoreVariationAttribute(BaseModel):
+    name: str
+    value: str
 
-        if isinstance(data, str):
-            data = json.loads(data)
-        return ProductCategory(**data)
 
-    def to_json(self, **kwargs) -> str:
-        return self.model_dump_json(by_alias=True, **kwargs)
+class StoreVariation(BaseModel):
+    id: int
+    attributes: List[StoreVariationAttribute] = []
 
 
-class ProductMedia(BaseModel):
+class StoreProduct(BaseModel):
     id: int
-    guid: Guid
+    name: str
+    permalink: str
+    short_description: str = ""
+    description: str = ""
+    images: List[StoreImage] = []
+    categories: List[StoreTerm] = []
+    tags: List[StoreTerm] = []
+    attributes: List[StoreAttribute] = []
+    variations: List[StoreVariation] = []
+
+
+# --------- Décodage rapide des pages ---------
+# Modèles réduits aux champs lus par WoocommerceScraper : les champs absents
+# (dont la quasi-totalité de `_links`) sont ignorés sans être validés, et une
+# page entière est validée en un appel depuis les octets de la réponse.
+class FeaturedMediaLinks(BaseModel):
+    wp_featuredmedia: Optional[List[Link]] = Field(None, alias="wp:featuredmedia")
 
-    class Config:
-        validate_by_name = True
-        populate_by_name = True
 
-    @staticmethod
-    def from_json(data: str | dict) -> "ProductMedia":
-        import json
+class TermSummary(BaseModel):
+    id: int
+    name: str
+
+
+class ProductSummary(BaseModel):
+    id: int
+    guid: Guid
+    modified_gmt: str
+    link: str
+    title: RenderedText
+    featured_media: Optional[int] = None
+    product_cat: List[int] = []
+    product_tag: List[int] = []
+    links: FeaturedMediaLinks = Field(
+        default_factory=FeaturedMediaLinks, alias="_links"
+    )
 
-        if isinstance(data, str):
-            data = json.loads(data)
-        return ProductMedia(**data)
 
-    def to_json(self, **kwargs) -> str:
-        return self.model_dump_json(by_alias=True, **kwargs)
+term_page = TypeAdapter(List[TermSummary])
+media_page = TypeAdapter(List[ProductMedia])
+product_page = TypeAdapter(List[ProductSummary])
+store_product_page = TypeAdapter(List[StoreProduct])
@@ -3,6 +3,9 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+from urllib.parse import urlparse
+
 from scrapy import signals
 
 
@@ -95,3 +98,74 @@ class ScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class ShopifyThrottleMiddleware:
+    """Applique par boutique le délai calculé par ShopifyScraper.
+
+    Chaque boutique Shopify a son propre download slot (`shopify:<host>`), le
+    délai porté par `meta["shopify_delay"]` est reporté sur ce slot avant
+    l'envoi. Une réponse 429 est rejouée après le délai indiqué par
+    `Retry-After`.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.max_delay = crawler.settings.getfloat("SHOPIFY_THROTTLE_MAX_DELAY")
+        self.retry_times = crawler.settings.getint("SHOPIFY_THROTTLE_RETRY_TIMES")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def get_slot(self, request):
+        downloader = self.crawler.engine.downloader
+        return downloader.slots.get(downloader.get_slot_key(request))
+
+    def process_request(self, request, spider):
+        if "shopify_delay" not in request.meta:
+            return
+        slot = self.get_slot(request)
+        if slot is not None:
+            slot.delay = min(max(request.meta["shopify_delay"], 0), self.max_delay)
+
+    def process_response(self, request, response, spider):
+        if response.status != 429 or "shopify_delay" not in request.meta:
+            return response
+        retries = request.meta.get("shopify_throttle_retries", 0)
+        if retries >= self.retry_times:
+            logging.warning(
+                f"shopify: giving up after {retries} retries: {request.url}"
+            )
+            return response
+        try:
+            delay = float(response.headers.get("Retry-After", b""))
+        except ValueError:
+            delay = max(request.meta["shopify_delay"] * 2, 1)
+        logging.info(f"shopify: throttled, retrying in {delay}s: {request.url}")
+        return request.replace(
+            dont_filter=True,
+            meta={
+                **request.meta,
+                "shopify_delay": delay,
+                "shopify_throttle_retries": retries + 1,
+            },
+        )
+
+
+class BackendFailureMiddleware:
+    """Signale au registre des backends les hôtes dont une requête échoue
+    (erreur réseau ou réponse hors 2xx) après les nouvelles tentatives."""
+
+    def process_response(self, request, response, spider):
+        if not 200 <= response.status < 300:
+            self.failed(request, spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.failed(request, spider)
+
+    def failed(self, request, spider):
+        registry = getattr(spider, "backend_registry", None)
+        if registry is not None:
+            registry.failed(urlparse(request.url).hostname)
@@ -1,9 +1,16 @@
 import hashlib
 import json
 import os
+import threading
 from urllib.parse import urlparse
 from scrapy.exceptions import DropItem
+from twisted.internet import defer
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
 from classifier.train import ProductClassifier
+from scraper.lib.lazy import Lazy, warm
+from scraper.lib.utils import LazyContent
 
 
 def md5(*values):
@@ -11,8 +18,95 @@ def md5(*values):
 
 
 class EnrichItem:
-    model = ProductClassifier()
+    """Classifie les produits et finalise les items.
+
+    Les items sont classifiés par lots : ils sont retenus jusqu'à en avoir
+    ENRICH_BATCH_SIZE ou pendant ENRICH_BATCH_DELAY secondes, puis prédits
+    en un seul appel à nlp.pipe avant d'être relâchés ou écartés. Les
+    règles par site (classifier/rules) tranchent d'abord, seuls les produits
+    qu'elles ne classent pas passent par le modèle.
+
+    Avec CPU_OFFLOAD, la prédiction et le nettoyage du contenu (LazyContent)
+    tournent dans un pool de threads pour ne pas bloquer le reactor ; au
+    plus CPU_OFFLOAD_MAX_PENDING tâches (items ou lots) y sont en attente,
+    les items suivants restent dans le slot du scraper Scrapy, qui ralentit
+    alors le crawl.
+    """
+
+    # chargé au premier usage : les crawls avec DISABLE_PREDICTIONS
+    # n'importent ni spaCy ni le modèle
+    model = Lazy("product classifier", ProductClassifier)
+    # le modèle spaCy n'est pas garanti thread-safe : toutes les prédictions,
+    # y compris le tri en amont de Shopify, passent par ce verrou
+    model_lock = threading.Lock()
     run_predictions = os.getenv("DISABLE_PREDICTIONS") is None
+    # pool du pipeline ouvert, partagé avec le tri en amont de Shopify
+    offload_pool = None
+
+    def __init__(
+        self, stats=None, threads=0, max_pending=100, batch_size=1, batch_delay=0
+    ):
+        self.stats = stats
+        self.pool = ThreadPool(1, threads, "EnrichItem") if threads > 0 else None
+        self.pending = defer.DeferredSemaphore(max_pending)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # items en attente de classification, avec le Deferred rendu à Scrapy
+        self.batch = []
+        self.flush_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            stats=crawler.stats,
+            threads=settings.getint("CPU_OFFLOAD_THREADS")
+            if settings.getbool("CPU_OFFLOAD")
+            else 0,
+            max_pending=settings.getint("CPU_OFFLOAD_MAX_PENDING", 100),
+            batch_size=settings.getint("ENRICH_BATCH_SIZE", 1),
+            batch_delay=settings.getfloat("ENRICH_BATCH_DELAY"),
+        )
+
+    @classmethod
+    def predict(cls, products):
+        with cls.model_lock:
+            return cls.model.predict(products)
+
+    @classmethod
+    def predict_deferred(cls, products):
+        """Comme `predict`, mais hors du thread du reactor quand CPU_OFFLOAD
+        est actif"""
+        if cls.offload_pool is None:
+            return defer.maybeDeferred(cls.predict, products)
+        from twisted.internet import reactor
+
+        return deferToThreadPool(reactor, cls.offload_pool, cls.predict, products)
+
+    def open_spider(self, spider):
+        if self.run_predictions:
+            warm(self.model)
+            # statistiques propres à cette session
+            self.model.reset_stats()
+            # cache des prédictions conservé avec l'état du crawl
+            state = getattr(spider, "state", None)
+            if state is not None and self.model.cache is not None:
+                self.model.cache.attach(state.get("predictions"))
+        if self.pool is not None:
+            self.pool.start()
+            EnrichItem.offload_pool = self.pool
+
+    def close_spider(self, spider):
+        self.flush(spider)
+        if self.pool is not None:
+            EnrichItem.offload_pool = None
+            self.pool.stop()
+        if self.run_predictions:
+            if self.model.cache is not None:
+                self.model.cache.trim()
+            if self.stats is not None:
+                for key, value in self.model.usage_stats().items():
+                    self.stats.set_value(key, value)
 
     def validate_list(self, item, key):
         if key not in item:
@@ -20,10 +114,81 @@ class EnrichItem:
         return {key: list([c for c in item[key] if c and len(c) > 0])}
 
     def process_item(self, item, spider):
+        if self.run_predictions and self.batch_size > 1:
+            d = defer.Deferred()
+            self.batch.append((item, d))
+            if len(self.batch) >= self.batch_size:
+                self.flush(spider)
+            elif self.flush_call is None:
+                from twisted.internet import reactor
+
+                self.flush_call = reactor.callLater(
+                    self.batch_delay, self.flush, spider
+                )
+            return d
+        if self.pool is None:
+            return self.enrich(item, spider)
+        return self.offload(self.enrich, item, spider)
+
+    def offload(self, f, *args):
+        if self.stats is not None:
+            self.stats.inc_value("enrich/offloaded")
+            pending = (
+                self.pending.limit - self.pending.tokens + len(self.pending.waiting)
+            )
+            self.stats.max_value("enrich/pending_max", pending + 1)
+        # importé ici : importer le module ne doit pas installer le reactor
+        # par défaut avant celui configuré par Scrapy (TWISTED_REACTOR)
+        from twisted.internet import reactor
+
+        return self.pending.run(deferToThreadPool, reactor, self.pool, f, *args)
+
+    def flush(self, spider):
+        """Classifie le lot en attente et rend chaque item à Scrapy"""
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        items = [item for item, _ in batch]
+        if self.pool is None:
+            d = defer.maybeDeferred(self.enrich_batch, items, spider)
+        else:
+            d = self.offload(self.enrich_batch, items, spider)
+
+        def release(results):
+            for (_, item_d), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    item_d.errback(Failure(result))
+                else:
+                    item_d.callback(result)
+
+        def fail(failure):
+            for _, item_d in batch:
+                item_d.errback(failure)
+
+        d.addCallbacks(release, fail)
+
+    def enrich_batch(self, items, spider):
+        """Items finalisés, ou l'exception levée pour chacun (DropItem des
+        produits écartés, erreur d'un item mal formé) : un item en erreur
+        n'entraîne pas les autres items du lot"""
+        results = []
+        for item, predicted_category in zip(items, self.predict(items)):
+            try:
+                results.append(self.enrich(item, spider, predicted_category))
+            except (DropItem, KeyError, TypeError, ValueError) as err:
+                results.append(err)
+        return results
+
+    def enrich(self, item, spider, predicted_category=None):
         host = urlparse(item["product_url"]).hostname
-        predicted_category = "_unknown"
-        if self.run_predictions:
-            predicted_category = self.model.predict([item])[0]
+        if not self.run_predictions:
+            predicted_category = "_unknown"
+        else:
+            if predicted_category is None:
+                predicted_category = self.predict([item])[0]
             if predicted_category != "roasted-beans":
                 raise DropItem("not roasted bean")
         out = {
@@ -37,6 +202,9 @@ class EnrichItem:
             **self.validate_list(item, "options"),
             **self.validate_list(item, "tags"),
         }
+        # le contenu n'est nettoyé que pour les produits conservés
+        if isinstance(out.get("content"), LazyContent):
+            out["content"] = out["content"].resolve()
 
         if "image_url" in out and out["image_url"] is not None:
             out["image_urls"] = [item["image_url"]]
@@ -46,15 +46,20 @@ DEFAULT_REQUEST_HEADERS = {
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "scraper.middlewares.ScraperDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    "scraper.middlewares.ShopifyThrottleMiddleware": 560,
+    # après RetryMiddleware (550) : seuls les échecs définitifs sont vus
+    "scraper.middlewares.BackendFailureMiddleware": 500,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-# }
+EXTENSIONS = {
+    "scraper.extensions.ReactorLag": 0,
+}
+
+# Période de mesure du retard du reactor (0 désactive ReactorLag)
+REACTOR_LAG_INTERVAL = 0.1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -102,9 +107,44 @@ DOWNLOAD_TIMEOUT = 15
 RETRY_TIMES = 1
 STATS_DUMP = False
 DEFAULT_DROPITEM_LOG_LEVEL = "DEBUG"
-DOWNLOAD_SLOTS = {
-    "shopify": {"concurrency": 1, "delay": 2, "randomize_delay": True},
-}
+SHOPIFY_THROTTLE_MAX_DELAY = 30
+SHOPIFY_THROTTLE_RETRY_TIMES = 3
+# Shopify : nombre de jours entre deux synchronisations complètes, les
+# sessions intermédiaires ne récupèrent que les produits modifiés
+SHOPIFY_FULL_SYNC_DAYS = 7
+# Shopify : liste légère classifiée d'abord, détail (descriptionHtml...)
+# seulement pour les produits prédits `roasted-beans`
+SHOPIFY_TWO_PHASE = True
+# Shopify : pages de /products.json chargées en parallèle quand l'API
+# Storefront répond 401/403/404
+SHOPIFY_PRODUCTS_JSON_FANOUT = 4
+# BigCartel : pages de /products.json chargées en parallèle
+BIGCARTEL_PRODUCTS_FANOUT = 4
+# WooCommerce (API REST) : nombre de jours entre deux synchronisations
+# complètes, les sessions intermédiaires ne listent que les produits modifiés
+WOOCOMMERCE_FULL_SYNC_DAYS = 7
+# Détection du backend : seuls les premiers octets de la page d'accueil sont
+# lus, et le résultat est réutilisé pendant BACKEND_REGISTRY_TTL_DAYS jours
+BACKEND_SNIFF_BYTES = 64 * 1024
+BACKEND_REGISTRY_TTL_DAYS = 30
+# PrestaShop sans sitemap : profondeur et nombre de pages maximum par hôte
+PRESTASHOP_MAX_DEPTH = 5
+PRESTASHOP_MAX_PAGES = 400
+# Sitemaps : les pages dont le lastmod n'a pas changé ne sont pas
+# retéléchargées, sauf rafraîchissement complet tous les N jours
+SITEMAP_FULL_REFRESH_DAYS = 7
+# Nettoyage du contenu et classification dans un pool de threads plutôt que
+# dans le reactor ; au-delà de CPU_OFFLOAD_MAX_PENDING tâches en attente, le
+# slot du scraper freine le crawl
+CPU_OFFLOAD = False
+CPU_OFFLOAD_THREADS = 2
+CPU_OFFLOAD_MAX_PENDING = 100
+# Classification par lots : jusqu'à ENRICH_BATCH_SIZE items, ou les items
+# arrivés en ENRICH_BATCH_DELAY secondes, passent en un seul nlp.pipe
+ENRICH_BATCH_SIZE = 64
+ENRICH_BATCH_DELAY = 0.05
+# Répertoire de l'état conservé entre les sessions (non persisté si absent)
+FUGUE_STATE_DIR = None
 FUGUE_VERSION = 1
 MEDIA_ALLOW_REDIRECTS = True
 
@@ -2,34 +2,22 @@ import logging
 from urllib.parse import urlparse
 import scrapy
 import json
+from scrapy import signals
+from scrapy.exceptions import StopDownload
 from scrapy.spiders import SitemapSpider
+from scraper.lib.backends import BackendRegistry, sniff_backend
+from scraper.lib.bigcartel import BigcartelScraper
+from scraper.lib.magento import MagentoScraper
 from scraper.lib.shopify import ShopifyScraper
 from scraper.lib.woocommerce import WoocommerceScraper
-from scraper.lib.prestashop import PrestaShopScraper
-
-
-def get_backend(html):
-    matchers = [
-        (
-            "shopify",
-            (
-                "shopify",
-                "web-pixels-manager-setup",
-            ),
-        ),
-        ("woocommerce", ("woocommerce",)),
-        ("prestashop", ("prestashop",)),
-        ("wix", ("wix",)),
-        ("bigcartel", ("bigcartel",)),
-        ("magento", ("magento",)),
-    ]
-
-    backend = "Custom"
-    for name, keywords in matchers:
-        for keyword in keywords:
-            if keyword in html:
-                return name
-    return backend
+from scraper.lib.prestashop import (
+    CustomFrontier,
+    PrestaShopFrontier,
+    PrestaShopScraper,
+)
+from scraper.lib.sitemap import LastmodStore, SitemapFilter, iter_sitemap
+from scraper.lib.state import CrawlState
+from scraper.pipelines import EnrichItem
 
 
 class ProductsSpider(SitemapSpider):
@@ -41,9 +29,15 @@ class ProductsSpider(SitemapSpider):
     sitemap_rules = [
         ("/.*/", "parse_html_from_sitemap"),
     ]
+    # sous-sitemaps qui ne listent jamais de produits, d'après le chemin
+    # seul (brandcoffee.fr ne doit pas être exclu pour « brand »)
+    sitemap_follow = (
+        r"^(?!.*(image|categor|cms|post|blog|manufacturer|supplier|brand|video|news)).*$",
+    )
 
     def __init__(self, name=None, **kwargs):
         super().__init__(name, **kwargs)
+        self.sitemap_entries_filter = SitemapFilter()
         with open("rules.json", "r") as f:
             self.rules = json.load(f)
 
@@ -59,28 +53,168 @@ class ProductsSpider(SitemapSpider):
             ]
         logging.info(f"urls loaded: {json.dumps(self.roasters_urls)}")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.state = CrawlState(crawler.settings.get("FUGUE_STATE_DIR"))
+        spider.lastmods = LastmodStore(
+            spider.state.get("sitemap"),
+            crawler.settings.getint("SITEMAP_FULL_REFRESH_DAYS"),
+        )
+        spider.backend_registry = BackendRegistry(
+            spider.state.get("backends"),
+            crawler.settings.getint("BACKEND_REGISTRY_TTL_DAYS"),
+        )
+        crawler.signals.connect(spider.sniff_received, signal=signals.bytes_received)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        return spider
+
+    def closed(self, reason):
+        # une session interrompue (CLOSESPIDER_PAGECOUNT, CLOSESPIDER_TIMEOUT)
+        # n'a pas forcément atteint tous les hôtes : rien n'est oublié
+        if reason == "finished":
+            self.crawler.stats.set_value(
+                "backends/forgotten", self.backend_registry.forget_failed()
+            )
+            self.crawler.stats.set_value("sitemap/pruned", self.lastmods.prune())
+        self.state.save()
+
+    def product_classifier(self):
+        """Classifieur partagé avec EnrichItem pour le tri en amont du crawl
+        (EnrichItem.predict_deferred sérialise l'accès au modèle et passe par
+        le pool de CPU_OFFLOAD)"""
+        if not self.settings.getbool("SHOPIFY_TWO_PHASE") or not (
+            EnrichItem.run_predictions
+        ):
+            return None
+        return EnrichItem
+
     async def start(self):
         logging.info("spider starting")
         async for item_or_request in super().start():
             yield item_or_request
         for url in self.roasters_urls:
-            yield scrapy.Request(url, callback=self.parse)
+            entry = self.backend_registry.get(urlparse(url).hostname)
+            if entry is None:
+                yield self.sniff_request(url)
+                continue
+            # backend déjà connu : dispatch direct, sans page d'accueil
+            self.crawler.stats.inc_value("backends/registry_hits")
+            requests = list(self.dispatch(entry["host"], entry["backend"]))
+            if requests:
+                self.backend_registry.dispatching(urlparse(url).hostname, entry)
+            for request in requests:
+                yield request
+
+    def sniff_request(self, url):
+        # page d'accueil lue en partie : hors cache HTTP, et gzip seulement
+        # car un corps gzip tronqué reste décompressable
+        return scrapy.Request(
+            url,
+            callback=self.parse,
+            headers={"Accept-Encoding": "gzip"},
+            meta={"backend_sniff": 0, "dont_cache": True},
+        )
+
+    def sniff_received(self, data, request, spider):
+        """Interrompt le téléchargement de la page d'accueil après N Ko"""
+        if "backend_sniff" not in request.meta:
+            return
+        request.meta["backend_sniff"] += len(data)
+        if request.meta["backend_sniff"] >= self.settings.getint("BACKEND_SNIFF_BYTES"):
+            raise StopDownload(fail=False)
+
+    def item_scraped(self, item, response, spider):
+        self.backend_registry.scraped(urlparse(item.get("product_url") or "").hostname)
 
     def parse(self, response):
-        backend = get_backend(response.text)
+        host = urlparse(response.url).hostname
+        detection = sniff_backend(
+            response.body, self.settings.getint("BACKEND_SNIFF_BYTES")
+        )
+        self.backend_registry.record(
+            urlparse(response.meta.get("redirect_urls", [response.url])[0]).hostname,
+            detection,
+            host,
+        )
+        complete = "download_stopped" not in response.flags
+        yield from self.dispatch(
+            host, detection["backend"], response if complete else None
+        )
+
+    def dispatch(self, host, backend, response=None):
+        """Lance le scraper du backend, `response` est la page d'accueil
+        complète si elle a été téléchargée"""
         if len(self.backends) == 0 or any(
             b in backend for b in self.backends.split(",")
         ):
             if backend == "shopify":
-                yield from ShopifyScraper().start(urlparse(response.url).hostname)
+                yield from ShopifyScraper(
+                    self.state.get("shopify"),
+                    self.crawler.stats,
+                    self.settings.getint("SHOPIFY_FULL_SYNC_DAYS"),
+                    self.product_classifier(),
+                    self.settings.getint("SHOPIFY_PRODUCTS_JSON_FANOUT"),
+                ).start(host)
             if backend == "woocommerce":
-                yield from WoocommerceScraper(urlparse(response.url).hostname).start()
-            if backend == "prestashop":
-                host = urlparse(response.url).hostname
+                yield from WoocommerceScraper(
+                    host,
+                    self.crawler.stats,
+                    self.state.get("woocommerce"),
+                    self.settings.getint("WOOCOMMERCE_FULL_SYNC_DAYS"),
+                ).start()
+            if backend == "bigcartel":
+                yield from BigcartelScraper(
+                    self.crawler.stats,
+                    self.settings.getint("BIGCARTEL_PRODUCTS_FANOUT"),
+                ).start(host)
+            if backend == "magento":
+                yield from MagentoScraper(self.crawler.stats).start(host)
+            if backend in ("prestashop", "Custom"):
+                # les sites sur mesure suivent le même crawl (sitemap ou
+                # contenu), les produits sont lus dans leurs données structurées
+                frontier = (
+                    PrestaShopFrontier if backend == "prestashop" else CustomFrontier
+                )(
+                    self.settings.getint("PRESTASHOP_MAX_DEPTH"),
+                    self.settings.getint("PRESTASHOP_MAX_PAGES"),
+                )
                 rules = self.rules.get(host, {})
-                yield from PrestaShopScraper(self._parse_sitemap).start(
+                self.sitemap_entries_filter.register(host, frontier)
+                yield from PrestaShopScraper(self._parse_sitemap, frontier).start(
                     host, rules, response
                 )
 
+    def _parse_sitemap(self, response):
+        """Lit les sitemaps en flux plutôt qu'en construisant l'arbre complet"""
+        if response.url.endswith("/robots.txt"):
+            yield from super()._parse_sitemap(response)
+            return
+        max_size = response.meta.get("download_maxsize", self._max_size)
+        for entry in self.sitemap_filter(iter_sitemap(response.body, max_size)):
+            if entry["kind"] == "sitemap":
+                path = urlparse(entry["loc"]).path
+                if any(r.search(path) for r in self._follow):
+                    yield scrapy.Request(entry["loc"], callback=self._parse_sitemap)
+                continue
+            if self.lastmods.unchanged(entry):
+                self.crawler.stats.inc_value("sitemap/skipped_unchanged")
+                continue
+            for regex, callback in self._cbs:
+                if regex.search(entry["loc"]):
+                    yield scrapy.Request(
+                        entry["loc"],
+                        callback=callback,
+                        meta={"sitemap_lastmod": entry["lastmod"]},
+                    )
+                    break
+
+    def sitemap_filter(self, entries):
+        yield from self.sitemap_entries_filter(entries)
+
     def parse_html_from_sitemap(self, response):
         yield from PrestaShopScraper(self._parse_sitemap).parse_product(response)
+        self.lastmods.fetched(
+            response.meta.get("redirect_urls", [response.url])[0],
+            response.meta.get("sitemap_lastmod"),
+        )
@@ -0,0 +1,98 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+
+from scraper.lib.backends import BackendRegistry, sniff_backend
+from scraper.middlewares import BackendFailureMiddleware
+from scraper.spiders.products import ProductsSpider
+
+
+class TestSniffBackend:
+    def test_detects_backend_and_generator_version(self):
+        body = b"""<html><head>
+        <meta name="generator" content="WooCommerce 8.2.1">
+        <link rel="stylesheet" href="/wp-content/plugins/woocommerce/a.css">
+        </head>"""
+        assert sniff_backend(body) == {
+            "backend": "woocommerce",
+            "version": "8.2.1",
+            "confidence": 1.0,
+        }
+
+    def test_keeps_backend_priority_order(self):
+        body = b"<script src='/prestashop.js'></script><script>shopify</script>"
+        detection = sniff_backend(body)
+        assert detection["backend"] == "shopify"
+        assert detection["confidence"] == 0.5
+
+    def test_only_reads_the_first_bytes(self):
+        body = b"<html>" + b" " * 100 + b"woocommerce"
+        assert sniff_backend(body, limit=100)["backend"] == "Custom"
+        assert sniff_backend(body)["backend"] == "woocommerce"
+
+
+class TestBackendRegistry:
+    @pytest.fixture
+    def detection(self):
+        return {"backend": "shopify", "version": None, "confidence": 0.5}
+
+    def test_reuses_detection_until_ttl(self, detection):
+        state = {}
+        registry = BackendRegistry(state, ttl_days=30)
+        registry.record("www.shop.fr", detection)
+        assert registry.get("shop.fr")["backend"] == "shopify"
+        detected_at = datetime.now(UTC) - timedelta(days=31)
+        state["shop.fr"]["detected_at"] = detected_at.isoformat()
+        assert registry.get("shop.fr") is None
+
+    def test_forgets_failed_dispatched_hosts_without_products(self, detection):
+        state = {}
+        registry = BackendRegistry(state)
+        registry.record("shop.fr", detection, "www.shop.fr")
+        registry.record("other.fr", detection)
+        registry.record("quiet.fr", detection)
+        for host in ("shop.fr", "other.fr", "quiet.fr"):
+            registry.dispatching(host, registry.get(host))
+        registry.failed("www.shop.fr")
+        registry.failed("other.fr")
+        registry.scraped("www.shop.fr")
+        assert registry.forget_failed() == 1
+        # quiet.fr n'a rien produit de nouveau, sans échec : conservé
+        assert list(state) == ["shop.fr", "quiet.fr"]
+
+
+class TestProductsSpiderClosed:
+    @pytest.mark.parametrize(
+        "reason,forgotten", [("finished", True), ("closespider_timeout", False)]
+    )
+    def test_forgets_hosts_only_after_a_finished_session(
+        self, mocker, reason, forgotten
+    ):
+        spider = mocker.Mock()
+        ProductsSpider.closed(spider, reason)
+        assert spider.backend_registry.forget_failed.called == forgotten
+        assert spider.lastmods.prune.called == forgotten
+        spider.state.save.assert_called_once()
+
+
+class TestBackendFailureMiddleware:
+    def test_reports_non_2xx_responses_and_errors(self, mocker):
+        spider = mocker.Mock()
+        middleware = BackendFailureMiddleware()
+        request = Request("https://www.shop.fr/products.json")
+        ok = HtmlResponse(request.url, status=200)
+        assert middleware.process_response(request, ok, spider) is ok
+        spider.backend_registry.failed.assert_not_called()
+        middleware.process_response(
+            request, HtmlResponse(request.url, status=503), spider
+        )
+        middleware.process_exception(request, TimeoutError(), spider)
+        assert spider.backend_registry.failed.call_args_list == [
+            mocker.call("www.shop.fr"),
+            mocker.call("www.shop.fr"),
+        ]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
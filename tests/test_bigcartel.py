@@ -0,0 +1,63 @@
+import json
+
+import pytest
+from scrapy.http import Request, TextResponse
+
+from scraper.lib.bigcartel import BigcartelScraper
+
+
+class TestBigcartelScraper:
+    @pytest.fixture
+    def scraper(self):
+        return BigcartelScraper(fanout=2)
+
+    def page_response(self, request, products):
+        return TextResponse(
+            url=request.url,
+            request=request,
+            body=json.dumps(products).encode("utf-8"),
+        )
+
+    def run_callback(self, request, response):
+        return list(request.callback(response, **request.cb_kwargs))
+
+    def sample_product(self, product_id):
+        return {
+            "id": product_id,
+            "name": "Ethiopia Guji",
+            "url": f"/product/guji-{product_id}",
+            "description": "<p>Peach, jasmine</p>",
+            "images": [{"url": "https://images.bigcartel.com/guji.jpg"}],
+            "options": [{"id": 1, "name": "250g"}, {"id": 2, "name": "1kg"}],
+            "option_groups": [{"name": "Size"}],
+            "categories": [{"name": "Coffee"}],
+        }
+
+    def test_maps_products_to_item_schema(self, scraper):
+        first, second = scraper.start("roaster.bigcartel.com")
+        assert "/products.json?limit=100&page=1" in first.url
+        assert second.cb_kwargs["page"] == 2
+        (item,) = self.run_callback(
+            first, self.page_response(first, [self.sample_product(7)])
+        )
+        assert item["id"] == "bigcartel:roaster.bigcartel.com:7"
+        assert item["product_url"] == "https://roaster.bigcartel.com/product/guji-7"
+        assert item["variants"] == ["250g", "1kg"]
+        assert item["options"] == ["Size"]
+        assert item["categories"] == ["Coffee"]
+        assert item["image_url"] == "https://images.bigcartel.com/guji.jpg"
+
+    def test_full_page_schedules_next_window_until_nothing_new(self, scraper):
+        first, _ = scraper.start("roaster.bigcartel.com")
+        products = [self.sample_product(i) for i in range(100)]
+        results = self.run_callback(first, self.page_response(first, products))
+        (next_page,) = [r for r in results if isinstance(r, Request)]
+        assert next_page.cb_kwargs["page"] == 3
+        # page ignorée par la boutique : mêmes produits, pas de page suivante
+        assert (
+            self.run_callback(next_page, self.page_response(next_page, products)) == []
+        )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
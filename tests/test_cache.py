@@ -0,0 +1,53 @@
+import pytest
+
+from classifier.cache import PredictionCache, model_version
+
+CATS = {"roasted-beans": 0.9, "tea": 0.1}
+
+
+class TestPredictionCache:
+    def test_persisted_entries_survive_a_new_session(self):
+        state = {}
+        cache = PredictionCache("v1")
+        cache.attach(state)
+        assert cache.get("Cafés Guji") is None
+        cache.put("Cafés Guji", CATS)
+        assert cache.get("Cafés Guji") == CATS
+
+        cache = PredictionCache("v1")
+        cache.attach(state)
+        assert cache.get("Cafés Guji") == CATS
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_new_model_version_clears_the_state(self):
+        state = {}
+        cache = PredictionCache("v1")
+        cache.attach(state)
+        cache.put("Cafés Guji", CATS)
+
+        cache = PredictionCache("v2")
+        cache.attach(state)
+        assert state["entries"] == {}
+        assert cache.get("Cafés Guji") is None
+
+    def test_least_recently_used_entries_are_evicted(self):
+        state = {}
+        cache = PredictionCache("v1", max_size=2, max_stored=2)
+        cache.attach(state)
+        for text in ["a", "b", "c"]:
+            cache.put(text, CATS)
+        assert list(cache.memory) == [cache.key("b"), cache.key("c")]
+        assert cache.get("a") == CATS
+        cache.trim()
+        assert list(state["entries"]) == [cache.key("c"), cache.key("a")]
+
+    def test_model_version_follows_meta_json(self, tmp_path):
+        assert model_version(tmp_path) is None
+        (tmp_path / "meta.json").write_text('{"performance": {"cats_score": 0.9}}')
+        version = model_version(tmp_path)
+        (tmp_path / "meta.json").write_text('{"performance": {"cats_score": 0.8}}')
+        assert model_version(tmp_path) not in (None, version)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
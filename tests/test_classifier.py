@@ -0,0 +1,221 @@
+import re
+
+import numpy as np
+import pytest
+
+from classifier.bow import BowModel, compile_regex, compress, export, export_regex
+from classifier.cache import PredictionCache
+from classifier.host_rules import HostRules
+from classifier.train import ProductClassifier
+
+LABELS = ["roasted-beans", "tea", "merch"]
+TRAIN = [
+    (
+        {"categories": ["Café en grains"], "title": "Éthiopie Guji 250g"},
+        "roasted-beans",
+    ),
+    ({"categories": ["Cafés"], "title": "Brésil Cerrado - moulu"}, "roasted-beans"),
+    ({"categories": ["Thés"], "title": "Thé vert Sencha (bio)"}, "tea"),
+    ({"categories": [], "title": "Infusion thé noir d'Assam"}, "tea"),
+    ({"categories": ["Accessoires"], "title": "Tasse l'Artisan"}, "merch"),
+    ({"categories": ["Boutique"], "title": "T-shirt logo"}, "merch"),
+]
+HELD_OUT = [
+    {"categories": ["Café  en grains", "Nouveautés"], "title": "Kenya AA 1kg"},
+    {"categories": ["Thé"], "title": "aujourd'hui thé-vert (bio) 1,5kg"},
+    {"categories": [], "title": "Tasse c.-à-d. l'Artisan etc. M. Dupont"},
+    {"categories": ["Mugs"], "title": "www.example.com contact@example.fr"},
+    {"categories": [], "title": "  espaces\n\tet tabulations "},
+    {"categories": [], "title": ""},
+]
+
+
+@pytest.fixture
+def classifier(mocker):
+    classifier = ProductClassifier(model_path="/nonexistent", batch_size=32)
+    classifier.nlp = mocker.Mock(pipe_names=["textcat"])
+    classifier.nlp.pipe.side_effect = lambda texts, **kwargs: [
+        mocker.Mock(cats={"roasted-beans": 0.9, "other": 0.1} if "grains" in t else {})
+        for t in texts
+    ]
+    return classifier
+
+
+class TestProductClassifier:
+    def test_predictions_use_a_single_batched_pipe_call(self, classifier):
+        products = [
+            {"categories": ["Café en grains"], "title": "Guji"},
+            {"categories": [], "title": "Tasse"},
+        ]
+        assert classifier.predict(products) == ["roasted-beans", "_unknown"]
+        classifier.nlp.pipe.assert_called_once()
+        assert classifier.nlp.pipe.call_args.kwargs == {
+            "batch_size": 32,
+            "n_process": 1,
+        }
+        assert classifier.predict_with_confidence(products, threshold=0.95) == [
+            ("_unknown", 0.9),
+            ("_unknown", 0.0),
+        ]
+        assert classifier.predict_all_scores(products)[1] == {"_unknown": 1.0}
+
+    def test_host_rules_decide_before_the_model(self, classifier):
+        classifier.rules = HostRules(
+            {"roaster.fr": {"categories": [["merch", ["Goodies"]]]}}
+        )
+        products = [
+            {"host": "roaster.fr", "categories": ["Goodies"], "title": "Tasse"},
+            {"host": "roaster.fr", "categories": ["Café en grains"], "title": "Guji"},
+        ]
+        assert classifier.predict(products) == ["merch", "roasted-beans"]
+        stats = classifier.usage_stats()
+        assert stats["classifier/rules_decided"] == 1
+        assert stats["classifier/model_predicted"] == 1
+        assert stats["classifier/rules_ratio"] == 0.5
+
+    def test_cached_and_repeated_texts_skip_the_model(self, classifier):
+        classifier.cache = PredictionCache("v1")
+        classifier.cache.put("Cafés Guji", {"roasted-beans": 0.8, "other": 0.2})
+        texts = []
+        predict = classifier.nlp.pipe.side_effect
+
+        def pipe(batch, **kwargs):
+            texts.extend(batch)
+            return predict(batch, **kwargs)
+
+        classifier.nlp.pipe.side_effect = pipe
+        products = [
+            {"categories": ["Cafés"], "title": "Guji"},
+            {"categories": ["Café en grains"], "title": "Kenya"},
+            {"categories": ["Café en grains"], "title": "Kenya"},
+        ]
+        assert classifier.predict(products) == ["roasted-beans"] * 3
+        assert texts == ["Café en grains Kenya"]
+        assert classifier.usage_stats()["classifier/cache_hits"] == 1
+
+    def test_reset_stats_starts_a_new_session(self, classifier):
+        classifier.cache = PredictionCache("v1")
+        products = [{"categories": ["Café en grains"], "title": "Kenya"}]
+        classifier.predict(products)
+        classifier.predict(products)
+        classifier.reset_stats()
+        stats = classifier.usage_stats()
+        assert stats["classifier/model_predicted"] == 0
+        assert stats["classifier/model_ms"] == 0
+        assert stats["classifier/cache_hits"] == 0
+        assert stats["classifier/cache_misses"] == 0
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """Petit TextCatBOW entraîné avec spaCy, sauvegardé sur disque"""
+    spacy = pytest.importorskip("spacy")
+    from spacy.training import Example
+
+    nlp = spacy.blank("fr")
+    textcat = nlp.add_pipe(
+        "textcat",
+        config={
+            "model": {
+                "@architectures": "spacy.TextCatBOW.v3",
+                "exclusive_classes": True,
+                "ngram_size": 1,
+                "no_output_layer": False,
+                "length": 4096,
+            }
+        },
+    )
+    for label in LABELS:
+        textcat.add_label(label)
+    featurize = ProductClassifier(model_path="/nonexistent").featurize
+    examples = [
+        Example.from_dict(
+            nlp.make_doc(featurize(product)),
+            {"cats": {label: float(label == category) for label in LABELS}},
+        )
+        for product, category in TRAIN
+    ]
+    optimizer = nlp.initialize(lambda: examples)
+    for _ in range(20):
+        nlp.update(examples, sgd=optimizer)
+    path = tmp_path_factory.mktemp("model")
+    nlp.to_disk(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def spacy_classifier(model_dir):
+    return ProductClassifier(model_path=str(model_dir), batch_size=4)
+
+
+@pytest.fixture(scope="module")
+def bow_dir(model_dir, spacy_classifier):
+    export(spacy_classifier.nlp, model_dir / "bow")
+    return model_dir / "bow"
+
+
+class TestBowModel:
+    def test_export_matches_spacy_predictions(
+        self, model_dir, bow_dir, spacy_classifier
+    ):
+        bow_classifier = ProductClassifier(model_path=str(model_dir), batch_size=4)
+        assert isinstance(bow_classifier.nlp, BowModel)
+
+        products = HELD_OUT + [product for product, _ in TRAIN]
+        expected = spacy_classifier.predict_all_scores(products)
+        scores = bow_classifier.predict_all_scores(products)
+        for cats, expected_cats in zip(scores, expected):
+            assert list(cats) == list(expected_cats)
+            assert cats == pytest.approx(expected_cats, abs=1e-6)
+        assert bow_classifier.predict(products) == spacy_classifier.predict(products)
+
+        tokenizer = bow_classifier.nlp.tokenizer
+        for product in products:
+            text = bow_classifier.featurize(product)
+            assert [t for t, _ in tokenizer(text)] == [
+                t.text for t in spacy_classifier.nlp.tokenizer(text)
+            ]
+
+    def test_quantized_and_pruned_exports(self, bow_dir, spacy_classifier, tmp_path):
+        texts = [spacy_classifier.featurize(p) for p, _ in TRAIN]
+        expected = [doc.cats for doc in spacy_classifier.nlp.pipe(texts)]
+
+        compress(bow_dir, tmp_path / "int8", quantize=True)
+        quantized = BowModel.load(tmp_path / "int8")
+        assert quantized.weights.dtype == np.int8
+        for doc, expected_cats in zip(quantized.pipe(texts), expected):
+            assert doc.cats == pytest.approx(expected_cats, abs=1e-2)
+            assert max(doc.cats, key=doc.cats.get) == max(
+                expected_cats, key=expected_cats.get
+            )
+
+        compress(bow_dir, tmp_path / "pruned", prune=0.5)
+        pruned = BowModel.load(tmp_path / "pruned")
+        full = BowModel.load(bow_dir)
+        assert len(pruned.rows) == len(full.rows) - len(full.rows) // 2
+        assert set(pruned.rows) <= set(full.rows)
+
+    def test_orth_memo_is_bounded(self, bow_dir, monkeypatch):
+        model = BowModel.load(bow_dir)
+        monkeypatch.setattr(model, "max_orths_size", 2)
+        orths = [model.orth(text) for text in ("café", "thé", "tasse", "café")]
+        assert len(model.orths) == 2
+        assert orths[0] == orths[3]
+        assert orths[2] == model.orth("tasse")
+
+    def test_tampered_regex_program_is_recompiled(self):
+        spec, _ = export_regex("prefix_search", re.compile(r"^[\(\[]").search)
+        _, other = export_regex("prefix_search", re.compile(r"^x").search)
+        search = compile_regex(spec, {"prefix_search": other})
+        assert search("(bio)")
+        assert not search("x")
+
+    def test_regex_without_program_is_recompiled(self, monkeypatch):
+        monkeypatch.delattr(re, "_parser")
+        spec, code = export_regex("prefix_search", re.compile(r"^[\(\[]").search)
+        assert code is None and "program" not in spec
+        assert compile_regex(spec, {})("(bio)")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,30 @@
+import pytest
+from scrapy.exceptions import NotConfigured
+
+from scraper.extensions import ReactorLag
+
+
+class TestReactorLag:
+    def test_tick_records_lag_and_reschedules(self, mocker):
+        stats = mocker.Mock()
+        call_later = mocker.patch("twisted.internet.reactor.callLater")
+        mocker.patch(
+            "scraper.extensions.time.monotonic", side_effect=[10.0, 10.35, 10.35]
+        )
+        ext = ReactorLag(stats, 0.1)
+        ext.schedule()
+        ext.tick()
+        stats.max_value.assert_called_once_with("reactor/lag_max_ms", 250)
+        stats.set_value.assert_called_once_with("reactor/lag_mean_ms", 250)
+        stats.inc_value.assert_called_once_with("reactor/lag_over_100ms")
+        assert call_later.call_count == 2
+
+    def test_disabled_without_interval(self, mocker):
+        crawler = mocker.Mock()
+        crawler.settings.getfloat.return_value = 0
+        with pytest.raises(NotConfigured):
+            ReactorLag.from_crawler(crawler)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
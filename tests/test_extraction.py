@@ -0,0 +1,40 @@
+import pytest
+from scrapy.http import HtmlResponse
+
+from scraper.lib.extraction import ExtractionPlan
+
+PAGE = """<html><body>
+<div id="product-details" data-product='{"name": "Guji"}'></div>
+<ul class="breadcrumb"><li><a href="/">Accueil </a></li><li><a href="/3-cafes">Cafés</a></li></ul>
+<div class="product-cover big"><img src="/guji.jpg"></div>
+</body></html>"""
+
+
+class TestExtractionPlan:
+    @pytest.fixture
+    def response(self):
+        return HtmlResponse(
+            url="https://shop.fr/12-guji.html", body=PAGE, encoding="utf-8"
+        )
+
+    def test_matches_scrapy_selectors(self, response):
+        selectors = {
+            "data_product": "#product-details::attr(data-product)",
+            "cover": ".product-cover img::attr(src)",
+            "missing": "#product_page_product_id::attr(value)",
+        }
+        plan = ExtractionPlan(
+            first=selectors, all={"breadcrumb": ".breadcrumb a::text"}
+        )
+        values = plan(response)
+        for name, css in selectors.items():
+            assert values[name] == response.css(css).get()
+        assert values["breadcrumb"] == response.css(".breadcrumb a::text").getall()
+
+    def test_returns_elements_for_element_selectors(self, response):
+        body = ExtractionPlan(first={"body": "body"})(response)["body"]
+        assert body.tag == "body"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from classifier.host_rules import HostRules
+
+
+@pytest.fixture
+def rules(tmp_path):
+    (tmp_path / "roaster.fr.json").write_text(
+        json.dumps(
+            {
+                "ignore_if_empty_categories": True,
+                "ignore": ["Soldes"],
+                "categories": [
+                    ["equipment", ["Matériel", "Coffrets"]],
+                    ["roasted-beans", ["Cafés", "Coffrets"]],
+                    ["tea", []],
+                ],
+            }
+        )
+    )
+    return HostRules.load(tmp_path)
+
+
+def product(*categories, url="https://www.roaster.fr/products/guji"):
+    return {"product_url": url, "categories": list(categories), "title": "Guji"}
+
+
+class TestHostRules:
+    def test_matching_category_decides_label(self, rules):
+        assert rules.classify(product("Nouveautés", "Cafés")) == "roasted-beans"
+        assert rules.classify({**product("Matériel"), "host": "roaster.fr"}) == (
+            "equipment"
+        )
+
+    def test_ambiguous_ignored_or_unknown_products_are_left_to_the_model(self, rules):
+        assert rules.classify(product("Cafés", "Matériel")) is None
+        assert rules.classify(product("Coffrets")) is None
+        assert rules.classify(product("Cafés", "Soldes")) is None
+        assert rules.classify(product()) is None
+        assert rules.classify(product("Cafés", url="https://other.fr/p")) is None
+
+    def test_repository_rules_compile(self):
+        rules = HostRules.load("classifier/rules")
+        assert len(rules.hosts) > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
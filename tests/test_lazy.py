@@ -0,0 +1,24 @@
+import threading
+
+import pytest
+
+from scraper.lib.lazy import Lazy, warm
+
+
+class TestLazy:
+    def test_factory_runs_once_across_threads(self, mocker):
+        factory = mocker.Mock(return_value=mocker.Mock(region="eu-west-1"))
+        resource = Lazy("s3", factory)
+        factory.assert_not_called()
+        threads = [threading.Thread(target=resource.get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        warm(resource)
+        assert resource.region == "eu-west-1"
+        factory.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from scrapy.http import Request, TextResponse
+
+from scraper.lib.magento import MagentoScraper
+
+
+class TestMagentoScraper:
+    @pytest.fixture
+    def scraper(self):
+        return MagentoScraper()
+
+    def json_response(self, request, data, status=200):
+        return TextResponse(
+            url=request.url,
+            request=request,
+            status=status,
+            body=json.dumps(data).encode("utf-8"),
+        )
+
+    def run_callback(self, request, response):
+        return list(request.callback(response, **request.cb_kwargs))
+
+    def test_graphql_maps_items_and_requests_remaining_pages(self, scraper):
+        (request,) = scraper.start("shop.fr")
+        assert request.url == "https://shop.fr/graphql"
+        item = {
+            "uid": "MTI=",
+            "sku": "GUJI",
+            "name": "Ethiopie Guji",
+            "url_key": "ethiopie-guji",
+            "url_suffix": ".html",
+            "description": {"html": "<p>Pêche</p>"},
+            "small_image": {"url": "https://shop.fr/media/guji.jpg"},
+            "categories": [{"name": "Cafés"}],
+            "configurable_options": [{"label": "Mouture"}],
+            "variants": [{"product": {"name": "Ethiopie Guji - Grains"}}],
+        }
+        data = {
+            "data": {"products": {"page_info": {"total_pages": 3}, "items": [item]}}
+        }
+        results = self.run_callback(request, self.json_response(request, data))
+        items = [r for r in results if not isinstance(r, Request)]
+        pages = [r for r in results if isinstance(r, Request)]
+        assert [p.cb_kwargs["page"] for p in pages] == [2, 3]
+        (product,) = items
+        assert product["id"] == "magento:shop.fr:GUJI"
+        assert product["product_url"] == "https://shop.fr/ethiopie-guji.html"
+        assert product["options"] == ["Mouture"]
+        assert product["variants"] == ["Ethiopie Guji - Grains"]
+        assert product["categories"] == ["Cafés"]
+
+    def test_falls_back_to_rest_when_graphql_is_missing(self, scraper):
+        (request,) = scraper.start("shop.fr")
+        (rest,) = self.run_callback(request, self.json_response(request, {}, 404))
+        assert "/rest/V1/products?searchCriteria" in rest.url
+        data = {
+            "total_count": 150,
+            "items": [
+                {
+                    "sku": "GUJI",
+                    "name": "Ethiopie Guji",
+                    "custom_attributes": [
+                        {"attribute_code": "url_key", "value": "ethiopie-guji"},
+                        {"attribute_code": "image", "value": "/g/u/guji.jpg"},
+                    ],
+                }
+            ],
+        }
+        product, next_page = self.run_callback(rest, self.json_response(rest, data))
+        assert product["id"] == "magento:shop.fr:GUJI"
+        assert (
+            product["image_url"] == "https://shop.fr/media/catalog/product/g/u/guji.jpg"
+        )
+        assert next_page.cb_kwargs["page"] == 2
+
+    def test_graphql_id_falls_back_to_uid_without_sku(self, scraper):
+        product = scraper.parse_product({"uid": "MTI=", "url_key": "guji"}, "shop.fr")
+        assert product["id"] == "magento:shop.fr:MTI="
+
+    def html_response(self, request):
+        return TextResponse(
+            url=request.url,
+            request=request,
+            status=200,
+            body=b"<html><body>Boutique</body></html>",
+        )
+
+    def test_falls_back_to_rest_when_graphql_returns_html(self, scraper):
+        (request,) = scraper.start("shop.fr")
+        (rest,) = self.run_callback(request, self.html_response(request))
+        assert "/rest/V1/products?searchCriteria" in rest.url
+
+    def test_undecodable_graphql_page_is_skipped(self, scraper):
+        request = scraper.graphql_request("shop.fr", 2)
+        assert self.run_callback(request, self.html_response(request)) == []
+
+    def test_undecodable_rest_response_is_skipped(self, scraper):
+        request = scraper.rest_request("shop.fr", 1)
+        assert self.run_callback(request, self.html_response(request)) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
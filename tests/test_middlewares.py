@@ -0,0 +1,93 @@
+import pytest
+from scrapy.core.downloader import Slot
+from scrapy.http import Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from scraper.middlewares import ShopifyThrottleMiddleware
+
+
+class TestShopifyThrottleMiddleware:
+    @pytest.fixture
+    def slots(self):
+        return {"shopify:shop.fr": Slot(4, 0), "other.fr": Slot(8, 0)}
+
+    @pytest.fixture
+    def middleware(self, mocker, slots):
+        crawler = get_crawler(
+            settings_dict={
+                "SHOPIFY_THROTTLE_MAX_DELAY": 30,
+                "SHOPIFY_THROTTLE_RETRY_TIMES": 2,
+            }
+        )
+        crawler.engine = mocker.Mock()
+        crawler.engine.downloader.slots = slots
+        crawler.engine.downloader.get_slot_key.side_effect = lambda request: (
+            request.meta.get("download_slot", "other.fr")
+        )
+        return ShopifyThrottleMiddleware.from_crawler(crawler)
+
+    def shopify_request(self, delay):
+        return Request(
+            "https://shop.fr/products.json",
+            meta={"download_slot": "shopify:shop.fr", "shopify_delay": delay},
+        )
+
+    def throttled(self, request, headers=None):
+        return TextResponse(request.url, status=429, headers=headers, request=request)
+
+    def test_delay_is_applied_to_the_shop_slot(self, middleware, slots):
+        assert middleware.process_request(self.shopify_request(2.5), None) is None
+        assert slots["shopify:shop.fr"].delay == 2.5
+        assert slots["other.fr"].delay == 0
+
+    @pytest.mark.parametrize("delay,expected", [(120, 30), (-1, 0)])
+    def test_delay_is_bounded(self, middleware, slots, delay, expected):
+        middleware.process_request(self.shopify_request(delay), None)
+        assert slots["shopify:shop.fr"].delay == expected
+
+    def test_other_requests_leave_slots_untouched(self, middleware, slots):
+        request = Request("https://other.fr/", meta={"download_slot": "other.fr"})
+        assert middleware.process_request(request, None) is None
+        assert all(slot.delay == 0 for slot in slots.values())
+
+    def test_missing_slot_is_ignored(self, middleware, slots):
+        slots.clear()
+        assert middleware.process_request(self.shopify_request(2), None) is None
+
+    def test_throttled_response_is_retried_after_retry_after(self, middleware):
+        request = self.shopify_request(1)
+        retry = middleware.process_response(
+            request, self.throttled(request, {"Retry-After": "4"}), None
+        )
+        assert isinstance(retry, Request)
+        assert retry.dont_filter
+        assert retry.meta["shopify_delay"] == 4
+        assert retry.meta["shopify_throttle_retries"] == 1
+        assert retry.meta["download_slot"] == "shopify:shop.fr"
+
+    def test_retry_without_retry_after_doubles_the_delay(self, middleware):
+        request = self.shopify_request(1.5)
+        retry = middleware.process_response(request, self.throttled(request), None)
+        assert retry.meta["shopify_delay"] == 3
+
+    def test_gives_up_after_retry_times(self, middleware):
+        request = self.shopify_request(1)
+        for _ in range(2):
+            request = middleware.process_response(
+                request, self.throttled(request), None
+            )
+            assert isinstance(request, Request)
+        response = self.throttled(request)
+        assert middleware.process_response(request, response, None) is response
+
+    def test_other_responses_pass_through(self, middleware):
+        request = self.shopify_request(1)
+        ok = TextResponse(request.url, status=200, request=request)
+        assert middleware.process_response(request, ok, None) is ok
+        plain = Request("https://other.fr/")
+        throttled = self.throttled(plain)
+        assert middleware.process_response(plain, throttled, None) is throttled
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
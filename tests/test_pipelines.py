@@ -0,0 +1,124 @@
+import pytest
+from scrapy.exceptions import DropItem
+from twisted.internet import defer
+
+from scraper.lib.utils import LazyContent, b64
+from scraper.pipelines import EnrichItem
+
+
+@pytest.fixture
+def spider(mocker):
+    spider = mocker.Mock()
+    spider.name = "products"
+    return spider
+
+
+@pytest.fixture
+def model(mocker):
+    mocker.patch.object(EnrichItem, "run_predictions", True)
+    return mocker.patch.object(EnrichItem, "model", mocker.Mock())
+
+
+@pytest.fixture
+def item():
+    return {
+        "id": "shopify:roaster.fr:1",
+        "title": "Ethiopie Guji",
+        "product_url": "https://roaster.fr/products/guji",
+        "image_url": None,
+        "content": LazyContent("<p>Guji</p>"),
+        "categories": ["Cafés", ""],
+    }
+
+
+class TestEnrichItem:
+    def test_resolves_content_of_kept_items(self, model, item, spider):
+        model.predict.return_value = ["roasted-beans"]
+        out = EnrichItem().process_item(item, spider)
+        assert out["content"] == b64("<html><body><p>Guji</p></body></html>")
+        assert out["host"] == "roaster.fr"
+        assert out["categories"] == ["Cafés"]
+
+    def test_drops_before_resolving_content(self, mocker, model, item, spider):
+        model.predict.return_value = ["other"]
+        resolve = mocker.patch.object(LazyContent, "resolve")
+        with pytest.raises(DropItem):
+            EnrichItem().process_item(item, spider)
+        resolve.assert_not_called()
+
+    def test_offloaded_items_go_through_the_pool(self, mocker, item, spider):
+        mocker.patch.object(EnrichItem, "run_predictions", False)
+        pipeline = EnrichItem(stats=mocker.Mock(), threads=1)
+        run = mocker.patch(
+            "scraper.pipelines.deferToThreadPool",
+            side_effect=lambda reactor, pool, f, *args: defer.succeed(f(*args)),
+        )
+        result = pipeline.process_item(item, spider)
+        assert isinstance(result, defer.Deferred)
+        assert run.call_args.args[1] is pipeline.pool
+        assert result.result["predicted_category"] == "_unknown"
+        pipeline.stats.inc_value.assert_called_once_with("enrich/offloaded")
+
+    def test_predict_deferred_uses_the_open_pipeline_pool(self, mocker, model, spider):
+        model.predict.return_value = ["roasted-beans"]
+        assert EnrichItem.predict_deferred([{}]).result == ["roasted-beans"]
+        run = mocker.patch(
+            "scraper.pipelines.deferToThreadPool",
+            side_effect=lambda reactor, pool, f, *args: defer.succeed(f(*args)),
+        )
+        pipeline = EnrichItem(threads=1)
+        mocker.patch.object(pipeline.pool, "start")
+        mocker.patch.object(pipeline.pool, "stop")
+        pipeline.open_spider(spider)
+        assert EnrichItem.predict_deferred([{}]).result == ["roasted-beans"]
+        assert run.call_args.args[1] is pipeline.pool
+        pipeline.close_spider(spider)
+        assert EnrichItem.offload_pool is None
+
+    def test_batches_are_classified_in_one_call(self, mocker, model, item, spider):
+        model.predict.return_value = ["roasted-beans", "other"]
+        call_later = mocker.patch("twisted.internet.reactor.callLater")
+        pipeline = EnrichItem(batch_size=2, batch_delay=0.05)
+        other = {**item, "id": "shopify:roaster.fr:2", "title": "Tasse"}
+        first = pipeline.process_item(item, spider)
+        assert not first.called
+        call_later.assert_called_once_with(0.05, pipeline.flush, spider)
+        second = pipeline.process_item(other, spider)
+        model.predict.assert_called_once_with([item, other])
+        assert first.result["predicted_category"] == "roasted-beans"
+        second.addErrback(lambda failure: failure.trap(DropItem))
+        assert pipeline.batch == []
+
+    def test_malformed_item_does_not_fail_its_batch(self, mocker, model, item, spider):
+        model.predict.return_value = ["roasted-beans", "roasted-beans"]
+        mocker.patch("twisted.internet.reactor.callLater")
+        pipeline = EnrichItem(batch_size=2)
+        malformed = {k: v for k, v in item.items() if k != "product_url"}
+        first = pipeline.process_item(malformed, spider)
+        second = pipeline.process_item(item, spider)
+        assert second.result["host"] == "roaster.fr"
+        errors = []
+        first.addErrback(errors.append)
+        assert errors[0].check(KeyError)
+
+    def test_close_spider_flushes_pending_items(self, mocker, model, item, spider):
+        model.predict.return_value = ["roasted-beans"]
+        mocker.patch("twisted.internet.reactor.callLater")
+        pipeline = EnrichItem(batch_size=64)
+        d = pipeline.process_item(item, spider)
+        pipeline.close_spider(spider)
+        assert d.result["host"] == "roaster.fr"
+
+    def test_usage_stats_are_per_session(self, mocker, model, spider):
+        mocker.patch("scraper.pipelines.warm")
+        model.usage_stats.return_value = {"classifier/model_predicted": 3}
+        stats = mocker.Mock()
+        pipeline = EnrichItem(stats=stats)
+        pipeline.open_spider(spider)
+        model.reset_stats.assert_called_once_with()
+        pipeline.close_spider(spider)
+        stats.set_value.assert_called_once_with("classifier/model_predicted", 3)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
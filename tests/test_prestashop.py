@@ -0,0 +1,108 @@
+import base64
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from scraper.lib.prestashop import PrestaShopFrontier, PrestaShopScraper
+
+
+class TestPrestaShopFrontier:
+    @pytest.fixture
+    def frontier(self):
+        return PrestaShopFrontier(max_depth=2, max_pages=3)
+
+    def test_product_urls_score_above_categories_and_cms(self, frontier):
+        product = frontier.score("https://shop.fr/cafes/12-ethiopie-guji.html")
+        category = frontier.score("https://shop.fr/3-cafes")
+        cms = frontier.score("https://shop.fr/content/4-a-propos")
+        assert product > category > cms
+
+    def test_cart_and_account_pages_are_not_followed(self, frontier):
+        assert frontier.score("https://shop.fr/panier") is None
+        assert frontier.score("https://shop.fr/mon-compte") is None
+        assert frontier.score("https://shop.fr/12-cartagena.html") is not None
+
+    def test_anchor_text_boosts_score(self, frontier):
+        url = "https://shop.fr/3-boutique"
+        assert frontier.score(url, "Nos cafés") > frontier.score(url, "Boutique")
+
+    def test_admit_enforces_depth_and_page_caps(self, frontier):
+        assert not frontier.admit("https://shop.fr/a", 3)
+        assert frontier.admit("https://shop.fr/a", 1)
+        assert not frontier.admit("https://shop.fr/a", 1)
+        assert frontier.admit("https://shop.fr/b", 2)
+        assert frontier.admit("https://shop.fr/c", 2)
+        assert not frontier.admit("https://shop.fr/d", 1)
+
+
+class TestPrestaShopScraper:
+    def test_start_content_sets_request_priorities(self):
+        response = HtmlResponse(
+            url="https://shop.fr/",
+            body="""<html><body>
+            <a href="/content/1-livraison">Livraison</a>
+            <a href="/panier?action=show">Panier</a>
+            <a href="/cafes/12-ethiopie-guji.html">Ethiopie Guji</a>
+            <a href="/3-cafes">Cafés</a>
+            </body></html>""",
+            encoding="utf-8",
+        )
+        scraper = PrestaShopScraper(None)
+        requests = list(scraper.start_content(response))
+        by_url = {r.url: r for r in requests}
+        assert "https://shop.fr/panier" not in by_url
+        product = by_url["https://shop.fr/cafes/12-ethiopie-guji.html"]
+        assert product.priority > by_url["https://shop.fr/3-cafes"].priority
+        assert product.priority > by_url["https://shop.fr/content/1-livraison"].priority
+        assert product.cb_kwargs == {"depth": 1}
+
+    def test_parse_product_reads_prestashop_17_pages(self):
+        response = HtmlResponse(
+            url="https://shop.fr/cafes/12-ethiopie-guji.html",
+            body="""<html><body>
+            <div id="product-details" data-product='{"name": "Ethiopie Guji",
+              "link": "https://shop.fr/cafes/12-ethiopie-guji.html",
+              "category_name": "Cafés", "attributes": {"1": {"name": "250g"}}}'></div>
+            <input id="product_page_product_id" value="12">
+            <div class="product-cover"><img src="/guji.jpg"></div>
+            <style>p{}</style><p>Pêche</p>
+            </body></html>""",
+            encoding="utf-8",
+        )
+        (item,) = PrestaShopScraper(None).parse_product(response)
+        assert item["id"] == "prestashop1.7:shop.fr:12"
+        assert item["image_url"] == "/guji.jpg"
+        assert item["categories"] == ["Cafés"]
+        assert item["variants"] == ["250g"]
+        content = base64.b64decode(item["content"].resolve()).decode("utf-8")
+        assert "Pêche" in content and "<style>" not in content
+
+    def test_parse_product_reads_prestashop_16_pages(self):
+        response = HtmlResponse(
+            url="https://shop.fr/12-ethiopie-guji.html",
+            body="""<html><head>
+            <script type="application/ld+json">{"@type": "Product"}</script>
+            </head><body>
+            <input id="product_page_product_id" value="12">
+            <h1 class="product_name">Ethiopie Guji</h1>
+            <div class="breadcrumb"><a> Cafés </a><a> </a></div>
+            <div class="product-variants"><span class="control-label">Mouture</span></div>
+            </body></html>""",
+            encoding="utf-8",
+        )
+        (item,) = PrestaShopScraper(None).parse_product(response)
+        assert item["id"] == "prestashop1.6:shop.fr:12"
+        assert item["title"] == "Ethiopie Guji"
+        assert item["categories"] == ["Cafés"]
+        assert item["variants"] == ["Mouture"]
+
+    def test_start_fetches_homepage_when_not_downloaded(self):
+        scraper = PrestaShopScraper(None)
+        (request,) = scraper.start("shop.fr", {"ignore_sitemap": True})
+        assert request.url == "https://shop.fr/"
+        assert request.callback == scraper.start_content
+        assert request.dont_filter
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
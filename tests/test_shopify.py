@@ -1,10 +1,23 @@
 import json
+from datetime import UTC, datetime, timedelta
 import pytest
 from scrapy.http import Request
 from scrapy.http import TextResponse
+from twisted.internet import defer
 from scraper.lib.shopify import ShopifyScraper
 
 
+def collect(results):
+    """Déroule un callback asynchrone dont les Deferred attendus sont résolus"""
+
+    async def drain():
+        return [result async for result in results]
+
+    with pytest.raises(StopIteration) as done:
+        drain().send(None)
+    return done.value.value
+
+
 class TestShopifyScraper:
     @pytest.fixture
     def scraper(self):
@@ -118,6 +131,241 @@ class TestShopifyScraper:
         expected_cursor = "eyJsYXN0X2lkIjo5ODc2NTQzMjF9"
         assert payload["variables"]["cursor"] == expected_cursor
 
+    def test_start_uses_one_download_slot_per_host(self, scraper, sample_host):
+        request = next(scraper.start(sample_host))
+        assert request.meta["download_slot"] == f"shopify:{sample_host}"
+        assert request.meta["shopify_delay"] == scraper.start_delay
+
+    def test_next_request_backs_off_when_throttle_budget_is_low(
+        self, scraper, sample_host, sample_graphql_response
+    ):
+        sample_graphql_response["extensions"] = {
+            "cost": {
+                "requestedQueryCost": 100,
+                "throttleStatus": {
+                    "maximumAvailable": 1000,
+                    "currentlyAvailable": 50,
+                    "restoreRate": 50,
+                },
+            }
+        }
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(sample_graphql_response).encode("utf-8"),
+        )
+        next_request = list(scraper.parse_shopify_products(response, sample_host))[-1]
+        assert next_request.meta["shopify_delay"] == 3
+        assert next_request.cb_kwargs["delay"] == 3
+
+    def test_next_request_speeds_up_without_throttle_status(
+        self, scraper, sample_host, sample_graphql_response
+    ):
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(sample_graphql_response).encode("utf-8"),
+        )
+        next_request = list(
+            scraper.parse_shopify_products(response, sample_host, delay=2)
+        )[-1]
+        assert next_request.meta["shopify_delay"] == 1
+
+    def test_start_filters_on_high_water_mark_between_full_syncs(self, sample_host):
+        state = {
+            sample_host: {
+                "full_sync_at": datetime.now(UTC).isoformat(),
+                "updated_at": "2025-08-01T10:00:00Z",
+                "product_count": 10,
+            }
+        }
+        request = next(ShopifyScraper(state).start(sample_host))
+        payload = json.loads(request.body)
+        assert payload["variables"]["query"] == "updated_at:>'2025-08-01T10:00:00Z'"
+
+    def test_start_runs_full_sync_when_cadence_elapsed(self, sample_host):
+        state = {
+            sample_host: {
+                "full_sync_at": (datetime.now(UTC) - timedelta(days=8)).isoformat(),
+                "updated_at": "2025-08-01T10:00:00Z",
+            }
+        }
+        request = next(ShopifyScraper(state, full_sync_days=7).start(sample_host))
+        assert json.loads(request.body)["variables"]["query"] is None
+
+    def test_last_page_records_high_water_mark(
+        self, sample_host, sample_graphql_response_last_page
+    ):
+        state = {}
+        scraper = ShopifyScraper(state)
+        edges = sample_graphql_response_last_page["data"]["products"]["edges"]
+        edges[0]["node"]["updatedAt"] = "2025-08-02T08:00:00Z"
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(sample_graphql_response_last_page).encode("utf-8"),
+        )
+        list(scraper.parse_shopify_products(response, sample_host))
+        assert state[sample_host]["updated_at"] == "2025-08-02T08:00:00Z"
+        assert state[sample_host]["product_count"] == 1
+        assert "full_sync_at" in state[sample_host]
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}]},
+            {
+                "data": {"products": {"edges": []}},
+                "errors": [{"message": "Internal error"}],
+            },
+        ],
+    )
+    def test_error_page_leaves_sync_state_untouched(self, mocker, sample_host, body):
+        host_state = {
+            "full_sync_at": "2025-08-01T08:00:00+00:00",
+            "updated_at": "2025-08-01T10:00:00Z",
+            "product_count": 12,
+        }
+        state = {sample_host: dict(host_state)}
+        scraper = ShopifyScraper(state, stats=mocker.Mock())
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(body).encode("utf-8"),
+        )
+        assert list(scraper.parse_shopify_products(response, sample_host)) == []
+        assert state[sample_host] == host_state
+        scraper.stats.inc_value.assert_called_once_with("shopify/listing_errors")
+
+    def test_two_phase_requests_details_for_predicted_beans_only(
+        self, sample_host, sample_graphql_response_last_page, mocker
+    ):
+        mocker.patch(
+            "scraper.lib.shopify.maybe_deferred_to_future", side_effect=lambda d: d
+        )
+        classifier = mocker.Mock()
+        classifier.predict_deferred.return_value = defer.succeed(["roasted-beans"])
+        scraper = ShopifyScraper(classifier=classifier)
+        start = next(scraper.start(sample_host))
+        assert "descriptionHtml" not in json.loads(start.body)["query"]
+        assert start.callback == scraper.parse_shopify_listing
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(sample_graphql_response_last_page).encode("utf-8"),
+        )
+        results = collect(scraper.parse_shopify_listing(response, sample_host))
+        assert len(results) == 1
+        payload = json.loads(results[0].body)
+        assert payload["variables"]["ids"] == ["gid://shopify/Product/111111111"]
+        assert results[0].callback == scraper.parse_shopify_product_details
+        classifier.predict.assert_not_called()
+
+        classifier.predict_deferred.return_value = defer.succeed(["merch"])
+        assert collect(scraper.parse_shopify_listing(response, sample_host)) == []
+
+    @pytest.mark.parametrize("failed", [False, True])
+    def test_two_phase_records_sync_after_last_details_batch(
+        self, sample_host, sample_graphql_response_last_page, mocker, failed
+    ):
+        mocker.patch(
+            "scraper.lib.shopify.maybe_deferred_to_future", side_effect=lambda d: d
+        )
+        classifier = mocker.Mock()
+        classifier.predict_deferred.return_value = defer.succeed(["roasted-beans"])
+        state = {}
+        scraper = ShopifyScraper(state, classifier=classifier)
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(sample_graphql_response_last_page).encode("utf-8"),
+        )
+        (details,) = collect(scraper.parse_shopify_listing(response, sample_host))
+        assert state == {}
+        if failed:
+            failure = mocker.Mock(request=details)
+            assert details.errback(failure) is None
+        else:
+            nodes = TextResponse(
+                url=details.url, body=b'{"data": {"nodes": []}}', request=details
+            )
+            list(details.callback(nodes, **details.cb_kwargs))
+        assert (sample_host in state) is not failed
+        assert scraper.details_pending == {}
+
+    def test_parse_shopify_product_details_extracts_products(
+        self, scraper, sample_host
+    ):
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            body=json.dumps(
+                {
+                    "data": {
+                        "nodes": [
+                            {
+                                "id": "gid://shopify/Product/1",
+                                "title": "Ethiopie Guji",
+                                "handle": "ethiopie-guji",
+                                "descriptionHtml": "<p>Lavé</p>",
+                                "productType": "Café",
+                            },
+                            None,
+                        ]
+                    }
+                }
+            ).encode("utf-8"),
+        )
+        products = list(scraper.parse_shopify_product_details(response, sample_host))
+        assert len(products) == 1
+        assert (
+            products[0]["product_url"]
+            == f"https://{sample_host}/products/ethiopie-guji"
+        )
+        assert products[0]["categories"] == ["Café"]
+
+    def test_storefront_unavailable_falls_back_to_products_json(
+        self, sample_host, mocker
+    ):
+        scraper = ShopifyScraper(products_json_fanout=3)
+        first_request = next(scraper.start(sample_host))
+        assert 404 in first_request.meta["handle_httpstatus_list"]
+        response = TextResponse(
+            url=f"https://{sample_host}/api/2025-07/graphql.json",
+            status=404,
+            body=b"",
+        )
+        requests = list(scraper.parse_shopify_products(response, sample_host))
+        assert [r.url for r in requests] == [
+            f"https://{sample_host}/products.json?limit=250&page={page}"
+            for page in (1, 2, 3)
+        ]
+
+    def test_parse_products_json_maps_items_and_schedules_next_window(
+        self, scraper, sample_host, mocker
+    ):
+        mocker.patch.object(ShopifyScraper, "products_json_limit", 1)
+        response = TextResponse(
+            url=f"https://{sample_host}/products.json?limit=1&page=2",
+            body=json.dumps(
+                {
+                    "products": [
+                        {
+                            "id": 42,
+                            "title": "Kenya Kiambu",
+                            "handle": "kenya-kiambu",
+                            "body_html": "<p>Lavé</p>",
+                            "product_type": "Café en grain",
+                            "tags": "filtre, kenya",
+                            "images": [{"src": "https://cdn/kenya.jpg"}],
+                            "options": [{"name": "Poids"}],
+                            "variants": [{"title": "250g"}],
+                        }
+                    ]
+                }
+            ).encode("utf-8"),
+        )
+        results = list(scraper.parse_products_json(response, sample_host, 2))
+        item, next_request = results
+        assert item["id"] == "gid://shopify/Product/42"
+        assert item["categories"] == ["Café en grain"]
+        assert item["tags"] == ["filtre", "kenya"]
+        assert item["image_url"] == "https://cdn/kenya.jpg"
+        assert next_request.cb_kwargs["page"] == 2 + scraper.products_json_fanout
+
 
 if __name__ == "__main__":
     pytest.main([__file__])
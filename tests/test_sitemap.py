@@ -0,0 +1,192 @@
+import gzip
+import re
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from scrapy.http import Request, TextResponse
+
+from scraper.lib.prestashop import CustomFrontier, PrestaShopFrontier
+from scraper.lib.sitemap import LastmodStore, SitemapFilter, iter_sitemap
+from scraper.spiders.products import ProductsSpider
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://shop.fr/cafes/12-ethiopie-guji.html</loc>
+    <lastmod>2025-08-01</lastmod>
+    <image:image><image:loc>https://shop.fr/12.jpg</image:loc></image:image>
+  </url>
+  <url><loc>https://shop.fr/3-cafes</loc></url>
+  <url><loc>https://shop.fr/content/4-a-propos</loc></url>
+</urlset>"""
+
+INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://shop.fr/1_fr_0_sitemap.xml</loc></sitemap>
+  <sitemap><loc>https://shop.fr/1_en_0_sitemap.xml</loc></sitemap>
+  <sitemap><loc>https://shop.fr/1_fr_1_sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+
+
+class TestIterSitemap:
+    def test_reads_urlset_entries(self):
+        entries = list(iter_sitemap(URLSET))
+        assert [e["loc"] for e in entries] == [
+            "https://shop.fr/cafes/12-ethiopie-guji.html",
+            "https://shop.fr/3-cafes",
+            "https://shop.fr/content/4-a-propos",
+        ]
+        assert entries[0] == {
+            "kind": "url",
+            "loc": "https://shop.fr/cafes/12-ethiopie-guji.html",
+            "lastmod": "2025-08-01",
+        }
+
+    def test_reads_gzipped_sitemap_index(self):
+        entries = list(iter_sitemap(gzip.compress(INDEX)))
+        assert len(entries) == 3
+        assert all(e["kind"] == "sitemap" for e in entries)
+
+    def test_decompression_stops_past_max_size(self):
+        body = gzip.compress(URLSET)
+        assert len(list(iter_sitemap(body, max_size=len(URLSET)))) == 3
+        assert list(iter_sitemap(body, max_size=64)) == []
+
+    def test_invalid_sitemap_yields_nothing(self):
+        assert list(iter_sitemap(b"<html>not a sitemap")) == []
+
+
+class TestSitemapFilter:
+    @pytest.fixture
+    def sitemap_filter(self):
+        sitemap_filter = SitemapFilter()
+        sitemap_filter.register("shop.fr", PrestaShopFrontier())
+        return sitemap_filter
+
+    def test_keeps_product_urls_only(self, sitemap_filter):
+        entries = list(sitemap_filter(iter_sitemap(URLSET)))
+        assert [e["loc"] for e in entries] == [
+            "https://shop.fr/cafes/12-ethiopie-guji.html"
+        ]
+
+    def test_keeps_non_secondary_urls_when_no_product_url_matches(self, sitemap_filter):
+        entries = [
+            {"kind": "url", "loc": "https://shop.fr/cafe/ethiopie-guji"},
+            {"kind": "url", "loc": "https://shop.fr/content/livraison"},
+        ]
+        assert list(sitemap_filter(iter(entries))) == entries[:1]
+
+    def test_unmatched_sitemap_is_capped_by_the_frontier(self):
+        sitemap_filter = SitemapFilter()
+        sitemap_filter.register("roaster.fr", CustomFrontier(max_pages=2))
+        entries = [
+            {"kind": "url", "loc": f"https://roaster.fr/page-{i}"} for i in range(5)
+        ]
+        assert list(sitemap_filter(iter(entries))) == entries[:2]
+
+    def test_follows_a_single_language(self, sitemap_filter):
+        entries = list(sitemap_filter(iter_sitemap(INDEX)))
+        assert [e["loc"] for e in entries] == [
+            "https://shop.fr/1_fr_0_sitemap.xml",
+            "https://shop.fr/1_fr_1_sitemap.xml",
+        ]
+
+    def test_prefers_french_sitemaps(self, sitemap_filter):
+        entries = [
+            {"kind": "sitemap", "loc": "https://shop.fr/1_en_0_sitemap.xml"},
+            {"kind": "sitemap", "loc": "https://shop.fr/1_fr_0_sitemap.xml"},
+            {"kind": "sitemap", "loc": "https://shop.fr/1_de_0_sitemap.xml"},
+        ]
+        assert list(sitemap_filter(iter(entries))) == entries[1:2]
+
+    def test_falls_back_to_the_first_language(self, sitemap_filter):
+        entries = [
+            {"kind": "sitemap", "loc": "https://shop.fr/1_en_0_sitemap.xml"},
+            {"kind": "sitemap", "loc": "https://shop.fr/1_de_0_sitemap.xml"},
+            {"kind": "sitemap", "loc": "https://shop.fr/1_en_1_sitemap.xml"},
+        ]
+        assert list(sitemap_filter(iter(entries))) == entries[::2]
+
+    def test_unregistered_hosts_are_not_filtered(self, sitemap_filter):
+        entries = [{"kind": "url", "loc": "https://other.fr/content/4-a-propos"}]
+        assert list(sitemap_filter(iter(entries))) == entries
+
+
+class TestSitemapFollow:
+    def test_follow_rules_match_the_path_only(self, mocker):
+        spider = mocker.Mock(
+            _follow=[re.compile(r) for r in ProductsSpider.sitemap_follow],
+            _max_size=0,
+        )
+        spider.sitemap_filter.side_effect = lambda entries: entries
+        index = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://brandcoffee.fr/product-sitemap.xml</loc></sitemap>
+  <sitemap><loc>https://brandcoffee.fr/post-sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+        url = "https://brandcoffee.fr/sitemap.xml"
+        response = TextResponse(url, body=index, request=Request(url))
+        requests = list(ProductsSpider._parse_sitemap(spider, response))
+        assert [r.url for r in requests] == [
+            "https://brandcoffee.fr/product-sitemap.xml"
+        ]
+
+
+class TestLastmodStore:
+    @pytest.fixture
+    def entry(self):
+        return {
+            "kind": "url",
+            "loc": "https://shop.fr/cafes/12-ethiopie-guji.html",
+            "lastmod": "2025-08-01",
+        }
+
+    def recent_state(self, days=1):
+        refreshed_at = datetime.now(UTC) - timedelta(days=days)
+        return {"shop.fr": {"full_refresh_at": refreshed_at.isoformat(), "urls": {}}}
+
+    def test_skips_entries_fetched_with_the_same_lastmod(self, entry):
+        store = LastmodStore(self.recent_state())
+        assert not store.unchanged(entry)
+        store.fetched(entry["loc"], entry["lastmod"])
+        assert store.unchanged(entry)
+        assert not store.unchanged({**entry, "lastmod": "2025-08-02"})
+        assert not store.unchanged({**entry, "lastmod": None})
+
+    def test_full_refresh_ignores_stored_lastmods(self, entry):
+        state = self.recent_state(days=8)
+        store = LastmodStore(state, full_refresh_days=7)
+        store.fetched(entry["loc"], entry["lastmod"])
+        assert not store.unchanged(entry)
+        assert LastmodStore(state, full_refresh_days=7).unchanged(entry)
+
+    def test_full_refresh_prunes_urls_no_longer_listed(self, entry):
+        state = self.recent_state(days=8)
+        store = LastmodStore(state, full_refresh_days=7)
+        store.fetched("https://shop.fr/cafes/11-ancien-cafe.html", "2025-07-01")
+        store.fetched("https://other.fr/produits/guji", "2025-07-01")
+        assert not store.unchanged(entry)
+        store.fetched(entry["loc"], entry["lastmod"])
+        assert store.prune() == 1
+        assert list(state["shop.fr"]["urls"]) == [store.key(entry["loc"])]
+        assert len(state["other.fr"]["urls"]) == 1
+
+    def test_no_pruning_without_full_refresh(self, entry):
+        state = self.recent_state()
+        store = LastmodStore(state)
+        store.fetched("https://shop.fr/cafes/11-ancien-cafe.html", "2025-07-01")
+        assert not store.unchanged(entry)
+        assert store.prune() == 0
+        assert len(state["shop.fr"]["urls"]) == 1
+
+    def test_first_session_fetches_everything(self, entry):
+        state = {}
+        store = LastmodStore(state)
+        store.fetched(entry["loc"], entry["lastmod"])
+        assert not store.unchanged(entry)
+        assert "full_refresh_at" in state["shop.fr"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,77 @@
+import pytest
+from scrapy.http import HtmlResponse
+
+from scraper.lib.prestashop import PrestaShopScraper
+from scraper.lib.structured_data import extract_structured_data, structured_item
+
+JSON_LD_PAGE = """<html><head>
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@graph": [
+  {"@type": "BreadcrumbList", "itemListElement": [
+    {"@type": "ListItem", "position": 1, "item": {"name": "Cafés"}},
+    {"@type": "ListItem", "position": 2, "name": "Éthiopie"}
+  ]},
+  {"@type": ["Product"], "name": "Éthiopie Guji", "sku": "GUJI",
+   "image": [{"url": "/img/guji.jpg"}],
+   "offers": [{"@type": "Offer", "name": "250g"}, {"@type": "Offer", "name": "1kg"}]}
+]}
+</script></head><body><h1>Éthiopie Guji</h1><style>h1{}</style></body></html>"""
+
+MICRODATA_PAGE = """<html><body>
+<ol itemscope itemtype="https://schema.org/BreadcrumbList">
+  <li itemprop="itemListElement" itemscope itemtype="https://schema.org/ListItem">
+    <a itemprop="item" href="/cafes"><span itemprop="name">Cafés</span></a>
+  </li>
+</ol>
+<div itemscope itemtype="http://schema.org/Product">
+  <h1 itemprop="name">Kenya AA</h1>
+  <img itemprop="image" src="/kenya.jpg">
+  <div itemprop="offers" itemscope itemtype="http://schema.org/Offer">
+    <span itemprop="name">Grains</span>
+  </div>
+</div>
+</body></html>"""
+
+
+def html_response(body, url="https://roaster.fr/produit/guji"):
+    return HtmlResponse(url=url, body=body, encoding="utf-8")
+
+
+class TestStructuredData:
+    def test_reads_json_ld_graph(self):
+        item = structured_item(html_response(JSON_LD_PAGE))
+        assert item["id"] == "custom:roaster.fr:GUJI"
+        assert item["backend"] == "custom"
+        assert item["title"] == "Éthiopie Guji"
+        assert item["image_url"] == "https://roaster.fr/img/guji.jpg"
+        assert item["categories"] == ["Cafés", "Éthiopie"]
+        assert item["variants"] == ["250g", "1kg"]
+
+    def test_reads_microdata(self):
+        data = extract_structured_data(MICRODATA_PAGE.encode("utf-8"))
+        assert data["product"]["name"] == "Kenya AA"
+        assert data["product"]["image"] == "/kenya.jpg"
+        assert data["breadcrumbs"] == ["Cafés"]
+
+    def test_falls_back_to_opengraph(self):
+        page = """<html><head>
+        <meta property="og:type" content="product">
+        <meta property="og:title" content="Colombie Huila">
+        <meta property="og:image" content="https://roaster.fr/huila.jpg">
+        </head><body></body></html>"""
+        item = structured_item(html_response(page, "https://roaster.fr/p/huila"))
+        assert item["title"] == "Colombie Huila"
+        assert item["id"] == "custom:roaster.fr:/p/huila"
+
+    def test_pages_without_product_yield_nothing(self):
+        page = '<html><head><meta property="og:type" content="website"></head></html>'
+        assert structured_item(html_response(page)) is None
+        assert extract_structured_data(b"") is None
+
+    def test_prestashop_parser_falls_back_to_structured_data(self):
+        (item,) = PrestaShopScraper(None).parse_product(html_response(JSON_LD_PAGE))
+        assert item["backend"] == "custom"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,63 @@
+import pytest
+from bs4 import BeautifulSoup
+from scrapy.http import HtmlResponse
+
+from scraper.lib.utils import LazyContent, b64, shrink_element, shrink_html
+
+
+def reference_shrink_html(html):
+    """Implémentation BeautifulSoup d'origine"""
+    if not html:
+        return ""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup.find_all(["style", "svg"]):
+        tag.extract()
+    return str(soup)
+
+
+FRAGMENTS = [
+    "",
+    "Éthiopie & Kenya",
+    "<!DOCTYPE html><p>a</p><!---->",
+    (
+        '<body>a<br>b<img src=\'x.jpg\' alt="it\'s "q"">  <style>p{}</style>  '
+        "<svg><path/></svg>\n\n<p class='  b   a '>x &lt; y &amp; z</p></body>"
+    ),
+    (
+        "<meta charset='iso-8859-1'>"
+        "<meta http-equiv='Content-Type' content='text/html; charset=ISO-8859-1'>"
+    ),
+    "<pre>  \n </pre><textarea> </textarea><script>if (a < b && c) {}</script>",
+    "<div><p>unclosed<div>nested</p></div><input disabled><table><tr><td>1</table>",
+    "<a rel='nofollow  noopener' href='/x?a=1&b=2'>l</a>&eacute;&nbsp;  <!-- c -->",
+]
+
+
+class TestShrinkHtml:
+    @pytest.mark.parametrize("html", FRAGMENTS)
+    def test_matches_beautifulsoup_output(self, html):
+        assert shrink_html(html) == reference_shrink_html(html)
+
+    def test_drops_style_and_svg_subtrees(self):
+        html = "<p>a<style>p{}</style><svg><text>t</text></svg>b</p>"
+        assert shrink_html(html) == "<html><body><p>ab</p></body></html>"
+
+    @pytest.mark.parametrize("html", [FRAGMENTS[1], FRAGMENTS[3], FRAGMENTS[7]])
+    def test_shrink_element_matches_reserialized_body(self, html):
+        response = HtmlResponse(url="https://shop.fr/", body=html, encoding="utf-8")
+        (body,) = response.css("body")
+        assert shrink_element(body.root) == shrink_html(body.get())
+
+
+class TestLazyContent:
+    def test_resolves_html_and_elements_like_eager_shrink(self):
+        html = "<p>Pêche<style>p{}</style></p>"
+        response = HtmlResponse(url="https://shop.fr/", body=html, encoding="utf-8")
+        body = response.css("body")[0].root
+        assert LazyContent(html).resolve() == b64(shrink_html(html))
+        assert LazyContent(element=body).resolve() == b64(shrink_element(body))
+        assert LazyContent(None).resolve() == b64("")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
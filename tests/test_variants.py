@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from classifier.variants import best_variant, emit
+
+
+def variant(kind, length, size_kb, accuracy, **kwargs):
+    return {
+        "kind": kind,
+        "length": length,
+        "prune": 0.0,
+        "quantize": False,
+        "size_kb": size_kb,
+        "load_ms": 100,
+        "batch_ms": 1.0,
+        "accuracy": accuracy,
+        **kwargs,
+    }
+
+
+class TestVariants:
+    def test_best_variant_is_the_smallest_within_the_accuracy_drop(self):
+        results = [
+            variant("spacy", 262144, 8000, 0.95),
+            variant("bow", 262144, 900, 0.95),
+            variant("bow", 16384, 300, 0.945, quantize=True),
+            variant("bow", 4096, 100, 0.92),
+        ]
+        assert best_variant(results, 0.01) is results[2]
+        assert best_variant(results, 0.05) is results[3]
+        assert best_variant(results, 0.0) is results[1]
+
+    def test_emitted_bow_variant_records_its_compression(self, tmp_path):
+        model = tmp_path / "model-best"
+        model.mkdir()
+        (model / "meta.json").write_text(json.dumps({"version": "0.0.0"}))
+        path = tmp_path / "bow-int8"
+        path.mkdir()
+        (path / "rows.npy").write_bytes(b"")
+        chosen = variant(
+            "bow", 16384, 300, 0.95, quantize=True, path=str(path), model=str(model)
+        )
+        emit(chosen, tmp_path / "compact")
+        assert (tmp_path / "compact" / "bow" / "rows.npy").exists()
+        meta = json.loads((tmp_path / "compact" / "meta.json").read_text())
+        assert meta["compression"] == {
+            "kind": "bow",
+            "length": 16384,
+            "prune": 0.0,
+            "quantize": True,
+        }
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,300 @@
+import json
+from base64 import b64decode
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from scrapy.http import Request, TextResponse
+
+from scraper.lib.woocommerce import WoocommerceScraper
+from scraper.lib.woocommerce_model import product_page, store_product_page
+
+
+class TestWoocommerceScraper:
+    @pytest.fixture
+    def sample_host(self):
+        return "example-roaster.fr"
+
+    @pytest.fixture
+    def scraper(self, sample_host):
+        return WoocommerceScraper(sample_host)
+
+    def page_response(self, request, data, total=None):
+        return TextResponse(
+            url=request.url,
+            request=request,
+            headers={"X-WP-Total": str(total)} if total is not None else {},
+            body=json.dumps(data).encode("utf-8"),
+        )
+
+    def product_response(self, request):
+        return TextResponse(
+            url=request.url,
+            request=request,
+            body=b'<html><body><select id="pa_mouture"></select></body></html>',
+        )
+
+    def run_callback(self, request, response):
+        return list(request.callback(response, **request.cb_kwargs))
+
+    def test_paginate_type_requests_remaining_pages_at_once(self, scraper, mocker):
+        item_cb = mocker.Mock(return_value=None)
+        finished_cb = mocker.Mock(return_value=iter(["finished"]))
+        base_url = f"https://{scraper.host}/wp-json/wp/v2/product_cat"
+        (first,) = scraper.paginate_type(None, base_url, item_cb, finished_cb)
+        results = self.run_callback(first, self.page_response(first, [{}] * 100, 250))
+        requests = [r for r in results if isinstance(r, Request)]
+        assert [r.cb_kwargs["offset"] for r in requests] == [100, 200]
+        assert not any(r.cb_kwargs["follow"] for r in requests)
+        assert (
+            self.run_callback(
+                requests[0], self.page_response(requests[0], [{}] * 100, 250)
+            )
+            == [None] * 100
+        )
+        results = self.run_callback(
+            requests[1], self.page_response(requests[1], [{}] * 50, 250)
+        )
+        assert results[-1] == "finished"
+        assert item_cb.call_count == 250
+
+    def test_paginate_type_is_sequential_without_total_header(self, scraper, mocker):
+        base_url = f"https://{scraper.host}/wp-json/wp/v2/product_tag"
+        (first,) = scraper.paginate_type(
+            None, base_url, mocker.Mock(), mocker.Mock(return_value=iter([]))
+        )
+        results = self.run_callback(first, self.page_response(first, [{}] * 100))
+        (next_request,) = [r for r in results if isinstance(r, Request)]
+        assert next_request.cb_kwargs["offset"] == 100
+        assert next_request.cb_kwargs["follow"]
+
+    def test_empty_page_is_split_without_losing_records(self, scraper, mocker):
+        base_url = f"https://{scraper.host}/wp-json/wp/v2/product"
+        (first,) = scraper.paginate_type(None, base_url, mocker.Mock(), None)
+        first = first.replace(url=first.url.replace("per_page=100", "per_page=25"))
+        first.cb_kwargs["per_page"] = 25
+        response = TextResponse(url=first.url, request=first, body=b"")
+        halves = self.run_callback(first, response)
+        assert [(r.cb_kwargs["offset"], r.cb_kwargs["per_page"]) for r in halves] == [
+            (0, 12),
+            (12, 13),
+        ]
+
+    @pytest.fixture
+    def sample_rest_product(self, sample_host):
+        links = {"self": [], "collection": [], "about": [], "curies": []}
+        rendered = {"rendered": ""}
+        return {
+            "id": 12,
+            "date": "2025-08-01T10:00:00",
+            "date_gmt": "2025-08-01T08:00:00",
+            "guid": {"rendered": f"https://{sample_host}/?post_type=product&#038;p=12"},
+            "modified": "2025-08-01T10:00:00",
+            "modified_gmt": "2025-08-01T08:00:00",
+            "slug": "ethiopie-guji",
+            "status": "publish",
+            "type": "product",
+            "link": f"https://{sample_host}/produit/ethiopie-guji/",
+            "title": {"rendered": "Éthiopie Guji"},
+            "content": rendered,
+            "excerpt": rendered,
+            "featured_media": 7,
+            "product_cat": [1],
+            "product_tag": [],
+            "_links": links,
+        }
+
+    def test_medias_are_resolved_after_listing_with_include(
+        self, scraper, sample_rest_product
+    ):
+        lookups = list(scraper.start_rest())
+        assert len(lookups) == 3
+        results = []
+        for request in lookups:
+            data = []
+            if "/product?" in request.url:
+                data = [sample_rest_product]
+            elif "/product_cat?" in request.url:
+                data = [{"id": 1, "name": "Café en grain"}]
+            results = self.run_callback(request, self.page_response(request, data, 1))
+        (medias,) = [r for r in results if isinstance(r, Request)]
+        assert "/wp-json/wp/v2/media?include=7&_fields=id,guid" in medias.url
+        response = self.page_response(
+            medias,
+            [{"id": 7, "guid": {"rendered": f"https://{scraper.host}/guji.jpg"}}],
+        )
+        (product_page,) = self.run_callback(medias, response)
+        assert product_page.url == sample_rest_product["link"]
+        assert (
+            product_page.cb_kwargs["product"]["image_url"]
+            == f"https://{scraper.host}/guji.jpg"
+        )
+
+    def test_start_uses_store_api_and_maps_products(self, scraper):
+        (request,) = scraper.start()
+        assert "/wp-json/wc/store/v1/products?_fields=" in request.url
+        assert "&offset=0&per_page=100" in request.url
+        product = {
+            "id": 12,
+            "name": "Éthiopie Guji",
+            "permalink": f"https://{scraper.host}/produit/ethiopie-guji/",
+            "short_description": "<p>Lavé, 250g</p>",
+            "description": "<p>Notes de pêche</p><style>p{}</style>",
+            "images": [{"id": 3, "src": f"https://{scraper.host}/guji.jpg"}],
+            "categories": [{"id": 1, "name": "Café en grain"}],
+            "tags": [{"id": 2, "name": "Filtre"}],
+            "attributes": [
+                {"id": 5, "name": "Poids", "taxonomy": "pa_poids"},
+                {"id": 0, "name": "Mouture", "taxonomy": None},
+            ],
+            "variations": [
+                {"id": 13, "attributes": [{"name": "Poids", "value": "250g"}]}
+            ],
+        }
+        (item,) = self.run_callback(request, self.page_response(request, [product], 1))
+        assert item["id"] == f"https://{scraper.host}/?post_type=product&#038;p=12"
+        assert item["categories"] == ["Café en grain"]
+        assert item["tags"] == ["Filtre"]
+        assert item["options"] == ["poids"]
+        assert item["variants"] == ["250g"]
+        assert item["image_url"] == f"https://{scraper.host}/guji.jpg"
+        content = item["content"].resolve()
+        assert "short_description" in request.url
+        html = b64decode(content).decode("utf-8")
+        assert "Lavé, 250g" in html and "Notes de pêche" in html
+
+    def test_store_ids_match_legacy_rest_ids(self, scraper, sample_rest_product):
+        rest_item = scraper.parse_product(
+            product_page.validate_python([sample_rest_product])[0]
+        ).cb_kwargs["product"]
+        store_item = scraper.parse_store_product(
+            store_product_page.validate_python(
+                [{"id": 12, "name": "Guji", "permalink": rest_item["product_url"]}]
+            )[0]
+        )
+        assert store_item["id"] == rest_item["id"]
+
+    @pytest.mark.parametrize("status", [404, 503])
+    def test_start_falls_back_to_rest_api_when_store_api_is_missing(
+        self, scraper, status
+    ):
+        (request,) = scraper.start()
+        assert request.meta["handle_httpstatus_all"]
+        response = TextResponse(
+            url=request.url, request=request, status=status, body=b"not found"
+        )
+        requests = self.run_callback(request, response)
+        assert len(requests) == 3
+        assert all("/wp-json/wp/v2/" in r.url for r in requests)
+
+    def test_start_falls_back_to_rest_api_on_network_error(self, scraper, mocker):
+        (request,) = scraper.start()
+        failure = mocker.Mock(request=request, value=TimeoutError())
+        requests = list(request.errback(failure))
+        assert len(requests) == 3
+        assert all("/wp-json/wp/v2/" in r.url for r in requests)
+
+    def test_full_sync_records_watermark_and_terms(
+        self, sample_host, sample_rest_product
+    ):
+        state = {}
+        scraper = WoocommerceScraper(sample_host, state=state)
+        for request in scraper.start_rest():
+            data = [sample_rest_product] if "/product?" in request.url else []
+            results = self.run_callback(request, self.page_response(request, data, 1))
+        requests = [r for r in results if isinstance(r, Request)]
+        assert any("/product_cat?include=1&" in r.url for r in requests)
+        for request in requests:
+            data = [{"id": 1, "name": "Café en grain"}]
+            if "/media?" in request.url:
+                data = [{"id": 7, "guid": {"rendered": f"https://{sample_host}/a.jpg"}}]
+            results = self.run_callback(request, self.page_response(request, data))
+        host_state = state[sample_host]
+        assert host_state["categories"] == {"1": "Café en grain"}
+        # le high-water mark attend le chargement des pages produit
+        assert "modified_gmt" not in host_state
+        (page,) = results
+        self.run_callback(page, self.product_response(page))
+        assert host_state["modified_gmt"] == "2025-08-01T08:00:00"
+        assert "full_sync_at" in host_state
+
+    def test_incremental_sync_lists_modified_products_only(
+        self, sample_host, sample_rest_product, mocker
+    ):
+        state = {
+            sample_host: {
+                "full_sync_at": datetime.now(UTC).isoformat(),
+                "modified_gmt": "2025-08-01T08:00:00",
+                "categories": {"1": "Café en grain"},
+                "tags": {},
+            }
+        }
+        stats = mocker.Mock()
+        scraper = WoocommerceScraper(sample_host, stats, state)
+        (listing,) = scraper.start_rest()
+        assert "/wp/v2/product?modified_after=2025-07-31T08:00:00&" in listing.url
+        product = {**sample_rest_product, "modified_gmt": "2025-08-03T08:00:00"}
+        product["product_tag"] = [4]
+        results = self.run_callback(listing, self.page_response(listing, [product], 1))
+        requests = [r for r in results if isinstance(r, Request)]
+        assert sorted(r.url.split("?")[0].rsplit("/", 1)[-1] for r in requests) == [
+            "media",
+            "product_tag",
+        ]
+        for request in requests:
+            data = [{"id": 4, "name": "Filtre"}]
+            if "/media?" in request.url:
+                data = [{"id": 7, "guid": {"rendered": f"https://{sample_host}/a.jpg"}}]
+            results = self.run_callback(request, self.page_response(request, data))
+        (product_page,) = results
+        assert product_page.cb_kwargs["product"]["categories"] == ["Café en grain"]
+        assert product_page.cb_kwargs["product"]["tags"] == ["Filtre"]
+        assert state[sample_host]["tags"] == {"4": "Filtre"}
+        assert state[sample_host]["modified_gmt"] == "2025-08-01T08:00:00"
+        self.run_callback(product_page, self.product_response(product_page))
+        assert state[sample_host]["modified_gmt"] == "2025-08-03T08:00:00"
+        stats.inc_value.assert_called_once_with("woocommerce/products_modified", 1)
+
+    def test_failed_product_page_leaves_watermark_untouched(
+        self, sample_host, sample_rest_product, mocker
+    ):
+        state = {sample_host: {"modified_gmt": "2025-08-01T08:00:00"}}
+        scraper = WoocommerceScraper(sample_host, state=state)
+        scraper.products = [
+            product_page.validate_json(json.dumps([sample_rest_product]))[0]
+            for _ in range(2)
+        ]
+        first, second = scraper.start_products()
+        self.run_callback(first, self.product_response(first))
+        assert first.errback(mocker.Mock(request=second)) is None
+        assert state[sample_host]["modified_gmt"] == "2025-08-01T08:00:00"
+        assert "full_sync_at" not in state[sample_host]
+
+    def test_stale_full_sync_triggers_full_listing(self, sample_host):
+        full_sync_at = datetime.now(UTC) - timedelta(days=8)
+        state = {
+            sample_host: {
+                "full_sync_at": full_sync_at.isoformat(),
+                "modified_gmt": "2025-08-01T08:00:00",
+                "categories": {},
+                "tags": {},
+            }
+        }
+        scraper = WoocommerceScraper(sample_host, state=state, full_sync_days=7)
+        assert len(list(scraper.start_rest())) == 3
+
+    def test_lookup_maps_are_per_host_and_released(self, sample_host, mocker):
+        stats = mocker.Mock()
+        scraper = WoocommerceScraper(sample_host, stats)
+        other = WoocommerceScraper("other-roaster.fr")
+        scraper.categories_map[1] = "Café en grain"
+        assert other.categories_map == {}
+        assert list(scraper.start_products()) == []
+        assert scraper.categories_map == {}
+        stats.max_value.assert_called_once()
+        key, size = stats.max_value.call_args.args
+        assert key == f"woocommerce/lookup_peak_bytes/{sample_host}"
+        assert size > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
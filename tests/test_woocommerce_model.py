@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from benchmarks.woocommerce_decode import per_record, synthetic_page, whole_page
+from scraper.lib.woocommerce_model import (
+    media_page,
+    product_page,
+    store_product_page,
+    term_page,
+)
+
+
+class TestPageDecoders:
+    def test_product_page_keeps_the_fields_read_by_the_scraper(self):
+        (product,) = product_page.validate_json(synthetic_page(1))
+        assert product.id == 0
+        assert product.guid.rendered.endswith("/?post_type=product&#038;p=0")
+        assert product.title.rendered == "Café 0"
+        assert product.modified_gmt == "2025-08-01T08:00:00"
+        assert product.product_cat == [1, 2]
+        assert product.product_tag == [3]
+        (media,) = product.links.wp_featuredmedia
+        assert media.href.endswith("/wp-json/wp/v2/media/1000")
+
+    def test_product_page_defaults_optional_fields(self):
+        record = {
+            "id": 12,
+            "guid": {"rendered": "https://shop.fr/?p=12"},
+            "modified_gmt": "2025-08-01T08:00:00",
+            "link": "https://shop.fr/produit/guji/",
+            "title": {"rendered": "Guji"},
+        }
+        (product,) = product_page.validate_json(json.dumps([record]))
+        assert product.featured_media is None
+        assert product.product_cat == []
+        assert product.links.wp_featuredmedia is None
+
+    def test_term_and_media_pages(self):
+        terms = [{"id": 1, "name": "Cafés", "slug": "cafes", "count": 4}]
+        assert [t.name for t in term_page.validate_json(json.dumps(terms))] == ["Cafés"]
+        media = [{"id": 1000, "guid": {"rendered": "https://shop.fr/guji.jpg"}}]
+        (image,) = media_page.validate_json(json.dumps(media))
+        assert image.guid.rendered == "https://shop.fr/guji.jpg"
+
+    def test_store_product_page_defaults(self):
+        record = {"id": 7, "name": "Guji", "permalink": "https://shop.fr/guji/"}
+        (product,) = store_product_page.validate_json(json.dumps([record]))
+        assert product.short_description == ""
+        assert product.images == []
+        assert product.variations == []
+
+    def test_invalid_record_fails_the_page(self):
+        with pytest.raises(ValidationError):
+            term_page.validate_json(json.dumps([{"name": "Cafés"}]))
+
+    def test_benchmark_decoders_agree(self):
+        body = synthetic_page(3)
+        full, summary = per_record(body), whole_page(body)
+        assert [p.links.self_[0].href for p in full] == [
+            f"https://example-roaster.fr/wp-json/wp/v2/product/{i}" for i in range(3)
+        ]
+        for product, fast in zip(full, summary, strict=True):
+            assert (product.id, product.guid, product.modified_gmt) == (
+                fast.id,
+                fast.guid,
+                fast.modified_gmt,
+            )
+            assert product.links.wp_featuredmedia == fast.links.wp_featuredmedia
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])